@@ -10,21 +10,49 @@ import os
 import json
 import time
 import math
+import re
 import random
 import requests
 import asyncio
 import aiohttp
+from aiohttp import web
 import traceback
 import threading
+import weakref
+import hashlib
+import sqlite3
+import sys
+import contextlib
+import contextvars
+from bisect import bisect_left
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional, Any, AsyncGenerator
+from urllib.parse import urlparse
+from typing import Dict, List, Tuple, Optional, Any, AsyncGenerator, Set
 from flask import Flask, request, jsonify
 import logging
 from dataclasses import dataclass, asdict
 from enum import Enum
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+    from skyfield.api import load, wgs84, EarthSatellite
+    from skyfield.framelib import itrs
+    SKYFIELD_AVAILABLE = True
+except ImportError:
+    SKYFIELD_AVAILABLE = False
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
 
 # ====================== KONFIGURACJA ======================
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 print("=" * 80)
 print("🤖 AI-POWERED EARTH OBSERVATORY v8.0")
 print("🚀 DeepSeek AI jako centralny mózg systemu")
@@ -42,6 +70,124 @@ RENDER_URL = os.getenv("RENDER_URL", "https://your-app.onrender.com")
 PORT = int(os.getenv("PORT", 10000))
 BOT_USERNAME = "PcSentinel_Bot"  # 🔴 PRAWIDŁOWA NAZWA BOTA
 
+# TRYB PRZYJMOWANIA AKTUALIZACJI
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+BOT_MODE = os.getenv("BOT_MODE", "aiohttp")  # "aiohttp" (async webhook), "webhook" (Flask) lub "polling" (getUpdates)
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", 30))  # long polling - sekundy czekania na aktualizacje
+POLLING_LIMIT = int(os.getenv("POLLING_LIMIT", 100))  # aktualizacje na jedno wywołanie (max 100)
+
+# PULA POŁĄCZEŃ HTTP
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 10))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+
+# CACHE DANYCH
+CACHE_STALE_FACTOR = float(os.getenv("CACHE_STALE_FACTOR", 1.0))
+COLLECTOR_CACHE_MAX_ENTRIES = int(os.getenv("COLLECTOR_CACHE_MAX_ENTRIES", 2000))
+COLLECTOR_CACHE_MAX_BYTES = int(os.getenv("COLLECTOR_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+LOCATION_REPORTS_MAX_ENTRIES = int(os.getenv("LOCATION_REPORTS_MAX_ENTRIES", 200))
+LOCATION_REPORTS_MAX_BYTES = int(os.getenv("LOCATION_REPORTS_MAX_BYTES", 8 * 1024 * 1024))
+
+# WSPÓŁDZIELONY CACHE DANYCH (między workerami)
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "sqlite")  # sqlite | redis | memory (tylko cache procesu)
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "collector_cache.db")
+SHARED_CACHE_LOCK_TTL = float(os.getenv("SHARED_CACHE_LOCK_TTL", 30))  # maks. czas blokady odświeżania
+SHARED_CACHE_POLL_INTERVAL = float(os.getenv("SHARED_CACHE_POLL_INTERVAL", 0.05))
+
+# CIRCUIT BREAKERY (ZEWNĘTRZNE API, PER HOST)
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", 20))  # ostatnie wywołania brane pod uwagę
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", 5))  # minimum wywołań przed otwarciem
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5))  # odsetek błędów otwierający obwód
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", 30))  # czas do próby (half-open)
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", 300))  # kolejne nieudane próby podwajają czas
+
+# ADAPTACYJNE TIMEOUTY I HEDGING (ZEWNĘTRZNE API)
+ADAPTIVE_TIMEOUT_FACTOR = float(os.getenv("ADAPTIVE_TIMEOUT_FACTOR", 3.0))  # timeout = p99 × współczynnik
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", 2.0))  # dolna granica (sekundy)
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = int(os.getenv("ADAPTIVE_TIMEOUT_MIN_SAMPLES", 20))  # wcześniej - stałe limity
+ADAPTIVE_TIMEOUT_WINDOW = int(os.getenv("ADAPTIVE_TIMEOUT_WINDOW", 200))  # ostatnie pomiary per źródło
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0") == "1"  # druga próba po przekroczeniu p95
+COLLECT_DEADLINE = float(os.getenv("COLLECT_DEADLINE", 8.0))  # budżet collect_all_data (0 = bez limitu)
+
+# PRZELOTY SATELITÓW (N2YO)
+N2YO_CONCURRENCY = int(os.getenv("N2YO_CONCURRENCY", 3))
+N2YO_LOCATION_PRECISION = int(os.getenv("N2YO_LOCATION_PRECISION", 1))  # miejsca po przecinku
+
+# LOKALNE PRZELOTY (SGP4 / TLE)
+TLE_FILE = os.getenv("TLE_FILE", "tle.txt")
+TLE_SOURCE_URL = os.getenv("TLE_SOURCE_URL", "https://celestrak.org/NORAD/elements/gp.php")
+TLE_MAX_AGE_HOURS = float(os.getenv("TLE_MAX_AGE_HOURS", 24))
+TLE_RETRY_MINUTES = float(os.getenv("TLE_RETRY_MINUTES", 60))
+PASS_MIN_ELEVATION = float(os.getenv("PASS_MIN_ELEVATION", 10))  # stopnie
+PASS_STEP_SECONDS = int(os.getenv("PASS_STEP_SECONDS", 30))
+PASS_HORIZON_HOURS = float(os.getenv("PASS_HORIZON_HOURS", 48))
+
+# CACHE ODPOWIEDZI LLM
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 1800))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "")  # pusty = tylko pamięć
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+
+# BUDŻET PROMPTÓW
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", 3.5))  # szacunek dla PL + JSON
+PROMPT_BUDGET_SCALE = float(os.getenv("PROMPT_BUDGET_SCALE", 1.0))  # mnożnik budżetów szablonów
+
+# STREAMING ODPOWIEDZI AI
+DEEPSEEK_STREAMING = os.getenv("DEEPSEEK_STREAMING", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))  # sekundy między edycjami
+STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", 40))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# KOLEJKA WYSYŁKI DO TELEGRAMA (limity Bot API)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))  # wiadomości/s łącznie
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))  # wiadomości/s na czat
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", 3))  # krótka seria w jednym czacie
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", 20 / 60))  # grupy: 20/min
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", 3))  # ponowienia po 429
+TELEGRAM_SEND_QUEUE_LIMIT = int(os.getenv("TELEGRAM_SEND_QUEUE_LIMIT", 10000))
+
+# STAN UŻYTKOWNIKÓW (TRWAŁY)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")  # sqlite | redis | memory
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", 1.0))  # zapis w tle co tyle sekund
+STATE_BATCH_WINDOW = float(os.getenv("STATE_BATCH_WINDOW", 0.005))  # okno łączenia odczytów
+STATE_WORKING_SET = int(os.getenv("STATE_WORKING_SET", 10000))  # czaty trzymane w pamięci
+
+# DISPATCHER WEBHOOKÓW
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", 100))
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", 8))
+DISPATCH_RETRY_AFTER = int(os.getenv("DISPATCH_RETRY_AFTER", 5))
+
+# KOLEJKA KOMEND CZATU (po kolei, bez powtórzeń)
+CHAT_MAILBOX_LIMIT = int(os.getenv("CHAT_MAILBOX_LIMIT", 4))  # oczekujące komendy jednego czatu
+CHAT_MAILBOX_TOTAL_LIMIT = int(os.getenv("CHAT_MAILBOX_TOTAL_LIMIT", 200))  # oczekujące komendy wszystkich czatów
+# Komendy, w których nowsza (z innymi argumentami) zastępuje starszą - pytania /ai są niezależne
+CHAT_SUPERSEDE_COMMANDS = [c.strip() for c in os.getenv("CHAT_SUPERSEDE_COMMANDS", "start,report,briefing,analyze,where,weather").split(",") if c.strip()]
+
+# DEDUPLIKACJA AKTUALIZACJI (ponowienia webhooka)
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", 10000))  # ostatnie update_id w pamięci
+UPDATE_DEDUP_TTL = float(os.getenv("UPDATE_DEDUP_TTL", 24 * 3600))  # Telegram trzyma aktualizacje do 24 h
+UPDATE_DEDUP_SHARED = os.getenv("UPDATE_DEDUP_SHARED", "1") == "1"  # sprawdzaj też we wspólnym cache L2
+
+# PREWARM (DANE I RAPORTY Z WYPRZEDZENIEM)
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", 2))  # równoległe zadania w tle
+PREWARM_SOURCES = [s.strip() for s in os.getenv("PREWARM_SOURCES", "earthquakes,asteroids,apod,space_weather").split(",") if s.strip()]
+PREWARM_TICK_SECONDS = float(os.getenv("PREWARM_TICK_SECONDS", 15))
+PREWARM_LEAD_SECONDS = float(os.getenv("PREWARM_LEAD_SECONDS", 30))  # odświeżenie tyle przed wygaśnięciem
+PREWARM_PEAK_HOURS = [int(h) for h in os.getenv("PREWARM_PEAK_HOURS", "7,19").split(",") if h.strip()]  # czas lokalny
+PREWARM_PEAK_LEAD_MINUTES = int(os.getenv("PREWARM_PEAK_LEAD_MINUTES", 30))
+BRIEFING_CACHE_TTL = float(os.getenv("BRIEFING_CACHE_TTL", 6 * 3600))
+BRIEFING_STALE_TTL = float(os.getenv("BRIEFING_STALE_TTL", 300))  # briefing z nieaktualnych danych - krótko
+
+# METRYKI (PROMETHEUS /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "1") == "1"  # podsumowanie spanów komendy w logu
+METRICS_BUCKETS = [float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",") if b.strip()]
+
 # ====================== ENUMS & DATA CLASSES ======================
 
 class ObservationType(Enum):
@@ -92,39 +238,1445 @@ class AIAnalysis:
     best_time_window: Dict[str, Any]
     data_sources: List[str]
 
+# ====================== METRYKI (PROMETHEUS) ======================
+
+# Spany bieżącej komendy (lista ustawiana w zadaniu komendy, zadania potomne ją dziedziczą)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+def _escape_label(value: Any) -> str:
+    """Wartość etykiety w formacie tekstowym Prometheusa (\\, " i nowa linia poprzedzone \\)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class _Span:
+    """Pomiar czasu jednego odcinka - trafia do histogramu i śladu bieżącej komendy"""
+    
+    __slots__ = ("histogram", "labels", "started")
+    
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Histogram:
+    """Histogram czasów (sekundy) z etykietami - format Prometheusa, kubełki skumulowane przy eksporcie"""
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: List[float] = METRICS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = sorted(buckets)
+        
+        # wartości etykiet -> [liczniki kubełków (ostatni = +Inf)..., suma]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        # Webhook Flaska obserwuje z wątków gunicorna, reszta z pętli asyncio
+        self._lock = threading.Lock()
+    
+    def time(self, *label_values: str) -> _Span:
+        """with histogram.time("etykieta"): ... - mierzy czas bloku"""
+        return _Span(self, label_values)
+    
+    def observe(self, seconds: float, *label_values: str):
+        if not METRICS_ENABLED:
+            return
+        
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+        
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((self.name, label_values, seconds))
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        
+        for label_values, series in sorted(snapshot.items()):
+            base = [f'{name}="{_escape_label(value)}"' for name, value in zip(self.labels, label_values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], series[:-1]):
+                cumulative += count
+                bucket_labels = ",".join(base + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f'{{{",".join(base)}}}' if base else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Histogramy czasów gorącej ścieżki + eksport istniejących liczników (get_stats) jako gauge"""
+    
+    def __init__(self, prefix: str = "bot"):
+        self.prefix = prefix
+        self.histograms: Dict[str, Histogram] = {}
+    
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Histogram:
+        full_name = f"{self.prefix}_{name}"
+        if full_name not in self.histograms:
+            self.histograms[full_name] = Histogram(full_name, help_text, labels)
+        return self.histograms[full_name]
+    
+    @contextlib.contextmanager
+    def trace(self):
+        """Zbieraj spany bieżącego zadania (i zadań z niego uruchomionych) do listy"""
+        spans = []
+        token = _current_trace.set(spans)
+        try:
+            yield spans
+        finally:
+            _current_trace.reset(token)
+    
+    @staticmethod
+    def summarize(spans: List[Tuple[str, Tuple[str, ...], float]], limit: int = 8) -> str:
+        """Spany zsumowane per (nazwa, etykiety): "llm_call[full_analysis] 2.10s, telegram_api[sendMessage] 0.31s×3" """
+        totals: Dict[str, List[float]] = {}
+        for name, labels, seconds in spans:
+            key = name[len("bot_"):].replace("_seconds", "") + (f"[{','.join(labels)}]" if labels else "")
+            total = totals.setdefault(key, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        slowest = sorted(totals.items(), key=lambda item: -item[1][0])
+        summary = ", ".join(
+            f"{key} {seconds:.2f}s" + (f"×{count}" if count > 1 else "")
+            for key, (seconds, count) in slowest[:limit]
+        )
+        return summary + (f" (+{len(slowest) - limit} krótszych)" if len(slowest) > limit else "")
+    
+    def render(self, stats: Optional[Dict[str, Dict]] = None) -> str:
+        """Tekst dla /metrics: histogramy i liczniki komponentów (bot_<komponent>_<nazwa>)"""
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+        
+        for component, values in (stats or {}).items():
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    # Statystyki zagnieżdżone (np. per szablon promptu) - klucz jako etykieta
+                    for sub_key, sub_value in value.items():
+                        self._gauge(lines, f"{component}_{sub_key}", sub_value, f'{{key="{_escape_label(key)}"}}')
+                else:
+                    self._gauge(lines, f"{component}_{key}", value)
+        
+        return "\n".join(lines) + "\n"
+    
+    def _gauge(self, lines: List[str], name: str, value: Any, labels: str = ""):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        lines.append(f"{self.prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}{labels} {value}")
+
+
+metrics = MetricsRegistry()
+
+# Odcinki gorącej ścieżki: webhook -> kolejka -> komenda (dane, AI, formatowanie) -> wysyłka
+WEBHOOK_SECONDS = metrics.histogram("webhook_seconds", "Odbiór webhooka do odpowiedzi HTTP", ("server", "status"))
+QUEUE_WAIT_SECONDS = metrics.histogram("dispatch_queue_wait_seconds", "Czas oczekiwania aktualizacji w kolejce dispatchera")
+COMMAND_SECONDS = metrics.histogram("command_seconds", "Czas obsługi komendy (bez oczekiwania w kolejkach)", ("command",))
+COLLECTOR_SECONDS = metrics.histogram("collector_get_seconds", "Czas get_* kolektora danych wg wyniku cache", ("source", "cache"))
+UPSTREAM_SECONDS = metrics.histogram("upstream_fetch_seconds", "Czas pobierania danych z zewnętrznego API", ("source", "outcome"))
+LLM_CALL_SECONDS = metrics.histogram("llm_call_seconds", "Czas _call_deepseek (z cache odpowiedzi)", ("template",))
+LLM_PARSE_SECONDS = metrics.histogram("llm_parse_seconds", "Czas _parse_ai_response")
+FORMAT_SECONDS = metrics.histogram("format_seconds", "Czas formatowania odpowiedzi", ("formatter",))
+TELEGRAM_API_SECONDS = metrics.histogram("telegram_api_seconds", "Czas wywołania Bot API (HTTP)", ("method",))
+TELEGRAM_SEND_SECONDS = metrics.histogram("telegram_send_seconds", "Czas od zakolejkowania wysyłki do odpowiedzi", ("method",))
+
+# ====================== HTTP SESSION MANAGER ======================
+
+class HttpSessionManager:
+    """Współdzielona pula połączeń aiohttp (keep-alive, cache DNS, limity per host)"""
+    
+    def __init__(self, limit: int = HTTP_POOL_LIMIT,
+                 limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+                 dns_cache_ttl: int = HTTP_DNS_CACHE_TTL):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        
+        # Sesja aiohttp jest związana z pętlą asyncio - jedna sesja na pętlę
+        self._sessions = weakref.WeakKeyDictionary()
+        self.sessions_created = 0
+    
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Zwróć sesję dla bieżącej pętli (utwórz przy pierwszym użyciu)"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[loop] = session
+            self.sessions_created += 1
+        
+        return session
+    
+    async def close(self):
+        """Zamknij sesję bieżącej pętli"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        
+        if session is not None and not session.closed:
+            await session.close()
+
+# ====================== BOUNDED CACHE ======================
+
+def estimate_size(obj: Any, _depth: int = 0) -> int:
+    """Przybliżony rozmiar obiektu w bajtach (rekurencyjnie dla kontenerów)"""
+    size = sys.getsizeof(obj)
+    
+    if _depth > 8:
+        return size
+    
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _depth + 1) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), _depth + 1)
+    
+    return size
+
+class BoundedCache:
+    """Cache LRU z limitem liczby wpisów, bajtów i maksymalnym wiekiem wpisu"""
+    
+    def __init__(self, max_entries: int, max_bytes: int, max_age: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        
+        # klucz -> (wartość, czas zapisu, rozmiar)
+        self._data = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+    
+    def get_entry(self, key) -> Optional[Tuple[Any, float]]:
+        """Zwróć (wartość, czas zapisu) lub None - odświeża pozycję LRU"""
+        entry = self._data.get(key)
+        
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        
+        value, stored_at, _ = entry
+        if self.max_age is not None and time.time() - stored_at > self.max_age:
+            self._remove(key)
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        
+        self._data.move_to_end(key)
+        self.stats["hits"] += 1
+        return value, stored_at
+    
+    def get(self, key, default=None):
+        """Zwróć wartość lub default"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else default
+
+    def stored_at(self, key) -> Optional[float]:
+        """Czas zapisu wpisu - bez liczenia trafień i zmiany pozycji LRU"""
+        entry = self._data.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value, stored_at: Optional[float] = None):
+        """Zapisz wartość i usuń najstarsze wpisy ponad limity"""
+        if key in self._data:
+            self._remove(key)
+        
+        size = estimate_size(value)
+        self._data[key] = (value, stored_at if stored_at is not None else time.time(), size)
+        self.total_bytes += size
+        
+        while self._data and (len(self._data) > self.max_entries or self.total_bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+    
+    def pop(self, key, default=None):
+        """Usuń wpis i zwróć jego wartość"""
+        if key not in self._data:
+            return default
+        value = self._data[key][0]
+        self._remove(key)
+        return value
+    
+    def clear(self):
+        """Wyczyść cache"""
+        self._data.clear()
+        self.total_bytes = 0
+    
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self.total_bytes -= size
+    
+    def __contains__(self, key) -> bool:
+        return key in self._data
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Metryki cache (w tym eksmisje)"""
+        return {**self.stats, "entries": len(self._data), "bytes": self.total_bytes}
+
+# ====================== TRWAŁY STAN UŻYTKOWNIKÓW ======================
+
+def encode_state(value: Any) -> str:
+    """JSON stanu (daty jako {"__datetime__": iso})"""
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {"__datetime__": obj.isoformat()}
+        raise TypeError(f"Nieobsługiwany typ stanu: {type(obj).__name__}")
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=default)
+
+
+def decode_state(raw: str) -> Any:
+    def hook(obj):
+        if "__datetime__" in obj and len(obj) == 1:
+            return datetime.fromisoformat(obj["__datetime__"])
+        return obj
+    return json.loads(raw, object_hook=hook)
+
+
+class MemoryStateBackend:
+    """Stan tylko w pamięci procesu (bez trwałości)"""
+    
+    name = "memory"
+    
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], str] = {}
+    
+    async def get_many(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        return {key: self._data[key] for key in keys if key in self._data}
+    
+    async def set_many(self, items: Dict[Tuple[str, str], str]):
+        self._data.update(items)
+    
+    async def delete_many(self, keys: List[Tuple[str, str]]):
+        for key in keys:
+            self._data.pop(key, None)
+    
+    async def close(self):
+        pass
+
+
+class SQLiteStateBackend:
+    """Stan w lokalnym pliku SQLite (WAL) - zapytania w jednym wątku w tle"""
+    
+    name = "sqlite"
+    CHUNK = 500  # limit parametrów w jednym zapytaniu
+    
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="StateSQLite")
+        self._conn = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+        return self._conn
+    
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    async def get_many(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        return await self._run(self._get_many, keys)
+    
+    def _get_many(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        conn = self._connect()
+        wanted = set(keys)
+        names = sorted({key for _, key in keys})
+        found = {}
+        
+        for i in range(0, len(names), self.CHUNK):
+            chunk = names[i:i + self.CHUNK]
+            rows = conn.execute(
+                f"SELECT namespace, key, value FROM state WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for namespace, key, value in rows:
+                if (namespace, key) in wanted:
+                    found[(namespace, key)] = value
+        return found
+    
+    async def set_many(self, items: Dict[Tuple[str, str], str]):
+        await self._run(self._set_many, items)
+    
+    def _set_many(self, items: Dict[Tuple[str, str], str]):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                [(namespace, key, value, now) for (namespace, key), value in items.items()]
+            )
+    
+    async def delete_many(self, keys: List[Tuple[str, str]]):
+        await self._run(self._delete_many, keys)
+    
+    def _delete_many(self, keys: List[Tuple[str, str]]):
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM state WHERE namespace = ? AND key = ?", keys)
+    
+    async def close(self):
+        def close_conn():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(close_conn)
+        self._executor.shutdown(wait=False)
+
+
+class RedisStateBackend:
+    """Stan w Redis (lub zgodnym serwerze) - jeden hash na przestrzeń nazw"""
+    
+    name = "redis"
+    
+    def __init__(self, url: str = REDIS_URL, prefix: str = "bot_state", client=None):
+        self.prefix = prefix
+        self.client = client or aioredis.from_url(url, decode_responses=True)
+    
+    def _hash(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}"
+    
+    async def get_many(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        grouped: Dict[str, List[str]] = defaultdict(list)
+        for namespace, key in keys:
+            grouped[namespace].append(key)
+        
+        # Jedna runda do serwera: HMGET per przestrzeń nazw w potoku
+        async with self.client.pipeline(transaction=False) as pipe:
+            for namespace, names in grouped.items():
+                pipe.hmget(self._hash(namespace), names)
+            results = await pipe.execute()
+        
+        found = {}
+        for (namespace, names), values in zip(grouped.items(), results):
+            for key, value in zip(names, values):
+                if value is not None:
+                    found[(namespace, key)] = value
+        return found
+    
+    async def set_many(self, items: Dict[Tuple[str, str], str]):
+        grouped: Dict[str, Dict[str, str]] = defaultdict(dict)
+        for (namespace, key), value in items.items():
+            grouped[namespace][key] = value
+        
+        async with self.client.pipeline(transaction=False) as pipe:
+            for namespace, mapping in grouped.items():
+                pipe.hset(self._hash(namespace), mapping=mapping)
+            await pipe.execute()
+    
+    async def delete_many(self, keys: List[Tuple[str, str]]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for namespace, key in keys:
+                pipe.hdel(self._hash(namespace), key)
+            await pipe.execute()
+    
+    async def close(self):
+        # aclose() od redis-py 5.0.1; starsze wersje (>=4.2) mają tylko close()
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+def create_state_backend(kind: str = STATE_BACKEND):
+    """Backend stanu wg konfiguracji (redis bez biblioteki -> sqlite)"""
+    if kind == "redis":
+        if REDIS_AVAILABLE:
+            return RedisStateBackend()
+        logger.warning("⚠️ STATE_BACKEND=redis, ale brak biblioteki redis - używam SQLite")
+        kind = "sqlite"
+    if kind == "sqlite":
+        return SQLiteStateBackend()
+    return MemoryStateBackend()
+
+
+class StateNamespace:
+    """Słownik stanu jednej przestrzeni nazw (np. lokalizacje) - zapisy oznaczane do zrzutu w tle"""
+    
+    def __init__(self, store: "UserStateStore", name: str):
+        self.store = store
+        self.name = name
+        self._data: Dict[Any, Any] = {}
+    
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+    
+    def __getitem__(self, key):
+        return self._data[key]
+    
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self.store.mark_dirty(self.name, key)
+    
+    set = __setitem__
+    
+    def pop(self, key, default=None):
+        value = self._data.pop(key, default)
+        self.store.mark_dirty(self.name, key)
+        return value
+    
+    def __contains__(self, key) -> bool:
+        return key in self._data
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def values(self):
+        return self._data.values()
+    
+    def items(self):
+        return self._data.items()
+
+
+class UserStateStore:
+    """Trwały stan czatów z leniwie ładowanym zbiorem roboczym
+    
+    load() przed obsługą aktualizacji - odczyty z jednego okna łączone w jedno
+    zapytanie; zmiany trafiają do backendu w tle, partiami (write-behind).
+    """
+    
+    NAMESPACES = ("profiles", "locations", "report_pointers")
+    
+    def __init__(self, backend=None, flush_interval: float = STATE_FLUSH_INTERVAL,
+                 batch_window: float = STATE_BATCH_WINDOW, working_set: int = STATE_WORKING_SET):
+        self.backend = backend or create_state_backend()
+        self.flush_interval = flush_interval
+        self.batch_window = batch_window
+        self.working_set = working_set
+        self.namespaces = {name: StateNamespace(self, name) for name in self.NAMESPACES}
+        
+        self._loaded: OrderedDict = OrderedDict()  # czat -> None (kolejność LRU)
+        self._pending_loads: Dict[Any, asyncio.Future] = {}
+        self._load_task = None
+        self._dirty: Set[Tuple[str, Any]] = set()
+        self._flush_task = None
+        self.stats = {"loads": 0, "load_batches": 0, "flushes": 0, "written": 0, "deleted": 0, "evicted": 0}
+    
+    def __getitem__(self, name: str) -> StateNamespace:
+        return self.namespaces[name]
+    
+    async def load(self, chat_id: Any):
+        """Załaduj stan czatu do pamięci (no-op, jeśli już jest)"""
+        if chat_id in self._loaded:
+            self._loaded.move_to_end(chat_id)
+            return
+        
+        future = self._pending_loads.get(chat_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending_loads[chat_id] = future
+            if self._load_task is None or self._load_task.done():
+                self._load_task = asyncio.ensure_future(self._load_batch())
+        
+        await asyncio.shield(future)
+    
+    async def _load_batch(self):
+        """Poczekaj batch_window i załaduj wszystkie zgłoszone czaty jednym zapytaniem"""
+        await asyncio.sleep(self.batch_window)
+        waiting, self._pending_loads = self._pending_loads, {}
+        
+        try:
+            keys = [(name, str(chat_id)) for chat_id in waiting for name in self.NAMESPACES]
+            found = await self.backend.get_many(keys)
+            
+            for chat_id in waiting:
+                for name in self.NAMESPACES:
+                    raw = found.get((name, str(chat_id)))
+                    # Niezapisana zmiana z pamięci wygrywa z wartością z backendu
+                    if raw is not None and (name, chat_id) not in self._dirty:
+                        self.namespaces[name]._data[chat_id] = decode_state(raw)
+                self._loaded[chat_id] = None
+            
+            self.stats["loads"] += len(waiting)
+            self.stats["load_batches"] += 1
+            self._evict()
+        except Exception as e:
+            # Bez stanu z backendu bot nadal działa (jak nowy użytkownik)
+            logger.warning(f"⚠️ Błąd odczytu stanu użytkowników: {e}")
+        finally:
+            for future in waiting.values():
+                if not future.done():
+                    future.set_result(None)
+        
+        if self._pending_loads:
+            self._load_task = asyncio.ensure_future(self._load_batch())
+    
+    def _evict(self):
+        """Usuń z pamięci najdawniej używane czaty bez niezapisanych zmian"""
+        dirty_chats = {chat_id for _, chat_id in self._dirty}
+        for chat_id in list(self._loaded):
+            if len(self._loaded) <= self.working_set:
+                break
+            if chat_id in dirty_chats:
+                continue
+            del self._loaded[chat_id]
+            for namespace in self.namespaces.values():
+                namespace._data.pop(chat_id, None)
+            self.stats["evicted"] += 1
+    
+    def mark_dirty(self, name: str, chat_id: Any):
+        """Zaplanuj zapis zmiany w tle"""
+        self._dirty.add((name, chat_id))
+        if chat_id not in self._loaded:
+            self._loaded[chat_id] = None
+        
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+    
+    async def flush(self):
+        """Zapisz wszystkie oczekujące zmiany jedną partią"""
+        if not self._dirty:
+            return
+        
+        dirty, self._dirty = self._dirty, set()
+        updates, deletes = {}, []
+        for name, chat_id in dirty:
+            data = self.namespaces[name]._data
+            if chat_id in data:
+                updates[(name, str(chat_id))] = encode_state(data[chat_id])
+            else:
+                deletes.append((name, str(chat_id)))
+        
+        try:
+            if updates:
+                await self.backend.set_many(updates)
+            if deletes:
+                await self.backend.delete_many(deletes)
+        except asyncio.CancelledError:
+            self._dirty |= dirty
+            raise
+        except Exception as e:
+            # Spróbujemy ponownie przy następnym zrzucie
+            logger.warning(f"⚠️ Błąd zapisu stanu użytkowników: {e}")
+            self._dirty |= dirty
+            return
+        
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(updates)
+        self.stats["deleted"] += len(deletes)
+    
+    async def close(self):
+        """Zrzuć zmiany i zamknij backend"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+        await self.backend.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "backend": self.backend.name, "loaded": len(self._loaded), "dirty": len(self._dirty)}
+
+# ====================== WSPÓŁDZIELONY CACHE DANYCH (L2) ======================
+
+class SQLiteSharedCache:
+    """Cache L2 w pliku SQLite (WAL) wspólny dla workerów jednego hosta, z blokadami odświeżania"""
+    
+    name = "sqlite"
+    CLEANUP_EVERY = 200  # co tyle zapisów usuwamy wygasłe wpisy
+    
+    def __init__(self, path: str = SHARED_CACHE_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SharedCache")
+        self._conn = None
+        self._writes = 0
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # isolation_level=None: transakcje sterowane ręcznie (BEGIN IMMEDIATE przy blokadach)
+            self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._conn
+    
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    async def get(self, key: str) -> Optional[Tuple[str, float]]:
+        return await self._run(self._get, key)
+    
+    def _get(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self._connect().execute(
+            "SELECT value, stored_at FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+    
+    async def set(self, key: str, value: str, stored_at: float, keep_for: float):
+        await self._run(self._set, key, value, stored_at, keep_for)
+    
+    def _set(self, key: str, value: str, stored_at: float, keep_for: float):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, value, stored_at, stored_at + keep_for)
+        )
+        self._count_write(conn)
+    
+    def _count_write(self, conn: sqlite3.Connection):
+        self._writes += 1
+        if self._writes % self.CLEANUP_EVERY == 0:
+            now = time.time()
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM locks WHERE expires_at <= ?", (now,))
+    
+    async def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        return await self._run(self._acquire_lock, key, owner, ttl)
+    
+    def _acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+            acquired = conn.execute(
+                "INSERT OR IGNORE INTO locks (key, owner, expires_at) VALUES (?, ?, ?)", (key, owner, now + ttl)
+            ).rowcount == 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if acquired:
+            self._count_write(conn)
+        return acquired
+    
+    async def release_lock(self, key: str, owner: str):
+        await self._run(self._release_lock, key, owner)
+    
+    def _release_lock(self, key: str, owner: str):
+        self._connect().execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+    
+    async def close(self):
+        def close_conn():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(close_conn)
+        self._executor.shutdown(wait=False)
+
+
+class RedisSharedCache:
+    """Cache L2 w Redis (lub serwerze zgodnym z protokołem) dla wielu hostów"""
+    
+    name = "redis"
+    
+    # Zwolnij blokadę tylko, jeśli nadal należy do nas
+    RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+    
+    def __init__(self, url: str = REDIS_URL, prefix: str = "collector_cache", client=None):
+        self.prefix = prefix
+        self.client = client or aioredis.from_url(url, decode_responses=True)
+    
+    async def get(self, key: str) -> Optional[Tuple[str, float]]:
+        raw = await self.client.get(f"{self.prefix}:{key}")
+        if raw is None:
+            return None
+        stored_at, _, value = raw.partition("|")
+        return value, float(stored_at)
+    
+    async def set(self, key: str, value: str, stored_at: float, keep_for: float):
+        await self.client.set(f"{self.prefix}:{key}", f"{stored_at}|{value}", px=max(1, int(keep_for * 1000)))
+    
+    async def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self.client.set(f"{self.prefix}:lock:{key}", owner, nx=True, px=int(ttl * 1000)))
+    
+    async def release_lock(self, key: str, owner: str):
+        lock_key = f"{self.prefix}:lock:{key}"
+        try:
+            await self.client.eval(self.RELEASE_SCRIPT, 1, lock_key, owner)
+        except Exception:
+            # Zamienniki Redisa bez Lua: sprawdź właściciela i usuń (blokada i tak ma TTL)
+            if await self.client.get(lock_key) == owner:
+                await self.client.delete(lock_key)
+    
+    async def close(self):
+        # aclose() od redis-py 5.0.1; starsze wersje (>=4.2) mają tylko close()
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+def create_shared_cache(kind: str = SHARED_CACHE_BACKEND):
+    """Backend cache L2 wg konfiguracji (None = "memory", tylko cache w pamięci procesu)"""
+    if kind == "memory":
+        return None
+    if kind == "redis":
+        if REDIS_AVAILABLE:
+            return RedisSharedCache()
+        logger.warning("⚠️ SHARED_CACHE_BACKEND=redis, ale brak biblioteki redis - używam SQLite")
+    elif kind != "sqlite":
+        logger.warning(f"⚠️ Nieznany SHARED_CACHE_BACKEND={kind!r} (sqlite | redis | memory) - używam SQLite")
+    return SQLiteSharedCache()
+
+# ====================== LOKALNE PRZEWIDYWANIE PRZELOTÓW (SGP4) ======================
+
+class PassPredictor:
+    """Lokalny silnik przelotów: SGP4 (skyfield) z TLE + wektorowe look angles (numpy)"""
+    
+    EARTH_RADIUS_KM = 6371.0
+    
+    def __init__(self, satellites: List[Dict], http: HttpSessionManager,
+                 tle_file: str = TLE_FILE):
+        self.tracked = satellites
+        self.http = http
+        self.tle_file = tle_file
+        
+        self.satellites = {}  # norad_id -> EarthSatellite
+        self.tle_loaded_at = None
+        self.tle_version = 0  # zwiększane przy każdym wczytaniu TLE
+        self.ts = load.timescale(builtin=True) if SKYFIELD_AVAILABLE else None
+        self._refresh_lock = None
+        self._refresh_task = None
+        self._next_download = 0.0
+    
+    @property
+    def available(self) -> bool:
+        return SKYFIELD_AVAILABLE and bool(self.satellites)
+    
+    def load_tle_file(self) -> int:
+        """Wczytaj zestawy TLE z pliku (format 3-liniowy: nazwa, linia 1, linia 2)"""
+        if not SKYFIELD_AVAILABLE or not os.path.exists(self.tle_file):
+            return 0
+        
+        with open(self.tle_file, encoding="utf-8") as f:
+            lines = [line.rstrip() for line in f if line.strip()]
+        
+        tracked_ids = {sat["norad_id"] for sat in self.tracked}
+        names = {sat["norad_id"]: sat["name"] for sat in self.tracked}
+        satellites = {}
+        
+        for i in range(len(lines) - 1):
+            if lines[i].startswith("1 ") and lines[i + 1].startswith("2 "):
+                norad_id = int(lines[i][2:7])
+                if norad_id in tracked_ids:
+                    satellites[norad_id] = EarthSatellite(lines[i], lines[i + 1], names[norad_id], self.ts)
+        
+        self.satellites = satellites
+        self.tle_loaded_at = os.path.getmtime(self.tle_file)
+        self.tle_version += 1
+        logger.info(f"🛰️ Wczytano TLE dla {len(satellites)} satelitów z {self.tle_file}")
+        return len(satellites)
+    
+    @property
+    def stale(self) -> bool:
+        """Czy TLE trzeba pobrać na nowo (brak lub starsze niż TLE_MAX_AGE_HOURS)"""
+        return self.tle_loaded_at is None or time.time() - self.tle_loaded_at > TLE_MAX_AGE_HOURS * 3600
+    
+    def tles_ready(self) -> bool:
+        """Ścieżka zapytania: TLE z pamięci (albo pliku), nawet nieaktualne - pobieranie tylko w tle"""
+        if not SKYFIELD_AVAILABLE:
+            return False
+        if not self.satellites:
+            self.load_tle_file()
+        if self.stale:
+            self.schedule_refresh()
+        return self.available
+    
+    def schedule_refresh(self) -> asyncio.Future:
+        """Odśwież TLE w tle (jedno odświeżanie naraz)"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self.ensure_tles())
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+    
+    @staticmethod
+    def _on_refresh_done(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ Odświeżanie TLE w tle nieudane: {task.exception()}")
+    
+    async def ensure_tles(self) -> bool:
+        """Upewnij się, że TLE są wczytane i aktualne (pobierz z CelesTrak gdy trzeba)
+        
+        Pobiera z sieci - wołane przy starcie i z harmonogramu prewarm, nie ze ścieżki zapytania.
+        """
+        if not SKYFIELD_AVAILABLE:
+            return False
+        
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        
+        async with self._refresh_lock:
+            if not self.satellites:
+                self.load_tle_file()
+            
+            if self.stale and time.time() >= self._next_download:
+                if await self._download_tles():
+                    self.load_tle_file()
+                else:
+                    # Nie próbuj przy każdym zapytaniu - używaj starych TLE (offline)
+                    self._next_download = time.time() + TLE_RETRY_MINUTES * 60
+        
+        return self.available
+    
+    async def _download_tles(self) -> bool:
+        """Pobierz TLE obserwowanych satelitów z CelesTrak i zapisz do pliku"""
+        session = await self.http.get_session()
+        
+        async def fetch(sat: Dict) -> Optional[str]:
+            try:
+                params = {"CATNR": sat["norad_id"], "FORMAT": "TLE"}
+                async with session.get(TLE_SOURCE_URL, params=params, timeout=15) as response:
+                    if response.status == 200:
+                        text = (await response.text()).strip()
+                        if "\n1 " in text:
+                            return text
+            except Exception as e:
+                logger.warning(f"⚠️ Nie udało się pobrać TLE {sat['name']}: {e}")
+            return None
+        
+        results = await asyncio.gather(*[fetch(sat) for sat in self.tracked])
+        tle_sets = [text for text in results if text]
+        
+        if not tle_sets:
+            return False
+        
+        tmp_file = f"{self.tle_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(tle_sets) + "\n")
+        os.replace(tmp_file, self.tle_file)
+        
+        return True
+    
+    def compute_passes(self, observers: List[Dict[str, float]], start: Optional[datetime] = None,
+                       hours: float = PASS_HORIZON_HOURS) -> List[List[Dict]]:
+        """Przeloty wszystkich satelitów nad wieloma obserwatorami naraz
+        
+        Propagacja SGP4 raz na satelitę dla całej siatki czasu, look angles
+        liczone jednym wektorowym przebiegiem (satelita × obserwator × czas).
+        Zwraca listę przelotów (posortowaną wg czasu) dla każdego obserwatora.
+        """
+        start = start or datetime.utcnow()
+        offsets = np.arange(0, hours * 3600, PASS_STEP_SECONDS)
+        times = self.ts.utc(start.year, start.month, start.day, start.hour, start.minute,
+                            start.second + offsets)
+        
+        passes = [[] for _ in observers]
+        if not self.satellites:
+            return passes
+        
+        norad_ids = list(self.satellites)
+        east, north, up, observer_xyz = self._observer_frames(observers)
+        
+        # Pozycje satelitów w ITRS: (S, 3, T) km - SGP4 raz na satelitę
+        sat_xyz = np.stack([self.satellites[norad_id].at(times).frame_xyz(itrs).km for norad_id in norad_ids])
+        altitude = np.linalg.norm(sat_xyz, axis=1) - self.EARTH_RADIUS_KM
+        
+        # Wektor obserwator -> satelita: (S, O, 3, T)
+        rel = sat_xyz[:, None, :, :] - observer_xyz[None, :, :, None]
+        e = np.einsum('oc,soct->sot', east, rel)
+        n = np.einsum('oc,soct->sot', north, rel)
+        u = np.einsum('oc,soct->sot', up, rel)
+        
+        elevation = np.degrees(np.arctan2(u, np.hypot(e, n)))
+        azimuth = np.degrees(np.arctan2(e, n)) % 360
+        
+        for s, norad_id in enumerate(norad_ids):
+            name = self.satellites[norad_id].name
+            for o in range(len(observers)):
+                passes[o].extend(self._extract_passes(
+                    name, norad_id, start, offsets,
+                    elevation[s, o], azimuth[s, o], altitude[s]
+                ))
+        
+        for observer_passes in passes:
+            observer_passes.sort(key=lambda p: p['start_utc'])
+        
+        return passes
+    
+    def _observer_frames(self, observers: List[Dict[str, float]]):
+        """Wektory ENU i pozycje ECEF obserwatorów (km)"""
+        lat = np.radians([obs['lat'] for obs in observers])
+        lon = np.radians([obs['lon'] for obs in observers])
+        
+        east = np.stack([-np.sin(lon), np.cos(lon), np.zeros_like(lon)], axis=1)
+        north = np.stack([-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)], axis=1)
+        up = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+        
+        observer_xyz = np.stack([
+            wgs84.latlon(obs['lat'], obs['lon']).itrs_xyz.km for obs in observers
+        ])
+        
+        return east, north, up, observer_xyz
+    
+    def _extract_passes(self, name: str, norad_id: int, start: datetime, offsets,
+                        elevation, azimuth, altitude) -> List[Dict]:
+        """Znajdź ciągłe odcinki nad minimalną elewacją (wschód, kulminacja, zachód)"""
+        above = np.concatenate(([False], elevation >= PASS_MIN_ELEVATION, [False]))
+        edges = np.flatnonzero(np.diff(above.astype(np.int8)))
+        
+        passes = []
+        for rise, end in zip(edges[::2], edges[1::2]):
+            set_ = end - 1
+            culmination = rise + int(np.argmax(elevation[rise:end]))
+            
+            passes.append({
+                'satellite': name,
+                'norad_id': norad_id,
+                'start_utc': start + timedelta(seconds=float(offsets[rise])),
+                'culmination_utc': start + timedelta(seconds=float(offsets[culmination])),
+                'end_utc': start + timedelta(seconds=float(offsets[set_])),
+                'max_elevation': round(float(elevation[culmination]), 1),
+                'duration': int(offsets[set_] - offsets[rise]) + PASS_STEP_SECONDS,
+                'rise_azimuth': round(float(azimuth[rise]), 1),
+                'culmination_azimuth': round(float(azimuth[culmination]), 1),
+                'set_azimuth': round(float(azimuth[set_]), 1),
+                'altitude_km': round(float(altitude[culmination]), 1)
+            })
+        
+        return passes
+    
+    def visibility_radius_km(self, altitude_km: float) -> float:
+        """Promień obszaru na Ziemi, z którego satelita jest nad minimalną elewacją"""
+        min_el = math.radians(PASS_MIN_ELEVATION)
+        ratio = self.EARTH_RADIUS_KM * math.cos(min_el) / (self.EARTH_RADIUS_KM + altitude_km)
+        return self.EARTH_RADIUS_KM * (math.acos(ratio) - min_el)
+    
+    async def get_passes(self, location: Dict[str, float], start: Optional[datetime] = None,
+                         hours: float = PASS_HORIZON_HOURS) -> List[Dict]:
+        """Przeloty nad jedną lokalizacją (obliczenia poza pętlą asyncio)"""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.compute_passes, [location], start, hours)
+        return result[0]
+
+class PassIndex:
+    """Indeks przelotów dla predefiniowanych lokalizacji: lokalizacja -> kubełek godzinowy -> przeloty"""
+    
+    BUCKET_SECONDS = 3600
+    
+    def __init__(self, predictor: PassPredictor):
+        self.predictor = predictor
+        self.locations = {}  # klucz -> {"lat", "lon", ...}
+        self._by_coords = {}  # (lat, lon) -> klucz
+        
+        self.index = {}
+        self.start = None
+        self.end = None
+        self.tle_version = None
+        self.build_seconds = None
+    
+    def set_locations(self, locations: Dict[str, Dict]):
+        """Ustaw predefiniowane lokalizacje do prekomputacji"""
+        self.locations = dict(locations)
+        self._by_coords = {(loc['lat'], loc['lon']): key for key, loc in self.locations.items()}
+    
+    def key_for(self, location: Dict[str, float]) -> Optional[str]:
+        """Klucz predefiniowanej lokalizacji o tych współrzędnych (lub None)"""
+        return self._by_coords.get((location['lat'], location['lon']))
+    
+    def needs_rebuild(self) -> bool:
+        """Czy indeks jest pusty, policzony ze starych TLE lub kończy mu się horyzont"""
+        if not self.locations or not self.predictor.available:
+            return False
+        if self.tle_version != self.predictor.tle_version or self.end is None:
+            return True
+        return self.end - datetime.utcnow() < timedelta(hours=PASS_HORIZON_HOURS / 2)
+    
+    def build(self):
+        """Policz przeloty wszystkich satelitów nad wszystkimi lokalizacjami naraz"""
+        started = time.perf_counter()
+        tle_version = self.predictor.tle_version
+        start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        
+        keys = list(self.locations)
+        results = self.predictor.compute_passes([self.locations[key] for key in keys], start)
+        
+        index = {}
+        for key, passes in zip(keys, results):
+            buckets = defaultdict(list)
+            for sat_pass in passes:
+                buckets[self._bucket(sat_pass['start_utc'])].append(sat_pass)
+            index[key] = dict(buckets)
+        
+        # Podmiana atomowa - czytelnicy widzą stary albo nowy indeks
+        self.index = index
+        self.start = start
+        self.end = start + timedelta(hours=PASS_HORIZON_HOURS)
+        self.tle_version = tle_version
+        self.build_seconds = time.perf_counter() - started
+        
+        logger.info(f"🛰️ Indeks przelotów: {len(keys)} lokalizacji, {self.build_seconds:.2f}s")
+    
+    def get_passes(self, key: str, start: datetime, hours: float = PASS_HORIZON_HOURS / 2) -> Optional[List[Dict]]:
+        """Przeloty trwające lub zaczynające się w oknie [start, start + hours]; None gdy poza indeksem"""
+        if key not in self.index or self.start is None:
+            return None
+        
+        end = start + timedelta(hours=hours)
+        if start < self.start or end > self.end:
+            return None
+        
+        buckets = self.index[key]
+        passes = []
+        
+        # Kubełek wcześniej - przelot mógł się zacząć przed start i jeszcze trwać
+        for bucket in range(self._bucket(start) - 1, self._bucket(end) + 1):
+            for sat_pass in buckets.get(bucket, []):
+                if sat_pass['end_utc'] >= start and sat_pass['start_utc'] <= end:
+                    passes.append(sat_pass)
+        
+        return passes
+    
+    def _bucket(self, moment: datetime) -> int:
+        return int((moment - datetime(1970, 1, 1)).total_seconds() // self.BUCKET_SECONDS)
+
+# ====================== CIRCUIT BREAKERY (ZEWNĘTRZNE API) ======================
+
+class UpstreamError(Exception):
+    """Nieudane wywołanie zewnętrznego API (błąd sieci, timeout, status HTTP)"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Obwód hosta otwarty - wywołanie odrzucone bez łączenia"""
+
+
+class CircuitBreaker:
+    """Bezpiecznik jednego hosta: closed -> open (odsetek błędów w oknie) -> half_open (jedna próba) -> closed
+    
+    Otwarty obwód odrzuca wywołania od razu zamiast czekać na timeout niedziałającego API.
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    
+    def __init__(self, host: str, window: int = CIRCUIT_WINDOW, min_calls: int = CIRCUIT_MIN_CALLS,
+                 failure_rate: float = CIRCUIT_FAILURE_RATE, open_seconds: float = CIRCUIT_OPEN_SECONDS,
+                 max_open_seconds: float = CIRCUIT_MAX_OPEN_SECONDS):
+        self.host = host
+        self.min_calls = min_calls
+        self.failure_threshold = failure_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)  # True = błąd
+        self._opened_at = 0.0
+        self._cooldown = open_seconds
+        self._probe_inflight = False
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+    
+    def allow(self) -> bool:
+        """Czy wywołanie może iść do hosta (w half-open tylko jedna próba naraz)"""
+        if self.state == self.CLOSED:
+            return True
+        
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self._cooldown:
+                self.stats["rejected"] += 1
+                return False
+            self.state = self.HALF_OPEN
+            logger.info(f"🔌 {self.host}: half-open - próbne wywołanie")
+        
+        if self._probe_inflight:
+            self.stats["rejected"] += 1
+            return False
+        self._probe_inflight = True
+        return True
+    
+    def record_success(self):
+        self.stats["calls"] += 1
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+            self._cooldown = self.open_seconds
+            self._probe_inflight = False
+            logger.info(f"✅ {self.host}: obwód zamknięty")
+        self._outcomes.append(False)
+    
+    def record_failure(self, reason: str = ""):
+        self.stats["calls"] += 1
+        self.stats["failures"] += 1
+        
+        if self.state == self.HALF_OPEN:
+            # Próba nieudana - dłuższa przerwa przed kolejną
+            self._probe_inflight = False
+            self._cooldown = min(self._cooldown * 2, self.max_open_seconds)
+            self._open(reason)
+            return
+        
+        self._outcomes.append(True)
+        if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                and self.failure_rate() >= self.failure_threshold):
+            self._open(reason)
+    
+    def abandon(self):
+        """Wywołanie przerwane (anulowanie) bez wyniku - zwolnij miejsce na próbę"""
+        self._probe_inflight = False
+    
+    def _open(self, reason: str):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        logger.warning(f"🔌 {self.host}: obwód otwarty na {self._cooldown:.0f}s "
+                       f"(błędy {self.failure_rate():.0%}, ostatni: {reason})")
+    
+    def failure_rate(self) -> float:
+        return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "state": self.STATE_CODES[self.state], "failure_rate": round(self.failure_rate(), 3)}
+
+
+class CircuitBreakerRegistry:
+    """Bezpieczniki per host (wspólne dla kolektora danych i DeepSeek)"""
+    
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+    
+    def for_url(self, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(host)
+        return breaker
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {host: breaker.get_stats() for host, breaker in self.breakers.items()}
+
+
+circuit_breakers = CircuitBreakerRegistry()
+
+# Termin (czas pętli) bieżącego collect_all_data - get_* nie czekają na pobieranie dłużej
+_collect_deadline: contextvars.ContextVar = contextvars.ContextVar("collect_deadline", default=None)
+
+
+class LatencyTracker:
+    """Rozkład czasów odpowiedzi per źródło - timeout = p99 × współczynnik, próg hedgingu = p95
+    
+    Dopóki pomiarów jest mniej niż min_samples, obowiązują stałe limity (są też górną granicą).
+    Timeout liczy się jako pomiar równy limitowi, a każdy kolejny timeout z rzędu podwaja
+    limit - inaczej po wzroście opóźnień źródła timeout zostałby na starym, za niskim poziomie.
+    """
+    
+    def __init__(self, limits: Dict[str, float], factor: float = ADAPTIVE_TIMEOUT_FACTOR,
+                 minimum: float = ADAPTIVE_TIMEOUT_MIN, min_samples: int = ADAPTIVE_TIMEOUT_MIN_SAMPLES,
+                 window: int = ADAPTIVE_TIMEOUT_WINDOW):
+        self.limits = limits
+        self.factor = factor
+        self.minimum = minimum
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._timeouts: Dict[str, int] = defaultdict(int)  # timeouty z rzędu per źródło
+    
+    def record(self, source: str, seconds: float):
+        self._samples[source].append(seconds)
+        self._timeouts[source] = 0
+    
+    def record_timeout(self, source: str, timeout: float):
+        """Zapytanie przekroczyło timeout - prawdziwy czas jest co najmniej taki"""
+        self._samples[source].append(timeout)
+        self._timeouts[source] += 1
+    
+    def percentile(self, source: str, q: float) -> Optional[float]:
+        samples = self._samples.get(source)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    def timeout_for(self, source: str) -> float:
+        limit = self.limits.get(source, 10)
+        p99 = self.percentile(source, 0.99)
+        if p99 is None:
+            return limit
+        backoff = 2 ** min(self._timeouts.get(source, 0), 10)
+        return min(limit, max(self.minimum, p99 * self.factor) * backoff)
+    
+    def hedge_delay(self, source: str) -> Optional[float]:
+        """Po ilu sekundach wysłać drugą próbę (None = za mało pomiarów)"""
+        return self.percentile(source, 0.95)
+    
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for source in self._samples:
+            p95 = self.percentile(source, 0.95)
+            stats[source] = {
+                "samples": len(self._samples[source]),
+                "p50_s": round(self.percentile(source, 0.5) or 0.0, 3),
+                "p95_s": round(p95 or 0.0, 3),
+                "p99_s": round(self.percentile(source, 0.99) or 0.0, 3),
+                "consecutive_timeouts": self._timeouts.get(source, 0),
+                "timeout_s": round(self.timeout_for(source), 3)
+            }
+        return stats
+
 # ====================== UNIVERSAL DATA COLLECTOR ======================
 
 class UniversalDataCollector:
     """Zbiera WSZYSTKIE dane ze wszystkich API"""
     
-    def __init__(self):
-        self.cache = {}
-        self.cache_time = {}
-        self.CACHE_DURATION = 300  # 5 minut
-        
-    async def collect_all_data(self, user_location: Dict[str, float] = None) -> Dict[str, Any]:
-        """Zbierz WSZYSTKIE dane z wszystkich API"""
-        tasks = []
-        
-        # Jeśli mamy lokalizację użytkownika
-        if user_location:
-            tasks.extend([
-                self.get_weather_data(user_location),
-                self.get_satellite_passes(user_location),
-                self.get_visibility_zones(user_location)
-            ])
-        
-        # Dane globalne
-        tasks.extend([
-            self.get_earthquake_data(),
-            self.get_asteroid_data(),
-            self.get_apod_data(),
-            self.get_space_weather(),
-            self.get_aurora_forecast(),
-            self.get_meteor_showers()
-        ])
+    # Źródła zależne od lokalizacji użytkownika
+    LOCATION_SOURCES = ("weather", "satellite_passes", "visibility_zones")
+    
+    # Źródła globalne
+    GLOBAL_SOURCES = ("earthquakes", "asteroids", "apod", "space_weather", "aurora", "meteors")
+    
+    ALL_SOURCES = LOCATION_SOURCES + GLOBAL_SOURCES
+    
+    # Źródło globalne -> metoda pobierająca (klucz cache = nazwa źródła)
+    GLOBAL_FETCHERS = {
+        "earthquakes": "_fetch_earthquakes",
+        "asteroids": "_fetch_asteroids",
+        "apod": "_fetch_apod",
+        "space_weather": "_compute_space_weather",
+        "aurora": "_compute_aurora_forecast",
+        "meteors": "_compute_meteor_showers"
+    }
+    
+    # Obserwowane satelity
+    TRACKED_SATELLITES = [
+        {"name": "ISS", "norad_id": 25544},
+        {"name": "Landsat 8", "norad_id": 39084},
+        {"name": "Sentinel-2A", "norad_id": 40697},
+        {"name": "Hubble", "norad_id": 20580},
+        {"name": "NOAA-20", "norad_id": 43013}
+    ]
+    
+    # Typ obserwacji -> źródła danych
+    OBSERVATION_SOURCES = {
+        ObservationType.SATELLITE: ("satellite_passes", "visibility_zones"),
+        ObservationType.EARTHQUAKE: ("earthquakes",),
+        ObservationType.ASTEROID: ("asteroids",),
+        ObservationType.WEATHER: ("weather",),
+        ObservationType.AURORA: ("aurora", "space_weather"),
+        ObservationType.METEOR: ("meteors",)
+    }
+    
+    def __init__(self, http: Optional[HttpSessionManager] = None, shared_cache=None):
+        self.http = http or HttpSessionManager()
+        self.CACHE_DURATION = 300  # 5 minut (domyślnie dla nieznanych źródeł)
+        
+        # TTL per źródło - zgodnie z tym jak często zmieniają się dane
+        self.CACHE_TTL = {
+            "weather": 600,            # OpenWeather: ~10 minut
+            "earthquakes": 60,         # USGS: co minutę
+            "asteroids": 3600,         # NASA NEO: co godzinę
+            "apod": 6 * 3600,          # APOD: raz dziennie
+            "satellite_passes": 900,
+            "visibility_zones": 900,
+            "space_weather": 900,
+            "aurora": 1800,
+            "meteors": 24 * 3600
+        }
+        
+        # Maksymalne timeouty zapytań per źródło - faktyczne wynikają z obserwowanych czasów (p99)
+        self.latency = LatencyTracker({
+            "weather": 10,
+            "earthquakes": 10,
+            "n2yo": 10,
+            "asteroids": 15,
+            "apod": 15
+        })
+        
+        # Stale-while-revalidate: przez ile (jako ułamek TTL) po wygaśnięciu
+        # zwracamy stare dane i odświeżamy je w tle
+        self.STALE_FACTOR = CACHE_STALE_FACTOR
+        
+        # Ograniczony cache LRU (klucze pogody/przelotów zawierają współrzędne)
+        max_ttl = max([self.CACHE_DURATION] + list(self.CACHE_TTL.values()))
+        self.cache = BoundedCache(
+            max_entries=COLLECTOR_CACHE_MAX_ENTRIES,
+            max_bytes=COLLECTOR_CACHE_MAX_BYTES,
+            max_age=max_ttl * (1 + self.STALE_FACTOR)
+        )
+        
+        # Single-flight: klucz cache -> trwające pobieranie
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale_hits": 0, "refreshes": 0, "prewarms": 0,
+                      "l2_hits": 0, "lock_waits": 0, "stale_fallbacks": 0, "deadline_misses": 0,
+                      "hedged": 0, "hedge_wins": 0}
+        
+        # Cache L2 wspólny dla workerów/hostów - jeden worker odświeża dane, reszta czyta wynik
+        self.shared_cache = shared_cache if shared_cache is not None else create_shared_cache()
+        self._lock_owner = f"{os.getpid()}-{id(self)}"
+        
+        # Ostatnie błędy pobierania (klucz cache -> opis) do raportowania
+        self._fetch_errors = BoundedCache(max_entries=500, max_bytes=1024 * 1024, max_age=600)
+        
+        # Semafor tworzony leniwie - musi należeć do pętli, w której działa
+        self._n2yo_semaphore = None
+        
+        # Lokalne przeloty z TLE (bez limitów N2YO, działa offline)
+        self.pass_predictor = PassPredictor(self.TRACKED_SATELLITES, self.http)
+        self.pass_index = PassIndex(self.pass_predictor)
+        self._pass_index_task = None
+        
+    async def collect_all_data(self, user_location: Dict[str, float] = None,
+                               sources: Optional[Set[Any]] = None,
+                               deadline: float = COLLECT_DEADLINE) -> Dict[str, Any]:
+        """Zbierz dane z API - wszystkie albo tylko wybrane źródła
+        
+        sources: nazwy źródeł (np. "earthquakes") lub ObservationType; None = wszystkie
+        deadline: budżet czasu w sekundach (0 = bez limitu) - źródła, które nie zdążą,
+                  dostają ostatnie dobre dane z oznaczeniem w "stale_data"
+        """
+        requested = self.resolve_sources(sources)
+        
+        fetchers = {
+            "weather": lambda: self.get_weather_data(user_location),
+            "satellite_passes": lambda: self.get_satellite_passes(user_location),
+            "visibility_zones": lambda: self.get_visibility_zones(user_location),
+            "earthquakes": self.get_earthquake_data,
+            "asteroids": self.get_asteroid_data,
+            "apod": self.get_apod_data,
+            "space_weather": self.get_space_weather,
+            "aurora": self.get_aurora_forecast,
+            "meteors": self.get_meteor_showers
+        }
+        
+        # Źródła lokalne wymagają lokalizacji użytkownika
+        names = [
+            name for name in self.ALL_SOURCES
+            if name in requested and (user_location or name not in self.LOCATION_SOURCES)
+        ]
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Termin w zmiennej kontekstowej - dziedziczą go zadania gather (także zagnieżdżone get_*)
+        token = _collect_deadline.set(asyncio.get_running_loop().time() + deadline) if deadline > 0 else None
+        try:
+            results = await asyncio.gather(*[fetchers[name]() for name in names], return_exceptions=True)
+        finally:
+            if token is not None:
+                _collect_deadline.reset(token)
         
         # Kompiluj wyniki
         all_data = {
@@ -134,6 +1686,7 @@ class UniversalDataCollector:
             "earthquakes": [],
             "asteroids": [],
             "satellite_passes": [],
+            "satellite_errors": [],
             "visibility_zones": [],
             "apod": None,
             "space_weather": None,
@@ -141,205 +1694,309 @@ class UniversalDataCollector:
             "meteors": None
         }
         
+        # Źródła podane z cache po awarii API - oznaczenia łączone, nie nadpisywane
+        stale_data = {}
         for result in results:
             if isinstance(result, dict):
-                if "weather" in result:
-                    all_data["weather"] = result["weather"]
-                elif "earthquakes" in result:
-                    all_data["earthquakes"] = result["earthquakes"]
-                elif "asteroids" in result:
-                    all_data["asteroids"] = result["asteroids"]
-                elif "satellite_passes" in result:
-                    all_data["satellite_passes"] = result["satellite_passes"]
-                elif "visibility_zones" in result:
-                    all_data["visibility_zones"] = result["visibility_zones"]
-                elif "apod" in result:
-                    all_data["apod"] = result["apod"]
-                elif "space_weather" in result:
-                    all_data["space_weather"] = result["space_weather"]
-                elif "aurora" in result:
-                    all_data["aurora"] = result["aurora"]
-                elif "meteors" in result:
-                    all_data["meteors"] = result["meteors"]
+                all_data.update(result)
+                stale_data.update(result.get("stale_data", {}))
+        
+        if stale_data:
+            all_data["stale_data"] = stale_data
+        else:
+            all_data.pop("stale_data", None)
         
         return all_data
     
+    def resolve_sources(self, sources: Optional[Set[Any]]) -> Set[str]:
+        """Zamień ObservationType / nazwy źródeł na zbiór nazw źródeł"""
+        if sources is None:
+            return set(self.ALL_SOURCES)
+        
+        resolved = set()
+        for source in sources:
+            if isinstance(source, ObservationType):
+                resolved.update(self.OBSERVATION_SOURCES[source])
+            elif source in self.ALL_SOURCES:
+                resolved.add(source)
+            else:
+                raise ValueError(f"Nieznane źródło danych: {source}")
+        
+        return resolved
+    
     async def get_weather_data(self, location: Dict[str, float]) -> Dict:
         """Pobierz dane pogodowe"""
         cache_key = f"weather_{location['lat']}_{location['lon']}"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
+        return await self._get_or_fetch(cache_key, "weather", lambda: self._fetch_weather(location),
+                                        {"weather": None})
+    
+    async def _fetch_weather(self, location: Dict[str, float]) -> Optional[Dict]:
+        url = "https://api.openweathermap.org/data/2.5/onecall"
+        params = {
+            'lat': location['lat'],
+            'lon': location['lon'],
+            'appid': OPENWEATHER_API_KEY,
+            'units': 'metric',
+            'exclude': 'minutely',
+            'lang': 'pl'
+        }
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                url = "https://api.openweathermap.org/data/2.5/onecall"
-                params = {
-                    'lat': location['lat'],
-                    'lon': location['lon'],
-                    'appid': OPENWEATHER_API_KEY,
-                    'units': 'metric',
-                    'exclude': 'minutely',
-                    'lang': 'pl'
-                }
-                
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        result = {
-                            "weather": {
-                                "current": data.get('current', {}),
-                                "hourly": data.get('hourly', [])[:12],
-                                "daily": data.get('daily', [])[:3],
-                                "alerts": data.get('alerts', [])
-                            }
-                        }
-                        
-                        self._cache_data(cache_key, result)
-                        return result
-        except:
-            pass
-        
-        return {"weather": None}
+        data = await self._get_json("weather", url, params)
+        
+        return {
+            "weather": {
+                "current": data.get('current', {}),
+                "hourly": data.get('hourly', [])[:12],
+                "daily": data.get('daily', [])[:3],
+                "alerts": data.get('alerts', [])
+            }
+        }
     
     async def get_earthquake_data(self) -> Dict:
         """Pobierz dane o trzęsieniach ziemi"""
-        cache_key = "earthquakes"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
+        return await self._get_or_fetch("earthquakes", "earthquakes", self._fetch_earthquakes, {"earthquakes": []})
+    
+    async def _fetch_earthquakes(self) -> Optional[Dict]:
+        url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+        params = {
+            "format": "geojson",
+            "starttime": (datetime.utcnow() - timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%S"),
+            "endtime": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+            "minmagnitude": 4.0,
+            "orderby": "time",
+            "limit": 20
+        }
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
-                params = {
-                    "format": "geojson",
-                    "starttime": (datetime.utcnow() - timedelta(hours=24)).strftime("%Y-%m-%dT%H:%M:%S"),
-                    "endtime": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
-                    "minmagnitude": 4.0,
-                    "orderby": "time",
-                    "limit": 20
-                }
-                
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        earthquakes = []
-                        for feature in data.get('features', []):
-                            props = feature['properties']
-                            coords = feature['geometry']['coordinates']
-                            
-                            earthquakes.append({
-                                'place': props['place'],
-                                'magnitude': props['mag'],
-                                'time': datetime.fromtimestamp(props['time'] / 1000),
-                                'lat': coords[1],
-                                'lon': coords[0],
-                                'depth': coords[2],
-                                'significance': props.get('sig', 0)
-                            })
-                        
-                        result = {"earthquakes": earthquakes}
-                        self._cache_data(cache_key, result)
-                        return result
-        except:
-            pass
-        
-        return {"earthquakes": []}
+        data = await self._get_json("earthquakes", url, params)
+        
+        earthquakes = []
+        for feature in data.get('features', []):
+            props = feature['properties']
+            coords = feature['geometry']['coordinates']
+            
+            earthquakes.append({
+                'place': props['place'],
+                'magnitude': props['mag'],
+                'time': datetime.fromtimestamp(props['time'] / 1000),
+                'lat': coords[1],
+                'lon': coords[0],
+                'depth': coords[2],
+                'significance': props.get('sig', 0)
+            })
+        
+        return {"earthquakes": earthquakes}
     
     async def get_asteroid_data(self) -> Dict:
         """Pobierz dane o asteroidach"""
-        cache_key = "asteroids"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
+        return await self._get_or_fetch("asteroids", "asteroids", self._fetch_asteroids, {"asteroids": []})
+    
+    async def _fetch_asteroids(self) -> Optional[Dict]:
+        start_date = datetime.now().strftime('%Y-%m-%d')
+        end_date = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+        
+        url = "https://api.nasa.gov/neo/rest/v1/feed"
+        params = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'api_key': NASA_API_KEY
+        }
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                start_date = datetime.now().strftime('%Y-%m-%d')
-                end_date = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
-                
-                url = "https://api.nasa.gov/neo/rest/v1/feed"
-                params = {
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'api_key': NASA_API_KEY
-                }
-                
-                async with session.get(url, params=params, timeout=15) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        asteroids = []
-                        for date in data.get('near_earth_objects', {}):
-                            for asteroid in data['near_earth_objects'][date]:
-                                for approach in asteroid.get('close_approach_data', []):
-                                    asteroids.append({
-                                        'name': asteroid['name'],
-                                        'hazardous': asteroid['is_potentially_hazardous_asteroid'],
-                                        'diameter_min': asteroid['estimated_diameter']['meters']['estimated_diameter_min'],
-                                        'diameter_max': asteroid['estimated_diameter']['meters']['estimated_diameter_max'],
-                                        'miss_distance_km': float(approach['miss_distance']['kilometers']),
-                                        'velocity_kps': float(approach['relative_velocity']['kilometers_per_second']),
-                                        'approach_time': approach['close_approach_date_full']
-                                    })
-                        
-                        result = {"asteroids": asteroids[:10]}
-                        self._cache_data(cache_key, result)
-                        return result
-        except:
-            pass
-        
-        return {"asteroids": []}
+        data = await self._get_json("asteroids", url, params)
+        
+        asteroids = []
+        for date in data.get('near_earth_objects', {}):
+            for asteroid in data['near_earth_objects'][date]:
+                for approach in asteroid.get('close_approach_data', []):
+                    asteroids.append({
+                        'name': asteroid['name'],
+                        'hazardous': asteroid['is_potentially_hazardous_asteroid'],
+                        'diameter_min': asteroid['estimated_diameter']['meters']['estimated_diameter_min'],
+                        'diameter_max': asteroid['estimated_diameter']['meters']['estimated_diameter_max'],
+                        'miss_distance_km': float(approach['miss_distance']['kilometers']),
+                        'velocity_kps': float(approach['relative_velocity']['kilometers_per_second']),
+                        'approach_time': approach['close_approach_date_full']
+                    })
+        
+        return {"asteroids": asteroids[:10]}
     
     async def get_satellite_passes(self, location: Dict[str, float]) -> Dict:
-        """Pobierz przeloty satelitów"""
-        cache_key = f"sat_passes_{location['lat']}_{location['lon']}"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
-        
-        # Obserwowane satelity
-        satellites = [
-            {"name": "ISS", "norad_id": 25544},
-            {"name": "Landsat 8", "norad_id": 39084},
-            {"name": "Sentinel-2A", "norad_id": 40697},
-            {"name": "Hubble", "norad_id": 20580},
-            {"name": "NOAA-20", "norad_id": 43013}
-        ]
+        """Pobierz przeloty satelitów (lokalnie z TLE, w razie braku - N2YO)"""
+        # Zaokrąglona lokalizacja - użytkownicy w pobliżu dzielą wpisy cache
+        lat = round(location['lat'], N2YO_LOCATION_PRECISION)
+        lon = round(location['lon'], N2YO_LOCATION_PRECISION)
+        
+        if self.pass_predictor.tles_ready():
+            passes = self._indexed_passes(location, datetime.utcnow())
+            if passes is not None:
+                return {"satellite_passes": passes[:10], "satellite_errors": self._missing_tle_errors()}
+            
+            return await self._get_or_fetch(
+                f"local_passes_{lat}_{lon}", "satellite_passes",
+                lambda: self._compute_local_passes(location),
+                {"satellite_passes": [], "satellite_errors": []}
+            )
+        
+        if not N2YO_API_KEY:
+            return {"satellite_passes": [], "satellite_errors": []}
+        
+        results = await asyncio.gather(*[
+            self._get_or_fetch(
+                f"n2yo_{sat['norad_id']}_{lat}_{lon}", "satellite_passes",
+                lambda sat=sat: self._fetch_n2yo_passes(sat, lat, lon),
+                {"passes": None}
+            )
+            for sat in self.TRACKED_SATELLITES
+        ])
         
         passes = []
+        errors = []
+        stale = {}  # satelita -> oznaczenie nieaktualności (ostatnie dobre dane lub brak)
+        
+        for sat, result in zip(self.TRACKED_SATELLITES, results):
+            marker = result.get("stale_data", {}).get("satellite_passes")
+            if marker is not None:
+                stale[sat['name']] = marker
+            
+            if result["passes"] is None:
+                key = f"n2yo_{sat['norad_id']}_{lat}_{lon}"
+                errors.append({
+                    "satellite": sat['name'],
+                    "norad_id": sat['norad_id'],
+                    "error": marker["reason"] if marker else self._fetch_errors.get(key, "Brak danych")
+                })
+            else:
+                passes.extend(result["passes"])
+        
+        passes.sort(key=lambda p: p['start_utc'])
+        
+        merged = {"satellite_passes": passes[:10], "satellite_errors": errors}
+        if stale:
+            # Jedno oznaczenie źródła: najstarsze dane (None gdy któregoś satelity brak) i powody per satelita
+            stored = [marker["stored_at"] for marker in stale.values()]
+            merged["stale_data"] = {"satellite_passes": {
+                "stored_at": None if None in stored else min(stored),
+                "reason": "; ".join(f"{name}: {marker['reason']}" for name, marker in stale.items())
+            }}
+        return merged
+    
+    async def _compute_local_passes(self, location: Dict[str, float]) -> Optional[Dict]:
+        passes = await self.pass_predictor.get_passes(location)
+        return {"satellite_passes": passes[:10], "satellite_errors": self._missing_tle_errors()}
+    
+    def _missing_tle_errors(self) -> List[Dict]:
+        return [
+            {"satellite": sat['name'], "norad_id": sat['norad_id'], "error": "Brak TLE"}
+            for sat in self.TRACKED_SATELLITES
+            if sat['norad_id'] not in self.pass_predictor.satellites
+        ]
+    
+    def register_locations(self, locations: Dict[str, Dict]):
+        """Predefiniowane lokalizacje, dla których przeloty są prekomputowane"""
+        self.pass_index.set_locations(locations)
+    
+    def _indexed_passes(self, location: Dict[str, float], start: datetime) -> Optional[List[Dict]]:
+        """Przeloty z indeksu (bez obliczeń) - None gdy lokalizacja/okno poza indeksem"""
+        self.schedule_pass_index_rebuild()
+        
+        key = self.pass_index.key_for(location)
+        if key is None:
+            return None
+        return self.pass_index.get_passes(key, start)
+    
+    def schedule_pass_index_rebuild(self) -> Optional[asyncio.Future]:
+        """Przelicz indeks w tle (poza ścieżką zapytania), jeśli jest nieaktualny"""
+        if self._pass_index_task is not None and not self._pass_index_task.done():
+            return self._pass_index_task
+        if not self.pass_index.needs_rebuild():
+            return None
+        
+        loop = asyncio.get_running_loop()
+        self._pass_index_task = loop.run_in_executor(None, self.pass_index.build)
+        return self._pass_index_task
+    
+    async def refresh_pass_index(self):
+        """Wczytaj/odśwież TLE i przelicz indeks przelotów (przy starcie i co tick prewarm)"""
+        if await self.pass_predictor.ensure_tles():
+            task = self.schedule_pass_index_rebuild()
+            if task is not None:
+                await task
+    
+    async def find_satellite_pass(self, query: str, location: Dict[str, float],
+                                  after: datetime) -> Optional[Dict]:
+        """Najbliższy przelot satelity pasującego do nazwy (np. "iss", "landsat") po danym czasie"""
+        if not self.pass_predictor.tles_ready():
+            return None
+        
+        def normalize(text: str) -> str:
+            return "".join(ch for ch in text.lower() if ch.isalnum())
         
-        for sat in satellites:
+        query = normalize(query)
+        passes = self._indexed_passes(location, after)
+        if passes is None:
+            passes = await self.pass_predictor.get_passes(location)
+        
+        for sat_pass in passes:
+            if query in normalize(sat_pass['satellite']) and sat_pass['end_utc'] >= after:
+                return sat_pass
+        
+        return None
+    
+    async def _fetch_n2yo_passes(self, sat: Dict, lat: float, lon: float) -> Optional[Dict]:
+        key = f"n2yo_{sat['norad_id']}_{lat}_{lon}"
+        
+        if self._n2yo_semaphore is None:
+            self._n2yo_semaphore = asyncio.Semaphore(N2YO_CONCURRENCY)
+        
+        async with self._n2yo_semaphore:
+            url = f"https://api.n2yo.com/rest/v1/satellite/radiopasses/{sat['norad_id']}/{lat}/{lon}/0/2/30"
             try:
-                if N2YO_API_KEY:
-                    url = f"https://api.n2yo.com/rest/v1/satellite/radiopasses/{sat['norad_id']}/{location['lat']}/{location['lon']}/0/2/30"
-                    params = {'apiKey': N2YO_API_KEY}
-                    
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(url, params=params, timeout=10) as response:
-                            if response.status == 200:
-                                data = await response.json()
-                                
-                                for pass_data in data.get('passes', []):
-                                    passes.append({
-                                        'satellite': sat['name'],
-                                        'start_utc': datetime.utcfromtimestamp(pass_data['startUTC']),
-                                        'max_elevation': pass_data['maxEl'],
-                                        'duration': pass_data['endUTC'] - pass_data['startUTC']
-                                    })
-            except:
-                continue
+                data = await self._get_json("n2yo", url, {'apiKey': N2YO_API_KEY})
+            except UpstreamError as e:
+                error = str(e)
+            else:
+                passes = []
+                for pass_data in data.get('passes', []):
+                    passes.append({
+                        'satellite': sat['name'],
+                        'start_utc': datetime.utcfromtimestamp(pass_data['startUTC']),
+                        'max_elevation': pass_data['maxEl'],
+                        'duration': pass_data['endUTC'] - pass_data['startUTC']
+                    })
+                
+                self._fetch_errors.pop(key)
+                return {"passes": passes}
         
-        result = {"satellite_passes": passes[:10]}
-        self._cache_data(cache_key, result)
-        return result
+        logger.warning(f"⚠️ N2YO: brak przelotów dla {sat['name']} ({sat['norad_id']}): {error}")
+        self._fetch_errors.set(key, error)
+        return None
     
     async def get_visibility_zones(self, location: Dict[str, float]) -> Dict:
         """Oblicz strefy widoczności dla satelitów"""
         cache_key = f"visibility_{location['lat']}_{location['lon']}"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
+        return await self._get_or_fetch(cache_key, "visibility_zones", lambda: self._compute_visibility_zones(location),
+                                        {"visibility_zones": []})
+    
+    async def _compute_visibility_zones(self, location: Dict[str, float]) -> Optional[Dict]:
+        if self.pass_predictor.tles_ready():
+            # Strefy z rzeczywistych przelotów: kulminacja, look angles, zasięg widoczności
+            passes = (await self.get_satellite_passes(location))["satellite_passes"]
+            
+            return {"visibility_zones": [
+                {
+                    'satellite': sat_pass['satellite'],
+                    'time_utc': sat_pass['culmination_utc'],
+                    'optimal_position': {'lat': location['lat'], 'lon': location['lon']},
+                    'look_angle': {
+                        'azimuth': sat_pass['culmination_azimuth'],
+                        'elevation': sat_pass['max_elevation']
+                    },
+                    'visibility_radius_km': round(self.pass_predictor.visibility_radius_km(sat_pass['altitude_km']), 1),
+                    'chance_percent': round(min(95.0, sat_pass['max_elevation'] / 90 * 100), 1)
+                }
+                for sat_pass in passes[:5]
+            ]}
         
-        # Symulacja stref widoczności
+        # Symulacja stref widoczności (brak skyfield lub TLE)
         zones = []
         now = datetime.utcnow()
         
@@ -359,40 +2016,24 @@ class UniversalDataCollector:
             }
             zones.append(zone)
         
-        result = {"visibility_zones": zones}
-        self._cache_data(cache_key, result)
-        return result
+        return {"visibility_zones": zones}
     
     async def get_apod_data(self) -> Dict:
         """Astronomy Picture of the Day"""
-        cache_key = "apod"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                url = "https://api.nasa.gov/planetary/apod"
-                params = {'api_key': NASA_API_KEY}
-                
-                async with session.get(url, params=params, timeout=15) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        result = {"apod": data}
-                        self._cache_data(cache_key, result)
-                        return result
-        except:
-            pass
-        
-        return {"apod": None}
+        return await self._get_or_fetch("apod", "apod", self._fetch_apod, {"apod": None})
+    
+    async def _fetch_apod(self) -> Optional[Dict]:
+        url = "https://api.nasa.gov/planetary/apod"
+        data = await self._get_json("apod", url, {'api_key': NASA_API_KEY})
+        return {"apod": data}
     
     async def get_space_weather(self) -> Dict:
         """Pogoda kosmiczna"""
-        cache_key = "space_weather"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
-        
+        return await self._get_or_fetch("space_weather", "space_weather", self._compute_space_weather, {"space_weather": None})
+    
+    async def _compute_space_weather(self) -> Optional[Dict]:
         # Symulacja danych o pogodzie kosmicznej
-        result = {
+        return {
             "space_weather": {
                 "solar_flares": random.randint(0, 3),
                 "geomagnetic_storm": random.choice(["quiet", "unsettled", "active", "storm"]),
@@ -400,64 +2041,677 @@ class UniversalDataCollector:
                 "aurora_chance": random.uniform(0, 100)
             }
         }
-        
-        self._cache_data(cache_key, result)
-        return result
     
     async def get_aurora_forecast(self) -> Dict:
         """Prognoza zorzy polarnej"""
-        cache_key = "aurora"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
-        
-        result = {
+        return await self._get_or_fetch("aurora", "aurora", self._compute_aurora_forecast, {"aurora": None})
+    
+    async def _compute_aurora_forecast(self) -> Optional[Dict]:
+        return {
             "aurora": {
                 "forecast": random.uniform(0, 100),
                 "visibility_lat": random.uniform(50, 70),
                 "best_time": (datetime.now() + timedelta(hours=random.randint(0, 12))).strftime("%H:%M")
             }
         }
+    
+    async def get_meteor_showers(self) -> Dict:
+        """Deszcze meteorów"""
+        return await self._get_or_fetch("meteors", "meteors", self._compute_meteor_showers, {"meteors": None})
+    
+    async def _compute_meteor_showers(self) -> Optional[Dict]:
+        showers = [
+            {"name": "Perseidy", "peak": "2024-08-12", "rate_per_hour": 100, "active": True},
+            {"name": "Geminidy", "peak": "2024-12-14", "rate_per_hour": 150, "active": False},
+            {"name": "Kwadrantydy", "peak": "2024-01-03", "rate_per_hour": 120, "active": False}
+        ]
         
-        self._cache_data(cache_key, result)
-        return result
+        return {"meteors": showers}
+    
+    async def _get_or_fetch(self, key: str, source: str, fetcher, fallback: Dict) -> Dict:
+        """Zwróć dane z cache albo pobierz je - jedno zapytanie na klucz naraz (single-flight)"""
+        started = time.perf_counter()
+        entry = self.cache.get_entry(key)
+        
+        if entry is not None:
+            cached, stored_at = entry
+            age = time.time() - stored_at
+            ttl = self.get_ttl(source)
+            
+            if age < ttl:
+                self.stats["hits"] += 1
+                COLLECTOR_SECONDS.observe(time.perf_counter() - started, source, "hit")
+                return cached
+            
+            if age < ttl * (1 + self.STALE_FACTOR):
+                # Stale-while-revalidate: od razu stare dane, odświeżenie w tle
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self.stats["refreshes"] += 1
+                    self._start_fetch(key, source, fetcher)
+                COLLECTOR_SECONDS.observe(time.perf_counter() - started, source, "stale")
+                return cached
+        
+        task = self._inflight.get(key)
+        if task is not None:
+            # Ktoś już pobiera te dane - czekamy na ten sam wynik
+            self.stats["coalesced"] += 1
+            outcome = "coalesced"
+        else:
+            self.stats["misses"] += 1
+            outcome = "miss"
+            task = self._start_fetch(key, source, fetcher)
+        
+        # shield: anulowanie jednego oczekującego nie przerywa wspólnego pobierania
+        deadline = _collect_deadline.get()
+        try:
+            if deadline is None:
+                result = await asyncio.shield(task)
+            else:
+                remaining = deadline - asyncio.get_running_loop().time()
+                result = await asyncio.wait_for(asyncio.shield(task), max(0.0, remaining))
+        except asyncio.TimeoutError:
+            # Budżet collect_all_data minął - pobieranie trwa w tle i zasili cache na następny raz
+            self.stats["deadline_misses"] += 1
+            COLLECTOR_SECONDS.observe(time.perf_counter() - started, source, "deadline")
+            return self._last_known_good(key, source, fallback, "przekroczony budżet czasu")
+        
+        COLLECTOR_SECONDS.observe(time.perf_counter() - started, source, outcome)
+        return result if result is not None else self._last_known_good(key, source, fallback)
+    
+    def _last_known_good(self, key: str, source: str, fallback: Dict, reason: Optional[str] = None) -> Dict:
+        """Ostatnie udane dane (także spoza okna stale) z oznaczeniem nieaktualności - albo fallback"""
+        reason = reason or self._fetch_errors.get(key, "źródło niedostępne")
+        entry = self.cache.get_entry(key)
+        if entry is None:
+            return {**fallback, "stale_data": {source: {"stored_at": None, "reason": reason}}}
+        
+        data, stored_at = entry
+        self.stats["stale_fallbacks"] += 1
+        return {**data, "stale_data": {source: {
+            "stored_at": datetime.fromtimestamp(stored_at).isoformat(timespec="seconds"),
+            "reason": reason
+        }}}
+    
+    async def _get_json(self, source: str, url: str, params: Dict) -> Any:
+        """GET zewnętrznego API z timeoutem z rozkładu czasów źródła (opcjonalnie z hedgingiem)
+        
+        HEDGE_REQUESTS=1: gdy odpowiedź nie przyszła w czasie p95, wysyłamy drugie takie samo
+        zapytanie i bierzemy pierwszą udaną odpowiedź (drugą anulujemy).
+        """
+        hedge_after = self.latency.hedge_delay(source) if HEDGE_REQUESTS else None
+        if hedge_after is None:
+            return await self._get_json_once(source, url, params)
+        
+        first = asyncio.ensure_future(self._get_json_once(source, url, params))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                self.stats["hedged"] += 1
+                pending.add(asyncio.ensure_future(self._get_json_once(source, url, params)))
+            
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def _get_json_once(self, source: str, url: str, params: Dict) -> Any:
+        """Jedno zapytanie GET przez bezpiecznik hosta - JSON albo UpstreamError
+        
+        Błędy sieci, timeouty, 5xx i 429 liczą się jako awarie hosta; pozostałe 4xx
+        (np. zły klucz API) nie otwierają obwodu, ale też kończą się UpstreamError.
+        """
+        breaker = circuit_breakers.for_url(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{breaker.host}: obwód otwarty")
+        
+        try:
+            session = await self.http.get_session()
+            timeout = self.latency.timeout_for(source)
+            started = time.perf_counter()
+            async with session.get(url, params=params, timeout=timeout) as response:
+                status = response.status
+                data = await response.json() if status == 200 else None
+            if status == 200:
+                self.latency.record(source, time.perf_counter() - started)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self.latency.record_timeout(source, timeout)
+            reason = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            breaker.record_failure(reason)
+            raise UpstreamError(reason) from e
+        except BaseException:
+            breaker.abandon()
+            raise
+        
+        if status >= 500 or status == 429:
+            breaker.record_failure(f"HTTP {status}")
+            raise UpstreamError(f"HTTP {status}")
+        
+        breaker.record_success()
+        if status != 200:
+            raise UpstreamError(f"HTTP {status}")
+        return data
+    
+    def _start_fetch(self, key: str, source: str, fetcher, fresh_for: float = 0) -> asyncio.Future:
+        """Uruchom pobieranie w tle i zarejestruj je jako trwające"""
+        task = asyncio.ensure_future(self._fetch_and_cache(key, source, fetcher, fresh_for))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._on_fetch_done(key, t))
+        return task
+    
+    def _on_fetch_done(self, key: str, task: asyncio.Future):
+        """Usuń zakończone pobieranie z listy trwających"""
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ Błąd pobierania {key}: {task.exception()}")
+    
+    async def _fetch_and_cache(self, key: str, source: str, fetcher, fresh_for: float = 0) -> Optional[Dict]:
+        """Pobierz dane (najpierw z cache L2) i zapisz w cache tylko udane wyniki
+        
+        fresh_for: wpis z L2 musi być ważny jeszcze co najmniej tyle sekund (prewarm)
+        """
+        # Wspólne pobieranie nie podlega terminowi komendy, która je uruchomiła - wynik trafia do cache
+        _collect_deadline.set(None)
+        
+        locked = False
+        if self.shared_cache is not None:
+            shared, locked = await self._shared_lookup(key, source, fresh_for)
+            if shared is not None:
+                return shared
+        
+        try:
+            with UPSTREAM_SECONDS.time(source, "ok") as span:
+                try:
+                    result = await fetcher()
+                except CircuitOpenError as e:
+                    span.labels = (source, "circuit_open")
+                    self._fetch_errors.set(key, str(e))
+                    result = None
+                except Exception as e:
+                    # Błąd API lub nieoczekiwany format odpowiedzi - wołający dostanie ostatnie dobre dane
+                    span.labels = (source, "error")
+                    error = str(e) if isinstance(e, UpstreamError) else f"{type(e).__name__}: {e}"
+                    logger.warning(f"⚠️ Pobieranie {key} nieudane: {error}")
+                    self._fetch_errors.set(key, error)
+                    result = None
+                else:
+                    if result is None:
+                        span.labels = (source, "empty")
+            if result is not None:
+                self._fetch_errors.pop(key)
+                self._cache_data(key, result)
+                await self._write_shared(key, source, result)
+            return result
+        finally:
+            if locked:
+                await self._release_shared_lock(key)
+    
+    async def _shared_lookup(self, key: str, source: str, fresh_for: float = 0) -> Tuple[Optional[Dict], bool]:
+        """Świeże dane z L2 albo blokada odświeżania (True = ten worker pobiera)
+        
+        Gdy blokadę ma inny worker, czekamy na jego wynik w L2; po SHARED_CACHE_LOCK_TTL
+        pobieramy sami (worker z blokadą mógł paść).
+        """
+        deadline = time.monotonic() + SHARED_CACHE_LOCK_TTL
+        waited = False
+        
+        try:
+            while True:
+                shared = await self._read_shared(key, source, fresh_for)
+                if shared is not None:
+                    return shared, False
+                if await self.shared_cache.acquire_lock(key, self._lock_owner, SHARED_CACHE_LOCK_TTL):
+                    return None, True
+                if not waited:
+                    self.stats["lock_waits"] += 1
+                    waited = True
+                if time.monotonic() >= deadline:
+                    return None, False
+                await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+        except Exception as e:
+            logger.warning(f"⚠️ Cache L2 niedostępny ({key}): {e}")
+            return None, False
+    
+    async def _read_shared(self, key: str, source: str, fresh_for: float = 0) -> Optional[Dict]:
+        """Świeży wpis z L2 - trafia też do cache w pamięci (z oryginalnym czasem zapisu)"""
+        entry = await self.shared_cache.get(key)
+        if entry is None:
+            return None
+        
+        raw, stored_at = entry
+        if time.time() - stored_at >= self.get_ttl(source) - fresh_for:
+            return None
+        
+        data = decode_state(raw)
+        self.cache.set(key, data, stored_at=stored_at)
+        self.stats["l2_hits"] += 1
+        return data
+    
+    async def _write_shared(self, key: str, source: str, data: Dict):
+        if self.shared_cache is None:
+            return
+        try:
+            keep_for = self.get_ttl(source) * (1 + self.STALE_FACTOR)
+            await self.shared_cache.set(key, encode_state(data), time.time(), keep_for)
+        except Exception as e:
+            logger.warning(f"⚠️ Nie udało się zapisać {key} w cache L2: {e}")
+    
+    async def _release_shared_lock(self, key: str):
+        try:
+            await self.shared_cache.release_lock(key, self._lock_owner)
+        except Exception as e:
+            logger.warning(f"⚠️ Nie udało się zwolnić blokady {key}: {e}")
+    
+    async def close(self):
+        """Zamknij połączenie z cache L2"""
+        if self.shared_cache is not None:
+            await self.shared_cache.close()
+    
+    def get_ttl(self, source: str) -> float:
+        """TTL dla danego źródła danych"""
+        return self.CACHE_TTL.get(source, self.CACHE_DURATION)
+    
+    def expires_in(self, key: str, source: str) -> float:
+        """Sekundy do wygaśnięcia wpisu cache (0 gdy brak lub już wygasł)"""
+        stored_at = self.cache.stored_at(key)
+        if stored_at is None:
+            return 0.0
+        return max(0.0, stored_at + self.get_ttl(source) - time.time())
+    
+    async def prewarm(self, source: str, lead: float = PREWARM_LEAD_SECONDS) -> bool:
+        """Odśwież globalne źródło, jeśli wygasa w ciągu `lead` sekund (True = pobrano)"""
+        # Przy krótkich TTL wyprzedzenie to najwyżej połowa TTL - bez odświeżania w kółko
+        lead = min(lead, self.get_ttl(source) / 2)
+        if self.expires_in(source, source) > lead:
+            return False
+        
+        task = self._inflight.get(source)
+        if task is None:
+            self.stats["prewarms"] += 1
+            # Inny worker mógł już odświeżyć źródło - wpis z L2 wystarczy, jeśli nie wygasa w ciągu `lead`
+            task = self._start_fetch(source, source, getattr(self, self.GLOBAL_FETCHERS[source]), fresh_for=lead)
+        
+        return await asyncio.shield(task) is not None
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Liczniki cache: trafienia, chybienia i połączone oczekiwania"""
+        return {
+            **self.stats,
+            "inflight": len(self._inflight),
+            "entries": len(self.cache),
+            "bytes": self.cache.total_bytes,
+            "evictions": self.cache.stats["evictions"],
+            "expirations": self.cache.stats["expirations"]
+        }
+    
+    def _cache_data(self, key: str, data: Dict):
+        """Zapisz dane w cache"""
+        self.cache.set(key, data)
+
+# ====================== DEEPSEEK AI ORCHESTRATOR ======================
+
+class LLMResponseCache:
+    """Cache odpowiedzi LLM adresowany treścią: hash(model, messages, max_tokens, temperature)"""
+    
+    def __init__(self, ttl: float = LLM_CACHE_TTL, cache_dir: str = LLM_CACHE_DIR):
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.memory = BoundedCache(
+            max_entries=LLM_CACHE_MAX_ENTRIES,
+            max_bytes=LLM_CACHE_MAX_BYTES,
+            max_age=ttl
+        )
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = defaultdict(int)
+        self.stats = {
+            "hits": 0, "misses": 0, "coalesced": 0, "disk_hits": 0,
+            "tokens_used": 0, "tokens_saved": 0,
+            "latency_s": 0.0, "latency_saved_s": 0.0
+        }
+        
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(payload: Dict) -> str:
+        """Klucz = SHA-256 z modelu, wiadomości, max_tokens i temperatury"""
+        material = {
+            "model": payload.get("model"),
+            "messages": payload.get("messages"),
+            "max_tokens": payload.get("max_tokens"),
+            "temperature": payload.get("temperature")
+        }
+        raw = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    async def get_or_call(self, key: str, call) -> Optional[str]:
+        """Zwróć odpowiedź z cache albo wywołaj LLM - identyczne zapytania czekają na jedno wywołanie"""
+        entry = self.get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            self._count_saved(entry)
+            return entry["content"]
+        
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        
+        if coalesced:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._call_and_store(key, call))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        
+        self._waiters[key] += 1
+        try:
+            entry = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Ostatni czekający anulowany (np. komenda zastąpiona nowszą) - przerywamy wywołanie LLM
+            if self._waiters[key] == 1:
+                task.cancel()
+                self._forget(key, task)
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if self._waiters[key] <= 0:
+                del self._waiters[key]
+        
+        if entry is None:
+            return None
+        
+        if coalesced:
+            self._count_saved(entry)
+        return entry["content"]
+    
+    async def _call_and_store(self, key: str, call) -> Optional[Dict]:
+        entry = await call()
+        if entry is not None:
+            self.stats["tokens_used"] += entry["tokens"]
+            self.stats["latency_s"] += entry["latency"]
+            self.set(key, entry)
+        return entry
+    
+    def _forget(self, key: str, task: asyncio.Future):
+        """Usuń wywołanie z trwających (tylko jeśli nie zastąpiło go już nowsze)"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
     
-    async def get_meteor_showers(self) -> Dict:
-        """Deszcze meteorów"""
-        cache_key = "meteors"
-        if self._is_cached(cache_key):
-            return self.cache[cache_key]
+    def _count_saved(self, entry: Dict):
+        self.stats["tokens_saved"] += entry["tokens"]
+        self.stats["latency_saved_s"] += entry["latency"]
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Wpis z pamięci, a gdy brak - z dysku (jeśli włączony)"""
+        entry = self.memory.get(key)
+        if entry is not None or not self.cache_dir:
+            return entry
         
-        showers = [
-            {"name": "Perseidy", "peak": "2024-08-12", "rate_per_hour": 100, "active": True},
-            {"name": "Geminidy", "peak": "2024-12-14", "rate_per_hour": 150, "active": False},
-            {"name": "Kwadrantydy", "peak": "2024-01-03", "rate_per_hour": 120, "active": False}
-        ]
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if time.time() - stored["stored_at"] > self.ttl:
+            return None
         
-        result = {"meteors": showers}
-        self._cache_data(cache_key, result)
-        return result
+        self.stats["disk_hits"] += 1
+        self.memory.set(key, stored["entry"], stored_at=stored["stored_at"])
+        return stored["entry"]
     
-    def _is_cached(self, key: str) -> bool:
-        """Sprawdź czy dane są w cache"""
-        if key in self.cache and key in self.cache_time:
-            elapsed = time.time() - self.cache_time[key]
-            return elapsed < self.CACHE_DURATION
-        return False
+    def set(self, key: str, entry: Dict):
+        """Zapisz wpis w pamięci i na dysku (jeśli włączony)"""
+        stored_at = time.time()
+        self.memory.set(key, entry, stored_at=stored_at)
+        
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            try:
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump({"stored_at": stored_at, "entry": entry}, f, ensure_ascii=False)
+                os.replace(f"{path}.tmp", path)
+            except OSError as e:
+                logger.warning(f"⚠️ Nie udało się zapisać cache LLM: {e}")
     
-    def _cache_data(self, key: str, data: Dict):
-        """Zapisz dane w cache"""
-        self.cache[key] = data
-        self.cache_time[key] = time.time()
+    def get_stats(self) -> Dict[str, Any]:
+        """Metryki: trafienia, połączone zapytania, zaoszczędzone tokeny i czas"""
+        return {**self.stats, "inflight": len(self._inflight), **{
+            f"memory_{name}": value for name, value in self.memory.get_stats().items()
+        }}
+
+
+class PromptContextBuilder:
+    """Kompaktowy kontekst danych do promptów - projekcja pól, zwarty JSON i budżet tokenów"""
+
+    # Budżet tokenów kontekstu dla szablonu
+    TOKEN_BUDGETS = {
+        "answer_question": 1200,
+        "opportunity_analysis": 600,
+        "default": 1000
+    }
+
+    # Kolejność ważności źródeł - obcinane są od końca
+    SOURCE_PRIORITY = [
+        "weather", "satellite_passes", "visibility_zones", "aurora", "space_weather",
+        "earthquakes", "asteroids", "meteors", "apod", "satellite_errors"
+    ]
+
+    HOURLY_LIMIT = 6
+    LIST_LIMIT = 5
+    TEXT_LIMIT = 300
+
+    def __init__(self, chars_per_token: float = PROMPT_CHARS_PER_TOKEN,
+                 budget_scale: float = PROMPT_BUDGET_SCALE):
+        self.chars_per_token = chars_per_token
+        self.budget_scale = budget_scale
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "prompt_tokens": 0, "contexts": 0, "context_tokens": 0, "truncated": 0}
+        )
+
+    def estimate_tokens(self, text: str) -> int:
+        """Szacowana liczba tokenów tekstu"""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def budget_for(self, template: str) -> int:
+        return int(self.TOKEN_BUDGETS.get(template, self.TOKEN_BUDGETS["default"]) * self.budget_scale)
+
+    def build(self, data: Dict, template: str = "default") -> str:
+        """Zwarty JSON kontekstu mieszczący się w budżecie szablonu"""
+        context = self.project(data)
+        budget = self.budget_for(template)
+        truncated = False
+        text = self.serialize(context)
+
+        while self.estimate_tokens(text) > budget:
+            if not self._shrink(context):
+                break
+            truncated = True
+            text = self.serialize(context)
+
+        stats = self.stats[template]
+        stats["contexts"] += 1
+        stats["context_tokens"] += self.estimate_tokens(text)
+        stats["truncated"] += int(truncated)
+        return text
+
+    def record_prompt(self, template: str, messages: List[Dict]) -> int:
+        """Zapisz szacowany rozmiar całego promptu wysyłanego do modelu"""
+        tokens = sum(self.estimate_tokens(message["content"]) for message in messages)
+        self.stats[template]["calls"] += 1
+        self.stats[template]["prompt_tokens"] += tokens
+        return tokens
+
+    def project(self, data: Dict) -> Dict:
+        """Zostaw tylko pola istotne dla analizy (zagnieżdżone relevant_data też)"""
+        projected = {}
+        for name, value in data.items():
+            if value in (None, [], {}):
+                continue
+            if name == "relevant_data" and isinstance(value, dict):
+                projected[name] = self.project(value)
+                continue
+            projector = getattr(self, f"_project_{name}", None)
+            projected[name] = projector(value) if projector else self._compact(value)
+        return projected
+
+    @staticmethod
+    def serialize(context: Any) -> str:
+        return json.dumps(context, ensure_ascii=False, separators=(',', ':'), default=str)
+
+    def _shrink(self, context: Dict) -> bool:
+        """Jeden krok obcinania: najpierw listy najmniej ważnych źródeł, potem całe źródła"""
+        sections = [context]
+        if isinstance(context.get("relevant_data"), dict):
+            sections.insert(0, context["relevant_data"])
+
+        for section in sections:
+            for name in self._by_priority(section):
+                if self._drop_tail(section[name]):
+                    return True
+
+        for section in sections:
+            names = self._by_priority(section)
+            if names:
+                del section[names[0]]
+                section.setdefault("pominięto", []).append(names[0])
+                return True
+
+        return False
+
+    def _by_priority(self, section: Dict) -> List[str]:
+        """Źródła danych sekcji od najmniej ważnego"""
+        names = [name for name in section if name in self.SOURCE_PRIORITY]
+        return sorted(names, key=self.SOURCE_PRIORITY.index, reverse=True)
+
+    @staticmethod
+    def _drop_tail(value: Any) -> bool:
+        """Usuń ostatni element najdłuższej listy w wartości"""
+        if isinstance(value, list):
+            if len(value) > 1:
+                value.pop()
+                return True
+            return False
+        if isinstance(value, dict):
+            lists = [item for item in value.values() if isinstance(item, list) and len(item) > 1]
+            if lists:
+                max(lists, key=len).pop()
+                return True
+        return False
+
+    def _compact(self, value: Any) -> Any:
+        """Zaokrąglenia, krótkie daty i przycięte teksty"""
+        if isinstance(value, float):
+            return round(value, 2)
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M")
+        if isinstance(value, str) and len(value) > self.TEXT_LIMIT:
+            return value[:self.TEXT_LIMIT] + "…"
+        if isinstance(value, dict):
+            return {key: self._compact(item) for key, item in value.items() if item is not None}
+        if isinstance(value, list):
+            return [self._compact(item) for item in value[:self.LIST_LIMIT * 2]]
+        return value
+
+    def _pick(self, item: Dict, fields: List[str]) -> Dict:
+        return {field: self._compact(item[field]) for field in fields if item.get(field) is not None}
+
+    def _project_weather(self, weather: Dict) -> Dict:
+        def describe(entry: Dict) -> Optional[str]:
+            conditions = entry.get("weather") or [{}]
+            return conditions[0].get("description")
+
+        current = weather.get("current", {})
+        projected = {"current": {
+            **self._pick(current, ["temp", "feels_like", "humidity", "clouds", "wind_speed", "visibility", "pressure"]),
+            "opis": describe(current)
+        }}
+        projected["hourly"] = [
+            [datetime.fromtimestamp(hour["dt"]).strftime("%H:%M") if "dt" in hour else None,
+             self._compact(hour.get("temp")), hour.get("clouds"), self._compact(hour.get("pop"))]
+            for hour in weather.get("hourly", [])[:self.HOURLY_LIMIT]
+        ]
+        if projected["hourly"]:
+            projected["hourly_pola"] = "godz,temp,chmury,opady"
+        projected["daily"] = [
+            {"min": self._compact(day.get("temp", {}).get("min")),
+             "max": self._compact(day.get("temp", {}).get("max")),
+             "chmury": day.get("clouds")}
+            for day in weather.get("daily", [])
+        ]
+        alerts = [alert.get("event") for alert in weather.get("alerts", []) if alert.get("event")]
+        if alerts:
+            projected["alerts"] = alerts
+        return projected
+
+    def _project_earthquakes(self, earthquakes: List[Dict]) -> List[Dict]:
+        strongest = sorted(earthquakes, key=lambda eq: eq.get("magnitude") or 0, reverse=True)
+        return [self._pick(eq, ["place", "magnitude", "depth", "time"]) for eq in strongest[:self.LIST_LIMIT]]
+
+    def _project_asteroids(self, asteroids: List[Dict]) -> List[Dict]:
+        closest = sorted(asteroids, key=lambda a: (not a.get("hazardous"), a.get("miss_distance_km", 0)))
+        return [
+            {**self._pick(asteroid, ["name", "hazardous", "velocity_kps", "approach_time"]),
+             "diameter_m": round(asteroid.get("diameter_max", 0)),
+             "miss_mln_km": round(asteroid.get("miss_distance_km", 0) / 1_000_000, 2)}
+            for asteroid in closest[:self.LIST_LIMIT]
+        ]
+
+    def _project_satellite_passes(self, passes: List[Dict]) -> List[Dict]:
+        return [
+            self._pick(sat_pass, ["satellite", "start_utc", "culmination_utc", "max_elevation",
+                                  "duration", "culmination_azimuth"])
+            for sat_pass in passes[:self.LIST_LIMIT]
+        ]
+
+    def _project_visibility_zones(self, zones: List[Dict]) -> List[Dict]:
+        return [self._pick(zone, ["satellite", "time_utc", "chance_percent"]) for zone in zones[:self.LIST_LIMIT]]
+
+    def _project_satellite_errors(self, errors: List[Dict]) -> List[str]:
+        return [error.get("satellite") for error in errors]
+
+    def _project_apod(self, apod: Dict) -> Dict:
+        return self._pick(apod, ["title", "date", "media_type", "explanation"])
+
+    def _project_meteors(self, showers: List[Dict]) -> List[Dict]:
+        return [self._pick(shower, ["name", "peak", "rate_per_hour", "active"]) for shower in showers]
+
+    def _project_location(self, location: Dict) -> Dict:
+        return self._pick(location, ["name", "lat", "lon"])
+
+    _project_user_location = _project_location
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Wywołania, szacowane tokeny promptów i kontekstu oraz obcięcia per szablon"""
+        return {template: dict(stats) for template, stats in self.stats.items()}
 
-# ====================== DEEPSEEK AI ORCHESTRATOR ======================
 
 class DeepSeekOrchestrator:
     """Centralny mózg systemu - analizuje WSZYSTKO i daje inteligentne rekomendacje"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, http: Optional[HttpSessionManager] = None,
+                 data_collector: Optional[UniversalDataCollector] = None):
         self.api_key = api_key
         self.base_url = "https://api.deepseek.com/v1/chat/completions"
         self.available = bool(api_key)
+        self.http = http or HttpSessionManager()
+        self.data_collector = data_collector or UniversalDataCollector(self.http)
+        self.response_cache = LLMResponseCache()
+        self.prompt_builder = PromptContextBuilder()
+        # Timeout DeepSeek z rozkładu czasów (maks. 60 s); odpowiedzi są długie, więc wyższa dolna granica
+        self.latency = LatencyTracker({"deepseek": 60}, minimum=15)
         
         # Prompt templates dla różnych scenariuszy
         self.prompt_templates = {
@@ -557,7 +2811,8 @@ class DeepSeekOrchestrator:
             """
         }
     
-    async def analyze_all_data(self, all_data: Dict, user_context: str = "") -> AIAnalysis:
+    async def analyze_all_data(self, all_data: Dict, user_context: str = "",
+                               on_progress=None) -> AIAnalysis:
         """Przeanalizuj WSZYSTKIE dane i przygotuj kompletny raport"""
         if not self.available:
             return self._generate_mock_analysis(all_data)
@@ -571,11 +2826,13 @@ class DeepSeekOrchestrator:
                 user_context=user_context
             )
             
-            response = await self._call_deepseek(prompt, max_tokens=2000)
+            response = await self._call_deepseek(prompt, max_tokens=2000, on_progress=on_progress,
+                                                 template="full_analysis")
             
             if response:
                 # Parsuj odpowiedź
-                analysis = self._parse_ai_response(response, all_data)
+                with LLM_PARSE_SECONDS.time():
+                    analysis = self._parse_ai_response(response, all_data)
                 return analysis
             else:
                 return self._generate_mock_analysis(all_data)
@@ -592,12 +2849,12 @@ class DeepSeekOrchestrator:
         
         try:
             prompt = self.prompt_templates["opportunity_analysis"].format(
-                opportunity_data=json.dumps(opportunity_data, indent=2),
-                weather_data=json.dumps(weather_data, indent=2),
-                additional_factors=json.dumps(context, indent=2)
+                opportunity_data=self.prompt_builder.build(opportunity_data, "opportunity_analysis"),
+                weather_data=self.prompt_builder.build({"weather": weather_data}, "opportunity_analysis"),
+                additional_factors=self.prompt_builder.build(context, "opportunity_analysis")
             )
             
-            response = await self._call_deepseek(prompt, max_tokens=1500)
+            response = await self._call_deepseek(prompt, max_tokens=1500, template="opportunity_analysis")
             
             if response:
                 return {"analysis": response}
@@ -608,10 +2865,10 @@ class DeepSeekOrchestrator:
             print(f"Opportunity analysis error: {e}")
             return self._mock_opportunity_analysis(opportunity_data)
     
-    async def generate_daily_briefing(self, location: Dict[str, float]) -> Dict:
-        """Wygeneruj codzienne podsumowanie dla lokalizacji"""
-        collector = UniversalDataCollector()
-        all_data = await collector.collect_all_data(location)
+    async def generate_daily_briefing(self, location: Dict[str, float],
+                                      deadline: float = COLLECT_DEADLINE) -> Dict:
+        """Wygeneruj codzienne podsumowanie dla lokalizacji (deadline=0 - czekaj na wszystkie źródła)"""
+        all_data = await self.data_collector.collect_all_data(location, deadline=deadline)
         
         analysis = await self.analyze_all_data(all_data, f"Dzienne podsumowanie dla lokalizacji: {location}")
         
@@ -627,9 +2884,12 @@ class DeepSeekOrchestrator:
             "best_times": self._calculate_best_times(all_data)
         }
         
+        if all_data.get("stale_data"):
+            briefing["stale_data"] = all_data["stale_data"]
+        
         return briefing
     
-    async def answer_question(self, question: str, context_data: Dict) -> Dict:
+    async def answer_question(self, question: str, context_data: Dict, on_progress=None) -> Dict:
         """Odpowiedz na dowolne pytanie na podstawie danych"""
         if not self.available:
             return {"answer": "DeepSeek API nie jest dostępne"}
@@ -641,7 +2901,7 @@ class DeepSeekOrchestrator:
             PYTANIE UŻYTKOWNIKA: {question}
             
             DOSTĘPNE DANE KONTEKSTOWE:
-            {json.dumps(context_data, indent=2)}
+            {self.prompt_builder.build(context_data, "answer_question")}
             
             ODPOWIEDZ:
             1. Bezpośrednio na pytanie
@@ -650,7 +2910,8 @@ class DeepSeekOrchestrator:
             4. Zaproponuj alternatywy jeśli pytanie nie ma rozwiązania
             """
             
-            response = await self._call_deepseek(prompt, max_tokens=1000)
+            response = await self._call_deepseek(prompt, max_tokens=1000, on_progress=on_progress,
+                                                 template="answer_question")
             
             if response:
                 return {
@@ -665,37 +2926,167 @@ class DeepSeekOrchestrator:
             print(f"Question answering error: {e}")
             return {"answer": f"Błąd analizy: {str(e)}"}
     
-    async def _call_deepseek(self, prompt: str, max_tokens: int = 1000) -> Optional[str]:
-        """Wywołaj API DeepSeek"""
+    async def _call_deepseek(self, prompt: str, max_tokens: int = 1000,
+                             on_progress=None, template: str = "custom") -> Optional[str]:
+        """Wywołaj API DeepSeek (z cache odpowiedzi i łączeniem identycznych zapytań)
+        
+        on_progress: korutyna wołana z dotychczasowym tekstem w trakcie streamingu
+        template: nazwa szablonu do statystyk rozmiaru promptów
+        """
+        payload = self._build_payload(prompt, max_tokens)
+        key = LLMResponseCache.make_key(payload)
+        
+        tokens = self.prompt_builder.record_prompt(template, payload["messages"])
+        logger.info(f"🧮 Prompt {template}: ~{tokens} tokenów wejścia")
+        
+        with LLM_CALL_SECONDS.time(template):
+            if on_progress is not None and DEEPSEEK_STREAMING:
+                return await self.response_cache.get_or_call(key, lambda: self._stream_deepseek(payload, on_progress))
+            
+            return await self.response_cache.get_or_call(key, lambda: self._post_deepseek(payload))
+    
+    def _build_payload(self, prompt: str, max_tokens: int) -> Dict:
+        """Treść zapytania do DeepSeek"""
+        return {
+            "model": "deepseek-chat",
+            "messages": [
+                {"role": "system", "content": "Jesteś głównym analitykiem AI-Powered Earth Observatory. Jesteś ekspertem od obserwacji Ziemi, astrofotografii, meteorologii i nauk o Ziemi."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.7
+        }
+    
+    def _breaker(self) -> Optional[CircuitBreaker]:
+        """Bezpiecznik DeepSeek (None = obwód otwarty, wywołanie pomijamy - analiza zastępcza)"""
+        breaker = circuit_breakers.for_url(self.base_url)
+        if not breaker.allow():
+            logger.info("🔌 DeepSeek: obwód otwarty - pomijam wywołanie")
+            return None
+        return breaker
+    
+    async def _post_deepseek(self, payload: Dict) -> Optional[Dict]:
+        """Wyślij zapytanie do DeepSeek - zwraca treść, zużyte tokeny i czas odpowiedzi"""
+        breaker = self._breaker()
+        if breaker is None:
+            return None
+        
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
             
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "system", "content": "Jesteś głównym analitykiem AI-Powered Earth Observatory. Jesteś ekspertem od obserwacji Ziemi, astrofotografii, meteorologii i nauk o Ziemi."},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7
+            timeout = self.latency.timeout_for("deepseek")
+            started = time.perf_counter()
+            session = await self.http.get_session()
+            async with session.post(self.base_url, json=payload, headers=headers,
+                                    timeout=timeout) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    breaker.record_success()
+                    self.latency.record("deepseek", time.perf_counter() - started)
+                    return {
+                        "content": result['choices'][0]['message']['content'],
+                        "tokens": result.get('usage', {}).get('total_tokens', 0),
+                        "latency": time.perf_counter() - started
+                    }
+                else:
+                    print(f"DeepSeek API error: {response.status}")
+                    self._record_status(breaker, response.status)
+                    return None
+        
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        except Exception as e:
+            print(f"DeepSeek call error: {e}")
+            if isinstance(e, asyncio.TimeoutError):
+                self.latency.record_timeout("deepseek", timeout)
+            breaker.record_failure(type(e).__name__)
+            return None
+    
+    @staticmethod
+    def _record_status(breaker: CircuitBreaker, status: int):
+        """5xx i 429 to awaria hosta; inne 4xx (np. zły klucz) nie otwierają obwodu"""
+        if status >= 500 or status == 429:
+            breaker.record_failure(f"HTTP {status}")
+        else:
+            breaker.record_success()
+    
+    async def _stream_deepseek(self, payload: Dict, on_progress) -> Optional[Dict]:
+        """Streaming DeepSeek (SSE) - przekazuje narastający tekst do on_progress"""
+        breaker = self._breaker()
+        if breaker is None:
+            return None
+        
+        try:
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
             }
+            payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.base_url, json=payload, headers=headers, timeout=60) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result['choices'][0]['message']['content']
-                    else:
-                        print(f"DeepSeek API error: {response.status}")
-                        return None
-                        
+            started = time.perf_counter()
+            parts = []
+            tokens = 0
+            
+            session = await self.http.get_session()
+            # Streaming: czas całkowity rośnie z długością odpowiedzi - zostaje stały limit
+            async with session.post(self.base_url, json=payload, headers=headers, timeout=60) as response:
+                if response.status != 200:
+                    print(f"DeepSeek API error: {response.status}")
+                    self._record_status(breaker, response.status)
+                    return None
+                
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        tokens = chunk["usage"].get("total_tokens", tokens)
+                    
+                    for choice in chunk.get("choices", []):
+                        delta = choice.get("delta", {}).get("content")
+                        if delta:
+                            parts.append(delta)
+                    
+                    if parts:
+                        try:
+                            await on_progress("".join(parts))
+                        except Exception as e:
+                            print(f"DeepSeek stream progress error: {e}")
+            
+            breaker.record_success()
+            if not parts:
+                return None
+            
+            return {
+                "content": "".join(parts),
+                "tokens": tokens,
+                "latency": time.perf_counter() - started
+            }
+        
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
         except Exception as e:
-            print(f"DeepSeek call error: {e}")
+            print(f"DeepSeek stream error: {e}")
+            breaker.record_failure(type(e).__name__)
             return None
     
+    def data_snapshot_hash(self, all_data: Dict) -> str:
+        """Hash migawki danych wejściowych raportu (bez znacznika czasu zbierania)"""
+        snapshot = {key: value for key, value in all_data.items() if key != "timestamp"}
+        raw = json.dumps(snapshot, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+    
     def _prepare_data_summary(self, all_data: Dict) -> str:
         """Przygotuj podsumowanie danych dla AI"""
         summary = []
@@ -727,6 +3118,13 @@ class DeepSeekOrchestrator:
         if all_data.get("meteors"):
             summary.append(f"Deszcze meteorów: {len(all_data['meteors'])}")
         
+        if all_data.get("stale_data"):
+            sources = ", ".join(
+                f"{name} ({'z ' + info['stored_at'] if info['stored_at'] else 'brak danych'}: {info['reason']})"
+                for name, info in all_data["stale_data"].items()
+            )
+            summary.append(f"UWAGA - źródła chwilowo niedostępne, dane z cache lub brak: {sources}")
+        
         return "\n".join(summary)
     
     def _parse_ai_response(self, response: str, all_data: Dict) -> AIAnalysis:
@@ -740,6 +3138,9 @@ class DeepSeekOrchestrator:
         
         current_section = ""
         
+        # Okazje budujemy z rzeczywistych przelotów (SGP4), jeśli są dostępne
+        local_passes = iter([p for p in all_data.get("satellite_passes", []) if 'culmination_azimuth' in p])
+        
         for line in lines:
             line = line.strip()
             
@@ -763,6 +3164,11 @@ class DeepSeekOrchestrator:
                         related_data={}
                     ))
                 elif current_section == "opportunities" and line:
+                    sat_pass = next(local_passes, None)
+                    if sat_pass:
+                        opportunities.append(self._opportunity_from_pass(sat_pass, all_data))
+                        continue
+                    
                     # Przykładowa okazja
                     opportunities.append(SatelliteOpportunity(
                         satellite="Satelita",
@@ -799,6 +3205,22 @@ class DeepSeekOrchestrator:
             data_sources=list(all_data.keys())
         )
     
+    def _opportunity_from_pass(self, sat_pass: Dict, all_data: Dict) -> SatelliteOpportunity:
+        """Okazja obserwacyjna z przelotu policzonego lokalnie"""
+        location = all_data.get("user_location") or {"lat": 52.23, "lon": 21.01}
+        clouds = ((all_data.get("weather") or {}).get("current") or {}).get("clouds")
+        
+        return SatelliteOpportunity(
+            satellite=sat_pass['satellite'],
+            time_utc=sat_pass['culmination_utc'],
+            location={"lat": location["lat"], "lon": location["lon"]},
+            look_angle={"azimuth": sat_pass['culmination_azimuth'], "elevation": sat_pass['max_elevation']},
+            chance_percent=min(95.0, sat_pass['max_elevation'] / 90 * 100),
+            camera_info={"altitude_km": sat_pass['altitude_km'], "duration_s": sat_pass['duration']},
+            weather_score=100.0 - clouds if clouds is not None else 50.0,
+            equipment_recommendations=["Statyw", "Teleobiektyw 200mm+"]
+        )
+    
     def _generate_mock_analysis(self, all_data: Dict) -> AIAnalysis:
         """Generuj przykładową analizę gdy DeepSeek niedostępny"""
         return AIAnalysis(
@@ -976,24 +3398,684 @@ class DeepSeekOrchestrator:
         
         return sorted(best_times, key=lambda x: x["quality_score"], reverse=True)[:3]
 
+# ====================== KOLEJKA WYSYŁKI DO TELEGRAMA ======================
+
+class TokenBucket:
+    """Kubełek tokenów: `rate` tokenów na sekundę, najwyżej `capacity` naraz"""
+    
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay(self) -> float:
+        """Sekundy do dostępności tokenu (0 = można wysyłać)"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self.tokens -= 1
+    
+    def block(self, seconds: float):
+        """Wstrzymaj kubełek (retry_after z odpowiedzi 429)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+    
+    def is_full(self) -> bool:
+        self.delay()
+        return self.tokens >= self.capacity
+    
+    @staticmethod
+    async def acquire_all(*buckets: "TokenBucket"):
+        """Poczekaj, aż każdy kubełek ma token, i pobierz je razem (w chwili wysyłki)"""
+        while True:
+            wait = max(bucket.delay() for bucket in buckets)
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.take()
+                return
+            await asyncio.sleep(wait)
+
+
+class TelegramSendQueue:
+    """Kolejka wychodzących wywołań Bot API z limitem globalnym i per czat
+    
+    Każdy czat ma własną kolejkę i workera (kolejność zachowana), wszystkie
+    czaty dzielą globalny kubełek. Odpowiedź 429 wstrzymuje czat na retry_after
+    i ponawia to samo wywołanie.
+    """
+    
+    def __init__(self, http: HttpSessionManager, base_url: str,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 chat_burst: int = TELEGRAM_CHAT_BURST, group_rate: float = TELEGRAM_GROUP_RATE,
+                 max_retries: int = TELEGRAM_SEND_RETRIES, limit: int = TELEGRAM_SEND_QUEUE_LIMIT):
+        self.http = http
+        self.base_url = base_url
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.limit = limit
+        # Globalnie bez serii: wywołania rozłożone równo, w żadnej sekundzie ponad global_rate
+        self.global_bucket = TokenBucket(global_rate, capacity=1)
+        
+        # czat -> {"queue": deque, "bucket": TokenBucket, "task": worker}
+        self._chats: Dict[Any, Dict] = {}
+        self.pending = 0
+        self._latencies = deque(maxlen=1000)
+        self.stats = {"sent": 0, "failed": 0, "dropped": 0, "rate_limited": 0, "retries": 0, "max_depth": 0}
+    
+    async def call(self, chat_id: Any, method: str, payload: Dict, timeout: float = 10) -> Optional[Any]:
+        """Zakolejkuj wywołanie i poczekaj na wynik (pole 'result' lub None)"""
+        if self.pending >= self.limit:
+            self.stats["dropped"] += 1
+            logger.warning(f"⚠️ Kolejka wysyłki pełna - odrzucono {method} do {chat_id}")
+            return None
+        
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = {"queue": deque(), "bucket": self._chat_bucket(chat_id), "task": None}
+            self._chats[chat_id] = chat
+        
+        chat["queue"].append((method, payload, timeout, time.perf_counter(), future))
+        self.pending += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.pending)
+        
+        if chat["task"] is None or chat["task"].done():
+            chat["task"] = asyncio.ensure_future(self._chat_worker(chat_id, chat))
+        
+        with TELEGRAM_SEND_SECONDS.time(method):
+            return await future
+    
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        # Ujemne id to grupy i kanały - tam limit jest dużo niższy
+        if isinstance(chat_id, int) and chat_id < 0:
+            return TokenBucket(self.group_rate, capacity=1)
+        return TokenBucket(self.chat_rate, capacity=self.chat_burst)
+    
+    async def _chat_worker(self, chat_id: Any, chat: Dict):
+        """Wysyłaj po kolei; zakończ, gdy kolejka pusta, a kubełek czatu pełny"""
+        queue, bucket = chat["queue"], chat["bucket"]
+        # Worker obsługuje kolejne komendy - jego wywołań nie przypisujemy komendzie, która go uruchomiła
+        _current_trace.set(None)
+        
+        while True:
+            if not queue:
+                # Czekamy na odnowienie kubełka, żeby nowy worker nie dostał świeżego limitu za wcześnie
+                if bucket.is_full():
+                    break
+                await asyncio.sleep(1 / bucket.rate)
+                continue
+            
+            method, payload, timeout, enqueued_at, future = queue[0]
+            try:
+                result = await self._deliver(bucket, method, payload, timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Błąd wysyłki {method}: {e}")
+                result = None
+            
+            queue.popleft()
+            self.pending -= 1
+            self._latencies.append(time.perf_counter() - enqueued_at)
+            self.stats["sent" if result is not None else "failed"] += 1
+            if not future.done():
+                future.set_result(result)
+        
+        if self._chats.get(chat_id) is chat and not queue:
+            del self._chats[chat_id]
+    
+    async def _deliver(self, bucket: TokenBucket, method: str, payload: Dict, timeout: float) -> Optional[Any]:
+        """Wyślij z poszanowaniem limitów; po 429 odczekaj retry_after i ponów"""
+        for attempt in range(self.max_retries + 1):
+            await TokenBucket.acquire_all(bucket, self.global_bucket)
+            
+            status, data = await self._post(method, payload, timeout)
+            if status == 200:
+                return data.get("result", True)
+            if status != 429 or attempt == self.max_retries:
+                return None
+            
+            retry_after = (data.get("parameters") or {}).get("retry_after", 1)
+            self.stats["rate_limited"] += 1
+            self.stats["retries"] += 1
+            logger.warning(f"⏳ Telegram 429 dla {method} - ponowienie za {retry_after}s")
+            bucket.block(retry_after)
+        
+        return None
+    
+    async def _post(self, method: str, payload: Dict, timeout: float) -> Tuple[int, Dict]:
+        """Jedno wywołanie Bot API - (status HTTP, treść JSON)"""
+        session = await self.http.get_session()
+        with TELEGRAM_API_SECONDS.time(method):
+            async with session.post(f"{self.base_url}/{method}", json=payload, timeout=timeout) as response:
+                try:
+                    data = await response.json()
+                except (aiohttp.ContentTypeError, ValueError):
+                    data = {}
+                return response.status, data
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Głębokość kolejki i czasy dostarczenia (od zakolejkowania do odpowiedzi)"""
+        latencies = sorted(self._latencies)
+        
+        def percentile(q: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else 0.0
+        
+        return {
+            **self.stats,
+            "depth": self.pending,
+            "active_chats": len(self._chats),
+            "latency_p50_s": percentile(0.5),
+            "latency_p95_s": percentile(0.95),
+            "latency_max_s": round(latencies[-1], 3) if latencies else 0.0
+        }
+    
+    async def close(self):
+        """Przerwij workery (niewysłane wywołania kończą się wynikiem None)"""
+        for chat in list(self._chats.values()):
+            if chat["task"] is not None:
+                chat["task"].cancel()
+            for *_, future in chat["queue"]:
+                if not future.done():
+                    future.set_result(None)
+        self._chats.clear()
+        self.pending = 0
+
+
+# ====================== DZIELENIE DŁUGICH WIADOMOŚCI ======================
+
+def telegram_length(text: str) -> int:
+    """Długość tekstu tak, jak liczy ją Telegram (jednostki UTF-16)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class HtmlMessageSplitter:
+    """Dzieli wiadomość HTML na części do limitu Telegrama
+    
+    Najpierw na granicach sekcji (pusta linia), potem linii i słów; znaczniki
+    otwarte na końcu części są zamykane i otwierane ponownie w następnej.
+    """
+    
+    SEPARATORS = ("\n\n", "\n", " ")
+    TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+    ATOM_RE = re.compile(r"<[^>]*>|&#?\w+;|.", re.DOTALL)
+    
+    def __init__(self, limit: int = TELEGRAM_MESSAGE_LIMIT, html: bool = True):
+        self.limit = limit
+        self.html = html
+    
+    def split(self, text: str) -> List[str]:
+        if telegram_length(text) <= self.limit:
+            return [text]
+        
+        self.chunks: List[str] = []
+        self.stack: List[Tuple[str, str]] = []  # (nazwa, znacznik otwierający)
+        self.prefix = ""
+        self.body = ""
+        self.length = 0
+        
+        self._feed(text, 0)
+        self._flush()
+        return self.chunks
+    
+    def _feed(self, text: str, level: int):
+        if level < len(self.SEPARATORS):
+            separator = self.SEPARATORS[level]
+            parts = text.split(separator)
+            pieces = [part + separator for part in parts[:-1]] + [parts[-1]]
+        else:
+            pieces = self.ATOM_RE.findall(text) if self.html else list(text)
+        
+        for piece in pieces:
+            if not piece:
+                continue
+            after = self._stack_after(piece)
+            if self.length + telegram_length(piece) + self._closers_length(after) <= self.limit:
+                self._append(piece, after)
+            elif self._fits_fresh(piece, after):
+                self._flush()
+                self._append(piece, after)
+            elif level < len(self.SEPARATORS):
+                self._feed(piece, level + 1)
+            else:
+                self._flush()
+                self._append(piece, after)
+    
+    def _stack_after(self, piece: str) -> List[Tuple[str, str]]:
+        """Stos otwartych znaczników po dopisaniu fragmentu"""
+        if not self.html or "<" not in piece:
+            return self.stack
+        
+        stack = list(self.stack)
+        for match in self.TAG_RE.finditer(piece):
+            closing, name = match.group(1), match.group(2).lower()
+            if not closing:
+                stack.append((name, match.group(0)))
+                continue
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    del stack[i]
+                    break
+        return stack
+    
+    @staticmethod
+    def _closers(stack: List[Tuple[str, str]]) -> str:
+        return "".join(f"</{name}>" for name, _ in reversed(stack))
+    
+    def _closers_length(self, stack: List[Tuple[str, str]]) -> int:
+        return sum(len(name) + 3 for name, _ in stack)
+    
+    def _fits_fresh(self, piece: str, after: List[Tuple[str, str]]) -> bool:
+        reopen = sum(telegram_length(tag) for _, tag in self.stack)
+        return reopen + telegram_length(piece) + self._closers_length(after) <= self.limit
+    
+    def _append(self, piece: str, after: List[Tuple[str, str]]):
+        self.body += piece
+        self.length += telegram_length(piece)
+        self.stack = after
+    
+    def _flush(self):
+        """Zamknij bieżącą część i zacznij następną od ponownie otwartych znaczników"""
+        if self.body.strip():
+            self.chunks.append((self.prefix + self.body.strip() + self._closers(self.stack)).strip())
+        
+        self.prefix = "".join(tag for _, tag in self.stack)
+        self.body = ""
+        self.length = telegram_length(self.prefix)
+
+
+def split_html_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT, html: bool = True) -> List[str]:
+    """Podziel wiadomość na części mieszczące się w limicie Telegrama"""
+    return HtmlMessageSplitter(limit, html).split(text)
+
+
+# ====================== STREAMING DO TELEGRAMA ======================
+
+class TelegramStreamSink:
+    """Wiadomość-zastępca aktualizowana przez editMessageText w miarę napływu tekstu AI"""
+    
+    def __init__(self, bot, chat_id: int, interval: float = STREAM_EDIT_INTERVAL,
+                 min_chars: int = STREAM_MIN_CHARS):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.min_chars = min_chars
+        
+        self.message_id = None
+        self._last_edit = 0.0
+        self._last_length = 0
+        self._edit_task = None
+        self._owner = None
+    
+    async def start(self, text: str, parse_html: bool = False):
+        """Wyślij wiadomość-zastępcę"""
+        self._owner = asyncio.current_task()
+        payload = {"chat_id": self.chat_id, "text": text, "parse_mode": "HTML" if parse_html else None}
+        result = await self.bot._telegram_call("sendMessage", payload)
+        if isinstance(result, dict):
+            self.message_id = result.get("message_id")
+    
+    async def update(self, text: str):
+        """Zaktualizuj wiadomość (co najwyżej raz na interval, bez blokowania streamu)"""
+        if self.message_id is None:
+            return
+        # Komenda anulowana (zastąpiona nowszą) - stream może trwać dla innych czatów, ale tej wiadomości nie ruszamy
+        if self._owner is not None and self._owner.done():
+            return
+        if self._edit_task is not None and not self._edit_task.done():
+            return
+        if time.monotonic() - self._last_edit < self.interval or len(text) - self._last_length < self.min_chars:
+            return
+        
+        self._last_edit = time.monotonic()
+        self._last_length = len(text)
+        
+        # Tekst w trakcie generowania może mieć niedomknięte znaczniki - wysyłamy bez HTML
+        preview = text[-TELEGRAM_MESSAGE_LIMIT + 10:] + " ▌"
+        self._edit_task = asyncio.ensure_future(
+            self.bot.edit_message(self.chat_id, self.message_id, preview, parse_html=False)
+        )
+    
+    async def finish(self, text: str):
+        """Zastąp wiadomość gotową odpowiedzią (lub wyślij nową, jeśli edycja się nie uda)
+        
+        Za długa odpowiedź: pierwsza część trafia do wiadomości-zastępcy, reszta jako kolejne wiadomości.
+        """
+        if self._edit_task is not None:
+            await asyncio.gather(self._edit_task, return_exceptions=True)
+        
+        first, *rest = split_html_message(text)
+        
+        if self.message_id is None or not await self.bot.edit_message(self.chat_id, self.message_id, first):
+            await self.bot.send_message(self.chat_id, first)
+        
+        if rest:
+            await asyncio.gather(*(self.bot.send_message(self.chat_id, chunk) for chunk in rest))
+
+# ====================== PREWARM (HARMONOGRAM W TLE) ======================
+
+class PrewarmScheduler:
+    """Harmonogram asyncio: odświeża źródła globalne przed wygaśnięciem i
+    przygotowuje briefingi lokalizacji przed porannym i wieczornym szczytem"""
+    
+    def __init__(self, bot, concurrency: int = PREWARM_CONCURRENCY,
+                 sources: List[str] = PREWARM_SOURCES, tick: float = PREWARM_TICK_SECONDS,
+                 peak_hours: List[int] = PREWARM_PEAK_HOURS,
+                 peak_lead_minutes: int = PREWARM_PEAK_LEAD_MINUTES):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.sources = [name for name in sources if name in UniversalDataCollector.GLOBAL_FETCHERS]
+        self.tick = tick
+        self.peak_hours = sorted(set(peak_hours))
+        self.peak_lead = timedelta(minutes=peak_lead_minutes)
+        self._semaphore = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"source_refreshes": 0, "briefings": 0, "errors": 0, "last_briefing_run": None}
+    
+    def start(self):
+        """Uruchom pętle harmonogramu na bieżącej pętli asyncio"""
+        if self._tasks:
+            return
+        # Semafor dzielony przez wszystkie zadania w tle - nie zabierają workerów ruchowi interaktywnemu
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._tasks = [
+            asyncio.ensure_future(self._sources_loop()),
+            asyncio.ensure_future(self._briefings_loop())
+        ]
+        logger.info(f"⏰ Prewarm: źródła={','.join(self.sources)}, szczyty={self.peak_hours}, "
+                    f"współbieżność={self.concurrency}")
+    
+    async def stop(self):
+        """Zatrzymaj pętle harmonogramu"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def _sources_loop(self):
+        """Co tick odśwież źródła, którym kończy się TTL"""
+        collector = self.bot.data_collector
+        while True:
+            # TLE pobierane tylko tutaj i przy starcie - zapytania używają już wczytanych
+            results = await asyncio.gather(
+                self._limited(collector.refresh_pass_index()),
+                *(self._limited(collector.prewarm(name)) for name in self.sources),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    self.stats["errors"] += 1
+                    logger.warning(f"⚠️ Prewarm źródła nieudany: {result}")
+                elif result:
+                    self.stats["source_refreshes"] += 1
+            await asyncio.sleep(self.tick)
+    
+    async def _briefings_loop(self):
+        """Przed każdym szczytem wygeneruj briefingi dla używanych lokalizacji"""
+        while True:
+            run_at = self.next_briefing_run(datetime.now())
+            if run_at is None:
+                return
+            await asyncio.sleep(max(0.0, (run_at - datetime.now()).total_seconds()))
+            await self.prewarm_briefings()
+    
+    def next_briefing_run(self, now: datetime) -> Optional[datetime]:
+        """Najbliższy termin: godzina szczytu minus wyprzedzenie"""
+        candidates = [
+            now.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=day) - self.peak_lead
+            for day in (0, 1) for hour in self.peak_hours
+        ]
+        upcoming = [run_at for run_at in candidates if run_at > now]
+        return min(upcoming) if upcoming else None
+    
+    async def prewarm_briefings(self) -> int:
+        """Wygeneruj (od nowa) briefingi dla wszystkich używanych lokalizacji"""
+        locations = self.bot.active_locations()
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            # Praca w tle: bez terminu zbierania - briefing na szczyt nie może powstać z danych zapasowych
+            *(self._limited(self.bot.get_briefing(location, refresh=True, deadline=0)) for location in locations),
+            return_exceptions=True
+        )
+        
+        done = 0
+        for location, result in zip(locations, results):
+            if isinstance(result, Exception):
+                self.stats["errors"] += 1
+                logger.warning(f"⚠️ Prewarm briefingu {location['name']} nieudany: {result}")
+            else:
+                done += 1
+        
+        self.stats["briefings"] += done
+        self.stats["last_briefing_run"] = datetime.now().isoformat()
+        logger.info(f"⏰ Prewarm briefingów: {done}/{len(locations)} w {time.perf_counter() - started:.1f}s")
+        return done
+    
+    async def _limited(self, coro):
+        async with self._semaphore:
+            return await coro
+
+
+# ====================== KOLEJKA KOMEND CZATU ======================
+
+class ChatCommandMailbox:
+    """Skrzynka komend per czat - komendy jednego czatu wykonywane po kolei
+    
+    Identyczna komenda (ta sama nazwa i argumenty), która już czeka lub trwa, nie jest
+    uruchamiana drugi raz - dołączamy do jej wyniku. Nowsza komenda tego samego rodzaju
+    (z innymi argumentami) usuwa starszą z kolejki albo anuluje ją w trakcie.
+    
+    Komendy wykonują workery czatów (najwyżej `concurrency` naraz dla wszystkich czatów),
+    więc worker dispatchera wraca od razu po dodaniu komendy do kolejki.
+    """
+    
+    def __init__(self, supersede: List[str] = CHAT_SUPERSEDE_COMMANDS, limit: int = CHAT_MAILBOX_LIMIT,
+                 total_limit: int = CHAT_MAILBOX_TOTAL_LIMIT, concurrency: int = DISPATCH_CONCURRENCY):
+        self.supersede = set(supersede)
+        self.limit = limit
+        self.total_limit = total_limit
+        self.concurrency = concurrency
+        self._semaphore = None
+        
+        # czat -> {"queue": deque oczekujących, "current": wpis w trakcie, "task": worker}
+        self._chats: Dict[Any, Dict] = {}
+        self._pending = 0  # oczekujące komendy wszystkich czatów
+        self.stats = {"executed": 0, "joined": 0, "superseded": 0, "cancelled": 0, "rejected": 0, "failed": 0}
+    
+    def submit(self, chat_id: Any, kind: str, args: List[str], job) -> Optional[asyncio.Future]:
+        """Dodaj job() do kolejki czatu bez czekania - future wyniku albo None, gdy odrzucona
+        
+        Future kończy się wynikiem komendy, albo None gdy komendę zastąpiono, anulowano lub zawiodła.
+        """
+        signature = (kind, tuple(arg.lower() for arg in args))
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = {"queue": deque(), "current": None, "task": None}
+            self._chats[chat_id] = chat
+        
+        for entry in self._entries(chat):
+            if entry["signature"] == signature:
+                self.stats["joined"] += 1
+                logger.info(f"🔗 /{kind} od {chat_id} już w toku - dołączam do wyniku")
+                return entry["future"]
+        
+        if kind in self.supersede:
+            self._supersede(chat_id, chat, kind)
+        
+        if len(chat["queue"]) >= self.limit or self._pending >= self.total_limit:
+            self.stats["rejected"] += 1
+            logger.warning(f"⚠️ Za dużo oczekujących komend (czat {chat_id}: {len(chat['queue'])}, "
+                           f"razem: {self._pending}) - odrzucam /{kind}")
+            if chat["task"] is None and not chat["queue"]:
+                del self._chats[chat_id]
+            return None
+        
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        
+        entry = {"signature": signature, "kind": kind, "job": job,
+                 "future": asyncio.get_running_loop().create_future(), "task": None}
+        chat["queue"].append(entry)
+        self._pending += 1
+        
+        if chat["task"] is None or chat["task"].done():
+            chat["task"] = asyncio.ensure_future(self._chat_worker(chat_id, chat))
+        
+        return entry["future"]
+    
+    def _entries(self, chat: Dict) -> List[Dict]:
+        current = [chat["current"]] if chat["current"] is not None else []
+        return current + list(chat["queue"])
+    
+    def _supersede(self, chat_id: Any, chat: Dict, kind: str):
+        """Porzuć oczekujące i anuluj trwającą komendę tego rodzaju"""
+        for entry in [e for e in chat["queue"] if e["kind"] == kind]:
+            chat["queue"].remove(entry)
+            self._pending -= 1
+            entry["future"].set_result(None)
+            self.stats["superseded"] += 1
+        
+        current = chat["current"]
+        if current is not None and current["kind"] == kind and current["task"] is not None:
+            # Anulowanie przerywa oczekiwanie na dane i AI; wspólne pobierania (shield) trwają dalej
+            current["task"].cancel()
+            self.stats["cancelled"] += 1
+            logger.info(f"⏹️ Nowsze /{kind} od {chat_id} - anuluję poprzednie")
+    
+    async def _chat_worker(self, chat_id: Any, chat: Dict):
+        """Wykonuj komendy po kolei; zakończ, gdy kolejka pusta"""
+        queue = chat["queue"]
+        
+        while queue:
+            # Czekając na wolne miejsce komenda zostaje w kolejce - można ją zastąpić lub do niej dołączyć
+            async with self._semaphore:
+                if not queue:
+                    break
+                entry = queue.popleft()
+                self._pending -= 1
+                chat["current"] = entry
+                task = entry["task"] = asyncio.ensure_future(entry["job"]())
+                try:
+                    await asyncio.wait([task])
+                except asyncio.CancelledError:
+                    task.cancel()
+                    entry["future"].set_result(None)
+                    raise
+                finally:
+                    chat["current"] = None
+            
+            future = entry["future"]
+            if task.cancelled():
+                future.set_result(None)
+            elif task.exception() is not None:
+                self.stats["failed"] += 1
+                logger.error(f"❌ Błąd komendy /{entry['kind']} od {chat_id}: {task.exception()}")
+                future.set_result(None)
+            else:
+                self.stats["executed"] += 1
+                future.set_result(task.result())
+        
+        if self._chats.get(chat_id) is chat:
+            del self._chats[chat_id]
+    
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "active_chats": len(self._chats), "pending": self._pending}
+    
+    async def close(self):
+        """Przerwij workery i trwające komendy; oczekujący na wynik dostają None"""
+        workers = [chat["task"] for chat in self._chats.values() if chat["task"] is not None]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        
+        for chat in self._chats.values():
+            for entry in self._entries(chat):
+                if not entry["future"].done():
+                    entry["future"].set_result(None)
+        self._chats.clear()
+        self._pending = 0
+
+
 # ====================== TELEGRAM BOT Z INTEGRACJĄ AI ======================
 
 class AIPoweredTelegramBot:
     """Bot z głęboką integracją AI jako centralnym mózgiem"""
     
+    # Zależności danych komend - każda komenda pobiera tylko to, co wyświetla
+    # (None = wszystkie źródła, pełny kontekst dla AI)
+    COMMAND_SOURCES = {
+        "start": None,
+        "ai": None,
+        "report": None,
+        "briefing": None,
+        "where": {"weather"},
+        "weather": {"weather"},
+        "earthquakes": {"earthquakes"},
+        "asteroids": {"asteroids"},
+        "apod": {"apod"}
+    }
+    
+    # Aliasy komend -> rodzaj komendy (kolejka komend czatu)
+    COMMAND_ALIASES = {
+        "ask": "ai", "raport": "report", "podsumowanie": "briefing", "analizuj": "analyze",
+        "gdzie": "where", "pogoda": "weather", "trzesienia": "earthquakes", "asteroidy": "asteroids",
+        "lokalizacje": "locations", "pomoc": "help"
+    }
+    
+    # Rodzaje komend obsługiwane przez handle_command (inne trafiają do metryk jako "unknown")
+    COMMAND_KINDS = frozenset({
+        "start", "ai", "report", "briefing", "analyze", "where", "weather",
+        "earthquakes", "asteroids", "apod", "locations", "help"
+    })
+    
+    # Klasy kontekstu użytkownika dla wspólnych raportów lokalizacji
+    REPORT_CONTEXTS = {
+        "new_user": "Nowy użytkownik, lokalizacja: {name}",
+        "refresh": ""
+    }
+    
+    # Słowa kluczowe tematu /analyze -> źródła danych
+    ANALYZE_TOPIC_SOURCES = [
+        (("trzęsienie", "ziemi"), ("earthquakes",)),
+        (("pogod", "chmur"), ("weather",)),
+        (("satelit", "iss"), ("satellite_passes", "visibility_zones")),
+        (("asteroid", "meteor"), ("asteroids", "meteors")),
+        (("zorza", "aurora"), ("aurora", "space_weather"))
+    ]
+    
     def __init__(self):
         self.token = TELEGRAM_BOT_TOKEN
         self.username = BOT_USERNAME  # 🔴 PRAWIDŁOWA NAZWA BOTA
-        self.base_url = f"https://api.telegram.org/bot{self.token}"
+        self.base_url = f"{TELEGRAM_API_URL}/bot{self.token}"
         self.available = bool(TELEGRAM_BOT_TOKEN)
         
-        # Komponenty systemu
-        self.data_collector = UniversalDataCollector()
-        self.ai_orchestrator = DeepSeekOrchestrator(DEEPSEEK_API_KEY)
+        # Komponenty systemu - jedna pula połączeń HTTP dla wszystkich
+        self.http = HttpSessionManager()
+        self.data_collector = UniversalDataCollector(self.http)
+        self.ai_orchestrator = DeepSeekOrchestrator(DEEPSEEK_API_KEY, self.http, self.data_collector)
+        
+        # Wszystkie wywołania Bot API idą przez kolejkę z limitami (per czat i globalnym)
+        self.send_queue = TelegramSendQueue(self.http, self.base_url)
+        
+        # Komendy jednego czatu po kolei (powtórzenia dołączają, nowsze zastępują starsze)
+        self.mailbox = ChatCommandMailbox()
         
-        # Stan użytkownika
-        self.user_profiles = {}  # chat_id -> profile
-        self.user_locations = {}  # chat_id -> location
+        # Stan użytkownika - trwały (SQLite/Redis), ładowany leniwie przed obsługą aktualizacji
+        self.state = UserStateStore()
+        self.user_profiles = self.state["profiles"]  # chat_id -> profile
+        self.user_locations = self.state["locations"]  # chat_id -> location
         
         # Lokalizacje
         self.locations = {
@@ -1006,39 +4088,58 @@ class AIPoweredTelegramBot:
             "baltyk": {"name": "Bałtyk", "lat": 54.5000, "lon": 18.5500}
         }
         
-        # Cache AI raportów
-        self.ai_reports_cache = {}
+        # Przeloty dla predefiniowanych lokalizacji liczone z góry
+        self.data_collector.register_locations(self.locations)
+        
+        # Raporty AI współdzielone per (lokalizacja, migawka danych, klasa kontekstu)
+        self.location_reports = BoundedCache(
+            max_entries=LOCATION_REPORTS_MAX_ENTRIES,
+            max_bytes=LOCATION_REPORTS_MAX_BYTES,
+            max_age=1800
+        )
+        self._report_inflight: Dict[str, asyncio.Future] = {}
+        self._report_waiters: Dict[str, int] = defaultdict(int)
+        self.report_stats = {"generated": 0, "shared": 0, "coalesced": 0}
+        
+        # Wskaźniki czatów na raport lokalizacji (trwałe, jak lokalizacje)
+        self.ai_reports_cache = self.state["report_pointers"]
+        
+        # Briefingi per (lokalizacja, dzień) - przygotowywane z wyprzedzeniem przez prewarm
+        self.briefings = BoundedCache(
+            max_entries=LOCATION_REPORTS_MAX_ENTRIES,
+            max_bytes=LOCATION_REPORTS_MAX_BYTES,
+            max_age=BRIEFING_CACHE_TTL
+        )
+        self._briefing_inflight: Dict[str, asyncio.Future] = {}
+        self.prewarm = PrewarmScheduler(self)
         
         print(f"🤖 AI-Powered Bot zainicjalizowany")
         print(f"   Bot username: @{self.username}")
         print(f"   DeepSeek AI: {'✅ AKTYWNY' if self.ai_orchestrator.available else '❌ BRAK'}")
     
     async def send_message(self, chat_id: int, text: str, parse_html: bool = True):
-        """Wyślij wiadomość"""
+        """Wyślij wiadomość (za długą - w kilku częściach)"""
         if not self.available:
             return False
         
-        url = f"{self.base_url}/sendMessage"
-        payload = {
-            "chat_id": chat_id,
-            "text": text,
-            "parse_mode": "HTML" if parse_html else None,
-            "disable_web_page_preview": False
-        }
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=10) as response:
-                    return response.status == 200
-        except:
-            return False
+        # Wszystkie części trafiają od razu do kolejki czatu - idą po kolei jednym połączeniem
+        results = await asyncio.gather(*(
+            self._telegram_call("sendMessage", {
+                "chat_id": chat_id,
+                "text": chunk,
+                "parse_mode": "HTML" if parse_html else None,
+                "disable_web_page_preview": False
+            }, timeout=10)
+            for chunk in split_html_message(text, html=parse_html)
+        ))
+        
+        return all(result is not None for result in results)
     
     async def send_photo(self, chat_id: int, photo_url: str, caption: str = ""):
         """Wyślij zdjęcie"""
         if not self.available:
             return False
         
-        url = f"{self.base_url}/sendPhoto"
         payload = {
             "chat_id": chat_id,
             "photo": photo_url,
@@ -1046,12 +4147,85 @@ class AIPoweredTelegramBot:
             "parse_mode": "HTML"
         }
         
+        return await self._telegram_call("sendPhoto", payload, timeout=15) is not None
+    
+    async def edit_message(self, chat_id: int, message_id: int, text: str, parse_html: bool = True) -> bool:
+        """Edytuj wysłaną wiadomość"""
+        if not self.available:
+            return False
+        
+        payload = {
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "text": text,
+            "parse_mode": "HTML" if parse_html else None,
+            "disable_web_page_preview": True
+        }
+        
+        return await self._telegram_call("editMessageText", payload, timeout=10) is not None
+    
+    async def _telegram_call(self, method: str, payload: Dict, timeout: float = 10) -> Optional[Any]:
+        """Wywołaj metodę Bot API przez kolejkę wysyłki - zwraca pole 'result' lub None przy błędzie"""
+        return await self.send_queue.call(payload.get("chat_id"), method, payload, timeout)
+    
+    async def startup(self):
+        """Zadania startowe na wspólnej pętli (TLE, indeks przelotów, prewarm)"""
+        if PREWARM_ENABLED:
+            self.prewarm.start()
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=15) as response:
-                    return response.status == 200
-        except:
-            return False
+            await self.data_collector.refresh_pass_index()
+        except Exception as e:
+            logger.error(f"❌ Błąd budowania indeksu przelotów: {e}")
+    
+    async def close(self):
+        """Zatrzymaj prewarm i kolejkę wysyłki, zamknij zasoby sieciowe bota (pula połączeń HTTP)"""
+        await self.prewarm.stop()
+        await self.mailbox.close()
+        await self.send_queue.close()
+        await self.state.close()
+        await self.data_collector.close()
+        await self.http.close()
+    
+    def command_kind(self, command: str) -> str:
+        """Rodzaj komendy (aliasy polskie/angielskie -> jedna nazwa)"""
+        command = command.lower()
+        return self.COMMAND_ALIASES.get(command, command)
+    
+    def active_locations(self) -> List[Dict]:
+        """Predefiniowane lokalizacje i lokalizacje wybrane przez użytkowników (bez duplikatów)"""
+        unique = {}
+        for location in list(self.locations.values()) + list(self.user_locations.values()):
+            unique.setdefault(location['name'], location)
+        return list(unique.values())
+    
+    async def get_briefing(self, location: Dict, refresh: bool = False,
+                           deadline: float = COLLECT_DEADLINE) -> Dict:
+        """Briefing dnia dla lokalizacji - z cache, a równoległe prośby czekają na jedno generowanie
+        
+        refresh: wygeneruj od nowa (prewarm przed szczytem)
+        deadline: budżet czasu zbierania danych (0 = bez limitu, dla pracy w tle)
+        """
+        key = f"{location['name']}|{datetime.now().strftime('%Y-%m-%d')}"
+        
+        if not refresh:
+            briefing = self.briefings.get(key)
+            if briefing is not None:
+                return briefing
+        
+        task = self._briefing_inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.ai_orchestrator.generate_daily_briefing(location, deadline))
+            self._briefing_inflight[key] = task
+            task.add_done_callback(lambda _: self._briefing_inflight.pop(key, None))
+        
+        briefing = await asyncio.shield(task)
+        if briefing.get("stale_data"):
+            # Część źródeł z zapasowych danych - wpis wygasa po BRIEFING_STALE_TTL zamiast po 6 h
+            self.briefings.set(key, briefing, stored_at=time.time() - BRIEFING_CACHE_TTL + BRIEFING_STALE_TTL)
+        else:
+            self.briefings.set(key, briefing)
+        return briefing
     
     async def handle_command(self, chat_id: int, command: str, args: List[str]):
         """Obsłuż komendę z głęboką integracją AI"""
@@ -1112,24 +4286,27 @@ class AIPoweredTelegramBot:
         )
         
         # Zbierz WSZYSTKIE dane
-        all_data = await self.data_collector.collect_all_data(location)
+        all_data = await self.data_collector.collect_all_data(location, self.COMMAND_SOURCES["start"])
         
-        # Analiza AI
-        user_context = f"Nowy użytkownik, lokalizacja: {location['name']}"
-        ai_analysis = await self.ai_orchestrator.analyze_all_data(all_data, user_context)
+        # Analiza AI - tekst pojawia się na bieżąco w wiadomości-zastępcy
+        sink = TelegramStreamSink(self, chat_id)
+        await sink.start("🤖 AI pisze raport...")
         
-        # Zapisz w cache
-        self.ai_reports_cache[chat_id] = {
-            "analysis": ai_analysis,
+        report_key, ai_analysis = await self._get_location_report(location, all_data, "new_user", sink.update)
+        
+        # Zapisz w cache (wskaźnik na wspólny raport lokalizacji)
+        self.ai_reports_cache.set(chat_id, {
+            "report_key": report_key,
             "timestamp": datetime.now(),
             "location": location
-        }
+        })
         
         # Formatuj odpowiedź AI
-        response = await self._format_ai_analysis(ai_analysis, location)
+        with FORMAT_SECONDS.time("ai_analysis"):
+            response = await self._format_ai_analysis(ai_analysis, location)
         
-        # Wyślij raport
-        await self.send_message(chat_id, response)
+        # Wyślij raport (zastępuje tekst streamowany)
+        await sink.finish(response)
         
         # Dodaj interaktywne opcje
         await self.send_message(chat_id,
@@ -1162,7 +4339,7 @@ class AIPoweredTelegramBot:
         await self.send_message(chat_id, f"🤖 AI analizuje pytanie: <i>{question}</i>")
         
         # Zbierz dane kontekstowe
-        all_data = await self.data_collector.collect_all_data(location)
+        all_data = await self.data_collector.collect_all_data(location, self.COMMAND_SOURCES["ai"])
         
         # Zapytaj AI
         answer = await self.ai_orchestrator.answer_question(question, all_data)
@@ -1182,12 +4359,13 @@ class AIPoweredTelegramBot:
         """Odśwież raport AI"""
         # Sprawdź cache
         cached = self.ai_reports_cache.get(chat_id)
+        analysis = self.location_reports.get(cached["report_key"]) if cached else None
         
-        if cached and (datetime.now() - cached["timestamp"]).seconds < 1800:  # 30 minut
+        if analysis and (datetime.now() - cached["timestamp"]).seconds < 1800:  # 30 minut
             location = cached["location"]
-            analysis = cached["analysis"]
             
-            response = await self._format_ai_analysis(analysis, location)
+            with FORMAT_SECONDS.time("ai_analysis"):
+                response = await self._format_ai_analysis(analysis, location)
             await self.send_message(chat_id, response)
             return
         
@@ -1202,20 +4380,22 @@ class AIPoweredTelegramBot:
         else:
             location = self.user_locations.get(chat_id, self.locations["warszawa"])
         
-        await self.send_message(chat_id, f"🤖 Generuję nowy raport AI dla {location['name']}...")
+        sink = TelegramStreamSink(self, chat_id)
+        await sink.start(f"🤖 Generuję nowy raport AI dla {location['name']}...")
         
-        all_data = await self.data_collector.collect_all_data(location)
-        ai_analysis = await self.ai_orchestrator.analyze_all_data(all_data, "")
+        all_data = await self.data_collector.collect_all_data(location, self.COMMAND_SOURCES["report"])
+        report_key, ai_analysis = await self._get_location_report(location, all_data, "refresh", sink.update)
         
         # Zaktualizuj cache
-        self.ai_reports_cache[chat_id] = {
-            "analysis": ai_analysis,
+        self.ai_reports_cache.set(chat_id, {
+            "report_key": report_key,
             "timestamp": datetime.now(),
             "location": location
-        }
+        })
         
-        response = await self._format_ai_analysis(ai_analysis, location)
-        await self.send_message(chat_id, response)
+        with FORMAT_SECONDS.time("ai_analysis"):
+            response = await self._format_ai_analysis(ai_analysis, location)
+        await sink.finish(response)
     
     async def cmd_daily_briefing(self, chat_id: int, args: List[str]):
         """Codzienne podsumowanie AI"""
@@ -1237,7 +4417,7 @@ class AIPoweredTelegramBot:
         )
         
         # Generuj briefing
-        briefing = await self.ai_orchestrator.generate_daily_briefing(location)
+        briefing = await self.get_briefing(location)
         
         # Formatuj odpowiedź
         response = f"""
@@ -1299,41 +4479,26 @@ class AIPoweredTelegramBot:
         topic = " ".join(args)
         location = self.user_locations.get(chat_id, self.locations["warszawa"])
         
-        await self.send_message(chat_id, f"🔍 AI analizuje temat: <b>{topic}</b>")
+        sink = TelegramStreamSink(self, chat_id)
+        await sink.start(f"🔍 AI analizuje temat: <b>{topic}</b>", parse_html=True)
         
-        # Zbierz odpowiednie dane
-        all_data = await self.data_collector.collect_all_data(location)
+        # Zbierz tylko dane związane z tematem
+        sources = self._analyze_sources(topic)
+        all_data = {}
+        if sources:
+            all_data = await self.data_collector.collect_all_data(location, set(sources))
         
         # Przygotuj kontekst dla AI
         context = {
             "topic": topic,
             "location": location,
             "timestamp": datetime.now().isoformat(),
-            "relevant_data": {}
+            "relevant_data": {name: all_data.get(name) for name in sources}
         }
         
-        # Dodaj odpowiednie dane w zależności od tematu
-        if "trzęsienie" in topic.lower() or "ziemi" in topic.lower():
-            context["relevant_data"]["earthquakes"] = all_data.get("earthquakes", [])
-        
-        if "pogod" in topic.lower() or "chmur" in topic.lower():
-            context["relevant_data"]["weather"] = all_data.get("weather", {})
-        
-        if "satelit" in topic.lower() or "iss" in topic.lower():
-            context["relevant_data"]["satellite_passes"] = all_data.get("satellite_passes", [])
-            context["relevant_data"]["visibility_zones"] = all_data.get("visibility_zones", [])
-        
-        if "asteroid" in topic.lower() or "meteor" in topic.lower():
-            context["relevant_data"]["asteroids"] = all_data.get("asteroids", [])
-            context["relevant_data"]["meteors"] = all_data.get("meteors", [])
-        
-        if "zorza" in topic.lower() or "aurora" in topic.lower():
-            context["relevant_data"]["aurora"] = all_data.get("aurora", {})
-            context["relevant_data"]["space_weather"] = all_data.get("space_weather", {})
-        
         # Zapytaj AI o analizę
         question = f"Przeprowadź głęboką analizę tematu: {topic}. Uwzględnij dane kontekstowe."
-        answer = await self.ai_orchestrator.answer_question(question, context)
+        answer = await self.ai_orchestrator.answer_question(question, context, on_progress=sink.update)
         
         # Formatuj odpowiedź
         response = f"""
@@ -1346,7 +4511,67 @@ Analiza oparta o dane z: {', '.join(context['relevant_data'].keys())}
 Lokalizacja: {location['name']}
 Czas analizy: {datetime.now().strftime('%H:%M')}
 """
-        await self.send_message(chat_id, response)
+        await sink.finish(response)
+    
+    async def _get_location_report(self, location: Dict, all_data: Dict, context_class: str,
+                                   on_progress=None) -> Tuple[str, AIAnalysis]:
+        """Raport AI wspólny dla wszystkich czatów z tą samą lokalizacją i danymi
+        
+        Klucz: (lokalizacja, hash migawki danych, klasa kontekstu). Równoległe
+        prośby o ten sam klucz czekają na jedno wywołanie analyze_all_data.
+        """
+        snapshot = self.ai_orchestrator.data_snapshot_hash(all_data)
+        key = f"{location['name']}|{snapshot}|{context_class}"
+        
+        analysis = self.location_reports.get(key)
+        if analysis is not None:
+            self.report_stats["shared"] += 1
+            return key, analysis
+        
+        task = self._report_inflight.get(key)
+        if task is not None:
+            self.report_stats["coalesced"] += 1
+        else:
+            self.report_stats["generated"] += 1
+            user_context = self.REPORT_CONTEXTS[context_class].format(name=location['name'])
+            task = asyncio.ensure_future(
+                self.ai_orchestrator.analyze_all_data(all_data, user_context, on_progress=on_progress)
+            )
+            self._report_inflight[key] = task
+            task.add_done_callback(lambda t: self._forget_report(key, t))
+        
+        self._report_waiters[key] += 1
+        try:
+            analysis = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Komenda anulowana (zastąpiona nowszą) - generowanie przerywamy, jeśli nikt inny nie czeka
+            if self._report_waiters[key] == 1:
+                task.cancel()
+                self._forget_report(key, task)
+            raise
+        finally:
+            self._report_waiters[key] -= 1
+            if self._report_waiters[key] <= 0:
+                del self._report_waiters[key]
+        
+        self.location_reports.set(key, analysis)
+        return key, analysis
+    
+    def _forget_report(self, key: str, task: asyncio.Future):
+        """Usuń generowanie raportu z trwających (tylko jeśli nie zastąpiło go już nowsze)"""
+        if self._report_inflight.get(key) is task:
+            del self._report_inflight[key]
+    
+    def _analyze_sources(self, topic: str) -> List[str]:
+        """Źródła danych potrzebne do analizy tematu (kolejność zachowana)"""
+        topic = topic.lower()
+        sources = []
+        
+        for keywords, names in self.ANALYZE_TOPIC_SOURCES:
+            if any(keyword in topic for keyword in keywords):
+                sources.extend(name for name in names if name not in sources)
+        
+        return sources
     
     async def _format_ai_analysis(self, analysis: AIAnalysis, location: Dict) -> str:
         """Formatuj analizę AI na ładny tekst"""
@@ -1424,7 +4649,10 @@ Czas analizy: {datetime.now().strftime('%H:%M')}
         )
         
         # Zbierz dane
-        all_data = await self.data_collector.collect_all_data(location)
+        all_data = await self.data_collector.collect_all_data(location, self.COMMAND_SOURCES["where"])
+        
+        # Najbliższy przelot z lokalnego silnika SGP4
+        sat_pass = await self.data_collector.find_satellite_pass(sat_name, location, target_time)
         
         # Przygotuj dane o okazji
         opportunity_data = {
@@ -1434,6 +4662,12 @@ Czas analizy: {datetime.now().strftime('%H:%M')}
             "weather_conditions": all_data.get("weather", {}).get("current", {})
         }
         
+        if sat_pass:
+            opportunity_data["pass"] = {
+                key: value.isoformat() if isinstance(value, datetime) else value
+                for key, value in sat_pass.items()
+            }
+        
         # Analiza AI
         analysis = await self.ai_orchestrator.analyze_opportunity(
             opportunity_data,
@@ -1466,6 +4700,15 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
 📡 <b>UŻYJ:</b>
 <code>/location {optimal_position['lat']:.6f} {optimal_position['lon']:.6f}</code>
 """
+        
+        if sat_pass:
+            response += f"""
+🛰️ <b>PRZELOT {sat_pass['satellite']} (SGP4):</b>
+Wschód: {sat_pass['start_utc'].strftime('%H:%M')} UTC (azymut {sat_pass['rise_azimuth']:.0f}°)
+Kulminacja: {sat_pass['culmination_utc'].strftime('%H:%M')} UTC - elewacja {sat_pass['max_elevation']:.0f}°, azymut {sat_pass['culmination_azimuth']:.0f}°
+Zachód: {sat_pass['end_utc'].strftime('%H:%M')} UTC (azymut {sat_pass['set_azimuth']:.0f}°)
+"""
+        
         await self.send_message(chat_id, response)
         
         # Wyślij lokalizację
@@ -1486,7 +4729,7 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
         await self.send_message(chat_id, f"🌤️ AI analizuje pogodę dla {location['name']}...")
         
         # Zbierz dane pogodowe
-        all_data = await self.data_collector.collect_all_data(location)
+        all_data = await self.data_collector.collect_all_data(location, self.COMMAND_SOURCES["weather"])
         weather = all_data.get("weather", {})
         
         if not weather:
@@ -1496,7 +4739,7 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
         current = weather.get("current", {})
         
         # Zapytaj AI o analizę pogody
-        question = f"Przeanalizuj te dane pogodowe i oceń warunki do obserwacji astronomicznych: {json.dumps(current, indent=2)}"
+        question = "Przeanalizuj dane pogodowe z kontekstu i oceń warunki do obserwacji astronomicznych."
         answer = await self.ai_orchestrator.answer_question(question, {"weather": weather})
         
         # Formatuj odpowiedź
@@ -1527,7 +4770,7 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
         
         await self.send_message(chat_id, f"🚨 AI analizuje trzęsienia ziemi >{min_mag}M...")
         
-        all_data = await self.data_collector.collect_all_data()
+        all_data = await self.data_collector.collect_all_data(sources=self.COMMAND_SOURCES["earthquakes"])
         earthquakes = all_data.get("earthquakes", [])
         
         filtered = [eq for eq in earthquakes if eq.get('magnitude', 0) >= min_mag]
@@ -1537,7 +4780,7 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
             return
         
         # Zapytaj AI o analizę
-        question = f"Przeanalizuj te trzęsienia ziemi i oceń ryzyko: {json.dumps(filtered[:3], indent=2)}"
+        question = f"Przeanalizuj trzęsienia ziemi >{min_mag}M z kontekstu i oceń ryzyko."
         answer = await self.ai_orchestrator.answer_question(question, {"earthquakes": filtered})
         
         response = f"""
@@ -1566,14 +4809,14 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
         """Asteroidy z analizą AI"""
         await self.send_message(chat_id, "🪐 AI analizuje przeloty asteroid...")
         
-        all_data = await self.data_collector.collect_all_data()
+        all_data = await self.data_collector.collect_all_data(sources=self.COMMAND_SOURCES["asteroids"])
         asteroids = all_data.get("asteroids", [])
         
         # Znajdź niebezpieczne asteroidy
         hazardous = [a for a in asteroids if a.get('hazardous')]
         
         # Zapytaj AI
-        question = f"Przeanalizuj te asteroidy i oceń zagrożenie: {json.dumps(hazardous[:3], indent=2)}"
+        question = "Przeanalizuj asteroidy z kontekstu (hazardous = potencjalnie niebezpieczne) i oceń zagrożenie."
         answer = await self.ai_orchestrator.answer_question(question, {"asteroids": asteroids})
         
         response = f"""
@@ -1600,7 +4843,7 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
         """APOD z analizą AI"""
         await self.send_message(chat_id, "📸 AI analizuje Astronomy Picture of the Day...")
         
-        all_data = await self.data_collector.collect_all_data()
+        all_data = await self.data_collector.collect_all_data(sources=self.COMMAND_SOURCES["apod"])
         apod = all_data.get("apod", {})
         
         if not apod:
@@ -1608,7 +4851,7 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
             return
         
         # Zapytaj AI o analizę zdjęcia
-        question = f"Przeanalizuj to zdjęcie astronomiczne: {json.dumps(apod, indent=2)}"
+        question = "Przeanalizuj zdjęcie astronomiczne opisane w kontekście."
         answer = await self.ai_orchestrator.answer_question(question, {"apod": apod})
         
         response = f"""
@@ -1691,7 +4934,7 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
                 target += timedelta(days=1)
             
             return target
-        except:
+        except (ValueError, TypeError):
             return now + timedelta(hours=1)
     
     async def _send_location(self, chat_id: int, lat: float, lon: float):
@@ -1699,30 +4942,17 @@ Lokalny (PL): {(target_time + timedelta(hours=1)).strftime('%H:%M')}
         if not self.available:
             return
         
-        url = f"{self.base_url}/sendLocation"
         payload = {
             "chat_id": chat_id,
             "latitude": lat,
             "longitude": lon
         }
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                await session.post(url, json=payload, timeout=5)
-        except:
-            pass
-
-# ====================== FLASK APP ======================
-
-app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+        await self._telegram_call("sendLocation", payload, timeout=5)
 
-bot = AIPoweredTelegramBot()
+# ====================== STRONA GŁÓWNA ======================
 
-@app.route('/')
-def home():
-    return '''
+HOME_PAGE_HTML = '''
     <!DOCTYPE html>
     <html>
     <head>
@@ -1852,8 +5082,332 @@ def home():
     </html>
     '''
 
+# ====================== FLASK APP ======================
+
+app = Flask(__name__)
+
+bot = AIPoweredTelegramBot()
+
+# ====================== DISPATCHER (WSPÓLNA PĘTLA ASYNCIO) ======================
+
+class UpdateDispatcher:
+    """Jedna długo żyjąca pętla asyncio w wątku tła z ograniczoną kolejką zadań"""
+    
+    def __init__(self, queue_size: int = DISPATCH_QUEUE_SIZE,
+                 concurrency: int = DISPATCH_CONCURRENCY):
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.loop = None
+        self.queue = None
+        self._thread = None
+        self._workers = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+    
+    def start(self):
+        """Uruchom pętlę w wątku tła (leniwie - bezpieczne po forku gunicorna)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name="AsyncDispatcher", daemon=True)
+            self._thread.start()
+        
+        self._ready.wait()
+    
+    def _run(self):
+        """Główna funkcja wątku tła"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._setup()
+        self.loop.call_soon(self._ready.set)
+        
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(bot.close())
+            self.loop.close()
+    
+    def _setup(self):
+        """Kolejka, workery i zadania startowe bota na self.loop"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [
+            self.loop.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+        
+        logger.info(f"🔄 Dispatcher uruchomiony: kolejka={self.queue_size}, współbieżność={self.concurrency}")
+        self.loop.create_task(bot.startup())
+    
+    async def attach(self):
+        """Działaj na bieżącej pętli serwera (aiohttp.web) zamiast na własnym wątku"""
+        self.loop = asyncio.get_running_loop()
+        self._setup()
+    
+    async def detach(self):
+        """Zatrzymaj workery na pętli serwera i zamknij zasoby bota"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await bot.close()
+    
+    async def _worker(self, worker_id: int):
+        """Pobieraj zadania z kolejki i wykonuj je"""
+        while True:
+            job, enqueued_at = await self.queue.get()
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - enqueued_at)
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"❌ Błąd zadania w workerze {worker_id}: {e}")
+                logger.error(f"❌ Traceback: {traceback.format_exc()}")
+            finally:
+                self.queue.task_done()
+    
+    async def enqueue(self, job) -> bool:
+        """Dodaj zadanie do kolejki (False gdy kolejka pełna)"""
+        try:
+            self.queue.put_nowait((job, time.perf_counter()))
+            return True
+        except asyncio.QueueFull:
+            return False
+    
+    async def put(self, job):
+        """Dodaj zadanie, czekając na miejsce w kolejce (long polling)"""
+        await self.queue.put((job, time.perf_counter()))
+    
+    def submit(self, job) -> bool:
+        """Przekaż zadanie (funkcję zwracającą korutynę) z dowolnego wątku"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self.enqueue(job), self.loop)
+        return future.result(timeout=5)
+    
+    def run(self, coro, timeout: Optional[float] = None):
+        """Wykonaj korutynę na wspólnej pętli i poczekaj na wynik"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout)
+    
+    def stop(self):
+        """Zatrzymaj pętlę"""
+        if self.loop is not None and self.loop.is_running():
+            for worker in self._workers:
+                self.loop.call_soon_threadsafe(worker.cancel)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+dispatcher = UpdateDispatcher()
+
+class UpdateDeduplicator:
+    """Okno ostatnich update_id - ponowione dostarczenie tej samej aktualizacji nie jest przetwarzane drugi raz
+    
+    Pierścień w pamięci wyłapuje duplikaty w tym samym workerze; blokada (SET NX z TTL) we wspólnym
+    cache L2 - duplikaty, które trafiły do innego workera gunicorna lub po restarcie.
+    """
+    
+    def __init__(self, shared=None, window: int = UPDATE_DEDUP_WINDOW, ttl: float = UPDATE_DEDUP_TTL):
+        self.shared = shared
+        self.ttl = ttl
+        self.recent = BoundedCache(max_entries=window, max_bytes=window * 256, max_age=ttl)
+        self._owner = f"{os.getpid()}-{id(self)}"
+        self.stats = {"checked": 0, "duplicates": 0, "shared_duplicates": 0, "shared_errors": 0}
+    
+    async def claim(self, update_id: int) -> bool:
+        """True = pierwsze dostarczenie (przetwarzamy), False = duplikat"""
+        self.stats["checked"] += 1
+        if self.recent.get(update_id) is not None:
+            self.stats["duplicates"] += 1
+            return False
+        
+        # Zapis przed await - równoległy duplikat w tym workerze trafi już w pierścień
+        self.recent.set(update_id, True)
+        
+        if self.shared is not None:
+            try:
+                if not await self.shared.acquire_lock(f"update:{update_id}", self._owner, self.ttl):
+                    self.stats["duplicates"] += 1
+                    self.stats["shared_duplicates"] += 1
+                    return False
+            except Exception as e:
+                # Magazyn niedostępny - zostaje sam pierścień (lepiej przetworzyć niż zgubić)
+                self.stats["shared_errors"] += 1
+                logger.warning(f"⚠️ Deduplikacja L2 niedostępna (update_id={update_id}): {e}")
+        
+        return True
+    
+    async def release(self, update_id: int):
+        """Cofnij zgłoszenie, gdy aktualizacja nie została przyjęta (Telegram ją ponowi)"""
+        self.recent.pop(update_id)
+        if self.shared is not None:
+            try:
+                await self.shared.release_lock(f"update:{update_id}", self._owner)
+            except Exception as e:
+                logger.warning(f"⚠️ Nie udało się zwolnić update_id={update_id} w L2: {e}")
+    
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "window": len(self.recent)}
+
+update_dedup = UpdateDeduplicator(bot.data_collector.shared_cache if UPDATE_DEDUP_SHARED else None)
+
+async def dispatch_update(update_id: Optional[int], chat_id: int, text: str) -> str:
+    """Deduplikacja po update_id i dodanie do kolejki: "queued", "duplicate" lub "busy" """
+    if update_id is not None and not await update_dedup.claim(update_id):
+        logger.info(f"♻️ Duplikat update_id={update_id} od {chat_id} - pomijam")
+        return "duplicate"
+    
+    if not await dispatcher.enqueue(lambda: process_message(chat_id, text)):
+        if update_id is not None:
+            await update_dedup.release(update_id)
+        return "busy"
+    
+    return "queued"
+
+async def process_message(chat_id: int, text: str):
+    """Przetwórz wiadomość tekstową na wspólnej pętli asyncio"""
+    try:
+        logger.info(f"🔧 Rozpoczynam przetwarzanie wiadomości od {chat_id}")
+        
+        if text.startswith('/'):
+            parts = text.split()
+            command = parts[0][1:]  # Usuń '/' z początku
+            args = parts[1:] if len(parts) > 1 else []
+            
+            logger.info(f"🛠️ Przetwarzanie komendy: /{command} z argumentami: {args}")
+            
+            # Sprawdź czy bot jest dostępny
+            if not bot.available:
+                logger.error("❌ Bot nie jest dostępny (brak tokena?)")
+                # Spróbuj wysłać wiadomość o błędzie
+                try:
+                    await bot.send_message(
+                        chat_id,
+                        "❌ <b>Bot nie jest skonfigurowany!</b>\n\n"
+                        "Administrator nie ustawił tokena Telegram."
+                    )
+                except Exception:
+                    pass
+                return
+            
+            # Stan czatu (lokalizacja, wskaźnik raportu) z trwałego magazynu
+            await bot.state.load(chat_id)
+            
+            # Komenda do kolejki czatu (po kolei, powtórzenia dołączają do trwającej) - wykona ją
+            # worker czatu, worker dispatchera nie czeka na jej kolej
+            kind = bot.command_kind(command)
+            if bot.mailbox.submit(chat_id, kind, args, lambda: run_command(chat_id, kind, command, args)) is not None:
+                logger.info(f"📥 Komenda /{command} w kolejce czatu {chat_id}")
+            
+        else:
+            logger.info(f"💬 Przetwarzanie zwykłej wiadomości")
+            await bot.send_message(
+                chat_id,
+                "🤖 <b>AI-Powered Earth Observatory v8.0</b>\n\n"
+                "Użyj <code>/start [lokalizacja]</code> aby AI od razu przeanalizowało WSZYSTKO!\n\n"
+                "<b>Przykład:</b> <code>/start warszawa</code>\n\n"
+                "<b>Albo zapytaj AI:</b> <code>/ai [twoje pytanie]</code>"
+            )
+            logger.info(f"✅ Wysłano odpowiedź na zwykłą wiadomość")
+        
+        logger.info(f"🎉 Przetworzono wiadomość od {chat_id}")
+        
+    except Exception as e:
+        logger.error(f"❌ Błąd przetwarzania wiadomości: {e}")
+        logger.error(f"❌ Traceback: {traceback.format_exc()}")
+        
+        await send_error_reply(chat_id, e)
+
+async def send_error_reply(chat_id: int, error: Exception):
+    """Spróbuj wysłać błąd do użytkownika"""
+    try:
+        await bot.send_message(
+            chat_id,
+            "❌ <b>Błąd systemu!</b>\n\n"
+            "Przepraszamy, wystąpił błąd podczas przetwarzania.\n"
+            "Spróbuj ponownie za chwilę.\n\n"
+            f"<code>Error: {str(error)[:100]}</code>"
+        )
+    except Exception as send_error:
+        logger.error(f"❌ Nie udało się wysłać błędu do użytkownika: {send_error}")
+
+async def run_command(chat_id: int, kind: str, command: str, args: List[str]):
+    """Komenda z pomiarem czasu (w workerze czatu); spany z danych, AI i wysyłki trafiają do jednego wpisu w logu"""
+    label = kind if kind in bot.COMMAND_KINDS else "unknown"
+    try:
+        with metrics.trace() as spans, COMMAND_SECONDS.time(label):
+            await bot.handle_command(chat_id, command, args)
+    except Exception as e:
+        logger.error(f"❌ Błąd komendy /{command} od {chat_id}: {e}")
+        logger.error(f"❌ Traceback: {traceback.format_exc()}")
+        await send_error_reply(chat_id, e)
+        return
+    
+    logger.info(f"✅ Zakończono przetwarzanie komendy /{command}")
+    if METRICS_TRACE_LOG and spans:
+        logger.info(f"⏱️ /{kind} dla {chat_id}: {metrics.summarize(spans)}")
+
+def check_webhook_update(data: Any) -> Tuple[Optional[Tuple[int, str]], Dict, int]:
+    """Walidacja aktualizacji z webhooka: ((chat_id, tekst) lub None, odpowiedź JSON, status HTTP)"""
+    # Debug: wypisz otrzymane dane
+    logger.info(f"📊 Otrzymane dane: {json.dumps(data, indent=2)[:500]}...")
+    
+    # ZABEZPIECZENIE 1: Sprawdź czy są poprawne dane
+    if not data or not isinstance(data, dict):
+        logger.warning("⚠️ Brak lub nieprawidłowe dane JSON")
+        return None, {"status": "ok", "message": "No valid data"}, 200
+    
+    # ZABEZPIECZENIE 2: Sprawdź czy jest pole 'message' lub 'edited_message'
+    if "message" not in data and "edited_message" not in data:
+        logger.warning("⚠️ Brak pola 'message' lub 'edited_message' w danych")
+        # Może to być update innego typu (np. callback_query)
+        return None, {"status": "ok", "message": "No message field"}, 200
+    
+    # Pobierz wiadomość (może być z message lub edited_message)
+    message = data.get("message") or data.get("edited_message")
+    
+    # ZABEZPIECZENIE 3: Sprawdź czy wiadomość jest słownikiem
+    if not message or not isinstance(message, dict):
+        logger.warning("⚠️ Wiadomość nie jest słownikiem")
+        return None, {"status": "error", "message": "Invalid message format"}, 400
+    
+    # ZABEZPIECZENIE 4: Sprawdź czy jest chat
+    if "chat" not in message:
+        logger.warning("⚠️ Brak pola 'chat' w wiadomości")
+        return None, {"status": "error", "message": "No chat in message"}, 400
+    
+    chat = message.get("chat", {})
+    
+    # ZABEZPIECZENIE 5: Sprawdź chat_id
+    chat_id = chat.get("id")
+    if not chat_id:
+        logger.warning("⚠️ Brak chat_id")
+        return None, {"status": "error", "message": "No chat_id"}, 400
+    
+    # ZABEZPIECZENIE 6: Pobierz tekst wiadomości
+    text = message.get("text", "").strip()
+    
+    # Debug informacje
+    logger.info(f"💬 Wiadomość od {chat_id}: '{text[:100]}...'")
+    logger.info(f"👤 Chat: {chat.get('first_name', 'Unknown')} {chat.get('last_name', '')} (@{chat.get('username', 'no_username')})")
+    
+    # ZABEZPIECZENIE 7: Jeśli brak tekstu, może to być inny typ wiadomości
+    if not text:
+        logger.info("ℹ️ Wiadomość bez tekstu (może być zdjęcie, lokalizacja, etc.)")
+        return None, {"status": "ok", "message": "No text message"}, 200
+    
+    return (chat_id, text), {"status": "ok"}, 200
+
+@app.route('/')
+def home():
+    return HOME_PAGE_HTML
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
+    """Webhook Telegram - czas do odpowiedzi trafia do metryk"""
+    started = time.perf_counter()
+    response, status = _flask_webhook()
+    WEBHOOK_SECONDS.observe(time.perf_counter() - started, "flask", str(status))
+    return response, status
+
+def _flask_webhook():
     """Webhook Telegram - POPRAWIONA WERSJA Z ZABEZPIECZENIAMI"""
     try:
         # DEBUG: Wypisz co otrzymaliśmy
@@ -1873,129 +5427,25 @@ def webhook():
             logger.error(f"❌ Dane: {request.data[:200]}")
             return jsonify({"status": "error", "message": "Invalid JSON"}), 400
         
-        # Debug: wypisz otrzymane dane
-        logger.info(f"📊 Otrzymane dane: {json.dumps(data, indent=2)[:500]}...")
-        
-        # ZABEZPIECZENIE 1: Sprawdź czy są poprawne dane
-        if not data or not isinstance(data, dict):
-            logger.warning("⚠️ Brak lub nieprawidłowe dane JSON")
-            return jsonify({"status": "ok", "message": "No valid data"}), 200
+        message, body, status = check_webhook_update(data)
+        if message is None:
+            return jsonify(body), status
         
-        # ZABEZPIECZENIE 2: Sprawdź czy jest pole 'message' lub 'edited_message'
-        if "message" not in data and "edited_message" not in data:
-            logger.warning("⚠️ Brak pola 'message' lub 'edited_message' w danych")
-            # Może to być update innego typu (np. callback_query)
-            return jsonify({"status": "ok", "message": "No message field"}), 200
+        chat_id, text = message
         
-        # Pobierz wiadomość (może być z message lub edited_message)
-        message = data.get("message") or data.get("edited_message")
+        # Przekaż wiadomość do wspólnej pętli asyncio (deduplikacja + ograniczona kolejka)
+        outcome = dispatcher.run(dispatch_update(data.get("update_id"), chat_id, text), timeout=5)
         
-        # ZABEZPIECZENIE 3: Sprawdź czy wiadomość jest słownikiem
-        if not message or not isinstance(message, dict):
-            logger.warning("⚠️ Wiadomość nie jest słownikiem")
-            return jsonify({"status": "error", "message": "Invalid message format"}), 400
-        
-        # ZABEZPIECZENIE 4: Sprawdź czy jest chat
-        if "chat" not in message:
-            logger.warning("⚠️ Brak pola 'chat' w wiadomości")
-            return jsonify({"status": "error", "message": "No chat in message"}), 400
-        
-        chat = message.get("chat", {})
-        
-        # ZABEZPIECZENIE 5: Sprawdź chat_id
-        chat_id = chat.get("id")
-        if not chat_id:
-            logger.warning("⚠️ Brak chat_id")
-            return jsonify({"status": "error", "message": "No chat_id"}), 400
-        
-        # ZABEZPIECZENIE 6: Pobierz tekst wiadomości
-        text = message.get("text", "").strip()
-        
-        # Debug informacje
-        logger.info(f"💬 Wiadomość od {chat_id}: '{text[:100]}...'")
-        logger.info(f"👤 Chat: {chat.get('first_name', 'Unknown')} {chat.get('last_name', '')} (@{chat.get('username', 'no_username')})")
-        
-        # ZABEZPIECZENIE 7: Jeśli brak tekstu, może to być inny typ wiadomości
-        if not text:
-            logger.info("ℹ️ Wiadomość bez tekstu (może być zdjęcie, lokalizacja, etc.)")
-            return jsonify({"status": "ok", "message": "No text message"}), 200
-        
-        # Uruchom przetwarzanie w tle
-        def process_message():
-            try:
-                logger.info(f"🔧 Rozpoczynam przetwarzanie wiadomości od {chat_id}")
-                
-                # Stwórz nową pętlę asyncio dla tego wątku
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                if text.startswith('/'):
-                    parts = text.split()
-                    command = parts[0][1:]  # Usuń '/' z początku
-                    args = parts[1:] if len(parts) > 1 else []
-                    
-                    logger.info(f"🛠️ Przetwarzanie komendy: /{command} z argumentami: {args}")
-                    
-                    # Sprawdź czy bot jest dostępny
-                    if not bot.available:
-                        logger.error("❌ Bot nie jest dostępny (brak tokena?)")
-                        # Spróbuj wysłać wiadomość o błędzie
-                        try:
-                            error_loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(error_loop)
-                            error_loop.run_until_complete(bot.send_message(
-                                chat_id,
-                                "❌ <b>Bot nie jest skonfigurowany!</b>\n\n"
-                                "Administrator nie ustawił tokena Telegram."
-                            ))
-                            error_loop.close()
-                        except:
-                            pass
-                        return
-                    
-                    # Wykonaj komendę
-                    loop.run_until_complete(bot.handle_command(chat_id, command, args))
-                    logger.info(f"✅ Zakończono przetwarzanie komendy /{command}")
-                    
-                else:
-                    logger.info(f"💬 Przetwarzanie zwykłej wiadomości")
-                    loop.run_until_complete(bot.send_message(
-                        chat_id,
-                        "🤖 <b>AI-Powered Earth Observatory v8.0</b>\n\n"
-                        "Użyj <code>/start [lokalizacja]</code> aby AI od razu przeanalizowało WSZYSTKO!\n\n"
-                        "<b>Przykład:</b> <code>/start warszawa</code>\n\n"
-                        "<b>Albo zapytaj AI:</b> <code>/ai [twoje pytanie]</code>"
-                    ))
-                    logger.info(f"✅ Wysłano odpowiedź na zwykłą wiadomość")
-                
-                loop.close()
-                logger.info(f"🎉 Przetworzono wiadomość od {chat_id}")
-                
-            except Exception as e:
-                logger.error(f"❌ Błąd przetwarzania wiadomości: {e}")
-                logger.error(f"❌ Traceback: {traceback.format_exc()}")
-                
-                # Spróbuj wysłać błąd do użytkownika
-                try:
-                    error_loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(error_loop)
-                    error_loop.run_until_complete(bot.send_message(
-                        chat_id,
-                        "❌ <b>Błąd systemu!</b>\n\n"
-                        "Przepraszamy, wystąpił błąd podczas przetwarzania.\n"
-                        "Spróbuj ponownie za chwilę.\n\n"
-                        f"<code>Error: {str(e)[:100]}</code>"
-                    ))
-                    error_loop.close()
-                except Exception as send_error:
-                    logger.error(f"❌ Nie udało się wysłać błędu do użytkownika: {send_error}")
+        if outcome == "duplicate":
+            return jsonify({"status": "ok", "message": "Duplicate update"}), 200
         
-        # Uruchom w tle
-        thread = threading.Thread(target=process_message, name=f"TelegramMsg-{chat_id}")
-        thread.daemon = True
-        thread.start()
+        if outcome == "busy":
+            logger.warning(f"⏳ Kolejka pełna - odrzucam wiadomość od {chat_id} (429)")
+            response = jsonify({"status": "busy", "message": "Queue full, retry later"})
+            response.headers["Retry-After"] = str(DISPATCH_RETRY_AFTER)
+            return response, 429
         
-        logger.info(f"🚀 Uruchomiono wątek przetwarzania dla chat_id: {chat_id}")
+        logger.info(f"🚀 Dodano do kolejki przetwarzania chat_id: {chat_id}")
         
         return jsonify({
             "status": "ok", 
@@ -2020,7 +5470,7 @@ def set_webhook():
         logger.info(f"🔗 Próbuję ustawić webhook: {webhook_url}")
         
         response = requests.post(
-            f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/setWebhook",
+            f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/setWebhook",
             json={"url": webhook_url},
             timeout=10
         )
@@ -2054,7 +5504,7 @@ def get_webhook_info():
     
     try:
         response = requests.get(
-            f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getWebhookInfo",
+            f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/getWebhookInfo",
             timeout=10
         )
         
@@ -2065,6 +5515,279 @@ def get_webhook_info():
     except Exception as e:
         return jsonify({"status": "error", "error": str(e)})
 
+def component_stats() -> Dict[str, Dict]:
+    """Liczniki komponentów eksportowane w /metrics (czytane na pętli dispatchera)"""
+    return {
+        "collector": bot.data_collector.get_cache_stats(),
+        "llm_cache": bot.ai_orchestrator.response_cache.get_stats(),
+        "prompts": bot.ai_orchestrator.prompt_builder.get_stats(),
+        "reports": bot.report_stats,
+        "send_queue": bot.send_queue.get_stats(),
+        "state": bot.state.get_stats(),
+        "mailbox": bot.mailbox.get_stats(),
+        "update_dedup": update_dedup.get_stats(),
+        "prewarm": bot.prewarm.stats,
+        "circuit": circuit_breakers.get_stats(),
+        "latency": {**bot.data_collector.latency.get_stats(), **bot.ai_orchestrator.latency.get_stats()},
+        "dispatcher": {
+            "queue_depth": dispatcher.queue.qsize() if dispatcher.queue is not None else 0,
+            "queue_size": dispatcher.queue_size
+        }
+    }
+
+async def render_metrics() -> str:
+    return metrics.render(component_stats())
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@app.route('/metrics', methods=['GET'])
+def metrics_page():
+    """Metryki w formacie Prometheusa (dla tego workera - każdy worker gunicorna ma własne)"""
+    return dispatcher.run(render_metrics(), timeout=5), 200, {"Content-Type": METRICS_CONTENT_TYPE}
+
+# ====================== LONG POLLING (getUpdates) ======================
+
+def extract_text_message(update: Dict) -> Optional[Tuple[int, str]]:
+    """(chat_id, tekst) z aktualizacji lub None, gdy to nie jest wiadomość tekstowa"""
+    message = update.get("message") or update.get("edited_message")
+    if not isinstance(message, dict):
+        return None
+    
+    chat_id = (message.get("chat") or {}).get("id")
+    text = (message.get("text") or "").strip()
+    if not chat_id or not text:
+        return None
+    return chat_id, text
+
+
+class UpdatePoller:
+    """Pobiera aktualizacje przez getUpdates (do POLLING_LIMIT na wywołanie) i przekazuje je
+    do kolejki dispatchera - przetwarzanie równoległe na wspólnej pętli, bez publicznego URL"""
+    
+    def __init__(self, bot: AIPoweredTelegramBot, dispatcher: UpdateDispatcher,
+                 timeout: int = POLLING_TIMEOUT, limit: int = POLLING_LIMIT):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.timeout = timeout
+        self.limit = min(max(limit, 1), 100)
+        self.offset = 0
+        self.stats = {"polls": 0, "updates": 0, "messages": 0, "errors": 0}
+    
+    async def run(self):
+        """Pętla long pollingu (do anulowania)"""
+        await self._api("deleteWebhook", {"drop_pending_updates": False})
+        logger.info(f"📥 Long polling: limit={self.limit}, timeout={self.timeout}s")
+        
+        backoff = 1.0
+        while True:
+            try:
+                updates = await self.poll_once()
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"⚠️ getUpdates nieudane: {e} - ponowienie za {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            
+            if updates is None:
+                await asyncio.sleep(backoff)
+    
+    async def poll_once(self) -> Optional[int]:
+        """Jedno wywołanie getUpdates - zwraca liczbę aktualizacji (None przy błędzie API)"""
+        updates = await self._api("getUpdates", {
+            "offset": self.offset,
+            "limit": self.limit,
+            "timeout": self.timeout,
+            "allowed_updates": ["message", "edited_message"]
+        }, timeout=self.timeout + 10)
+        self.stats["polls"] += 1
+        
+        if updates is None:
+            return None
+        
+        for update in updates:
+            # Offset przesuwamy od razu - następne getUpdates potwierdza odebrane aktualizacje
+            self.offset = max(self.offset, update["update_id"] + 1)
+            self.stats["updates"] += 1
+            
+            # Po restarcie getUpdates może zwrócić niepotwierdzone, już przetworzone aktualizacje
+            if not await update_dedup.claim(update["update_id"]):
+                continue
+            
+            message = extract_text_message(update)
+            if message is None:
+                continue
+            
+            chat_id, text = message
+            self.stats["messages"] += 1
+            # put() zamiast put_nowait(): pełna kolejka wstrzymuje pobieranie zamiast gubić wiadomości
+            await self.dispatcher.put(lambda chat_id=chat_id, text=text: process_message(chat_id, text))
+        
+        return len(updates)
+    
+    async def _api(self, method: str, payload: Dict, timeout: float = 10) -> Optional[Any]:
+        """Wywołanie Bot API poza kolejką wysyłki (nie dotyczy żadnego czatu)"""
+        session = await self.bot.http.get_session()
+        async with session.post(f"{self.bot.base_url}/{method}", json=payload, timeout=timeout) as response:
+            data = await response.json()
+            if response.status == 409:
+                # Aktywny webhook blokuje getUpdates
+                logger.warning("⚠️ getUpdates: konflikt z webhookiem - usuwam webhook")
+                await self._api("deleteWebhook", {"drop_pending_updates": False})
+                return None
+            if response.status != 200 or not data.get("ok"):
+                logger.warning(f"⚠️ {method}: {response.status} {data.get('description', '')}")
+                return None
+            return data.get("result")
+
+
+def run_polling():
+    """Tryb long polling: bez Flaska i bez setWebhook"""
+    poller = UpdatePoller(bot, dispatcher)
+    try:
+        dispatcher.run(poller.run())
+    except KeyboardInterrupt:
+        logger.info("🛑 Zatrzymano long polling")
+    finally:
+        dispatcher.stop()
+
+# ====================== SERWER ASYNCHRONICZNY (aiohttp.web) ======================
+
+async def telegram_api_request(method: str, payload: Optional[Dict] = None) -> Tuple[int, Any]:
+    """Wywołanie Bot API ze wspólnej sesji - (status HTTP, JSON lub tekst odpowiedzi)"""
+    session = await bot.http.get_session()
+    async with session.post(f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/{method}",
+                            json=payload or {}, timeout=10) as response:
+        try:
+            return response.status, await response.json()
+        except (aiohttp.ContentTypeError, ValueError):
+            return response.status, await response.text()
+
+
+async def web_home(request: web.Request) -> web.Response:
+    return web.Response(text=HOME_PAGE_HTML, content_type="text/html")
+
+
+async def web_webhook(request: web.Request) -> web.Response:
+    """Webhook Telegram na pętli serwera - czas do odpowiedzi trafia do metryk"""
+    started = time.perf_counter()
+    response = await _web_webhook(request)
+    WEBHOOK_SECONDS.observe(time.perf_counter() - started, "aiohttp", str(response.status))
+    return response
+
+
+async def _web_webhook(request: web.Request) -> web.Response:
+    """Webhook Telegram na pętli serwera - bez wątków i bez Flaska"""
+    try:
+        raw = await request.read()
+        if not raw:
+            logger.warning("⚠️ Brak danych w żądaniu")
+            return web.json_response({"status": "error", "message": "No data"}, status=400)
+        
+        try:
+            data = json.loads(raw)
+        except ValueError as json_error:
+            logger.error(f"❌ Błąd parsowania JSON: {json_error}")
+            return web.json_response({"status": "error", "message": "Invalid JSON"}, status=400)
+        
+        message, body, status = check_webhook_update(data)
+        if message is None:
+            return web.json_response(body, status=status)
+        
+        chat_id, text = message
+        
+        # Ta sama deduplikacja i ograniczona kolejka co w trybie Flask - workery działają na pętli serwera
+        outcome = await dispatch_update(data.get("update_id"), chat_id, text)
+        
+        if outcome == "duplicate":
+            return web.json_response({"status": "ok", "message": "Duplicate update"})
+        
+        if outcome == "busy":
+            logger.warning(f"⏳ Kolejka pełna - odrzucam wiadomość od {chat_id} (429)")
+            return web.json_response(
+                {"status": "busy", "message": "Queue full, retry later"},
+                status=429, headers={"Retry-After": str(DISPATCH_RETRY_AFTER)}
+            )
+        
+        return web.json_response({
+            "status": "ok",
+            "message": "Processing in background",
+            "chat_id": chat_id,
+            "text": text[:100]
+        })
+    
+    except Exception as e:
+        logger.error(f"❌ Webhook error: {e}")
+        logger.error(f"❌ Traceback: {traceback.format_exc()}")
+        return web.json_response({"status": "error", "error": str(e)}, status=500)
+
+
+async def web_set_webhook(request: web.Request) -> web.Response:
+    """Ustaw webhook"""
+    if not TELEGRAM_BOT_TOKEN:
+        return web.json_response({"status": "error", "message": "Brak tokena"}, status=400)
+    
+    webhook_url = f"{RENDER_URL}/webhook"
+    try:
+        status, result = await telegram_api_request("setWebhook", {"url": webhook_url})
+    except Exception as e:
+        logger.error(f"❌ Błąd ustawiania webhooka: {e}")
+        return web.json_response({"status": "error", "error": str(e)})
+    
+    logger.info(f"📡 Odpowiedź Telegram API: {status}")
+    return web.json_response({
+        "status": "success" if status == 200 else "error",
+        "webhook_url": webhook_url,
+        "response": result
+    })
+
+
+async def web_get_webhook_info(request: web.Request) -> web.Response:
+    """Pobierz informacje o webhooku"""
+    if not TELEGRAM_BOT_TOKEN:
+        return web.json_response({"status": "error", "message": "Brak tokena"}, status=400)
+    
+    try:
+        status, result = await telegram_api_request("getWebhookInfo")
+    except Exception as e:
+        return web.json_response({"status": "error", "error": str(e)})
+    
+    if status == 200:
+        return web.json_response(result)
+    return web.json_response({"status": "error", "response": result})
+
+
+async def _web_startup(app: web.Application):
+    await dispatcher.attach()
+
+
+async def _web_cleanup(app: web.Application):
+    await dispatcher.detach()
+
+
+async def web_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=(await render_metrics()).encode("utf-8"), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+
+def create_web_app(argv: Optional[List[str]] = None) -> web.Application:
+    """Aplikacja aiohttp.web z tymi samymi ścieżkami co Flask
+    
+    Uruchomienie (domyślny tryb): python bot.py
+    lub: python -m aiohttp.web -H 0.0.0.0 -P $PORT bot:create_web_app
+    """
+    web_app = web.Application()
+    web_app.router.add_get('/', web_home)
+    web_app.router.add_post('/webhook', web_webhook)
+    web_app.router.add_get('/set_webhook', web_set_webhook)
+    web_app.router.add_get('/get_webhook_info', web_get_webhook_info)
+    web_app.router.add_get('/metrics', web_metrics)
+    web_app.on_startup.append(_web_startup)
+    web_app.on_cleanup.append(_web_cleanup)
+    return web_app
+
 # ====================== URUCHOMIENIE ======================
 if __name__ == "__main__":
     print("=" * 80)
@@ -2100,13 +5823,15 @@ if __name__ == "__main__":
     print(f"   🌀 Aurora: ✅ SYMULACJA")
     print("=" * 80)
     
-    if TELEGRAM_BOT_TOKEN:
+    if TELEGRAM_BOT_TOKEN and BOT_MODE == "polling":
+        print("📥 Tryb long polling (getUpdates) - webhook nie jest ustawiany")
+    elif TELEGRAM_BOT_TOKEN:
         try:
             webhook_url = f"{RENDER_URL}/webhook"
             print(f"🔗 Próbuję ustawić webhook automatycznie...")
             
             response = requests.post(
-                f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/setWebhook",
+                f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/setWebhook",
                 json={"url": webhook_url},
                 timeout=5
             )
@@ -2150,5 +5875,11 @@ if __name__ == "__main__":
     print("🤖 SYSTEM AI GOTOWY DO DZIAŁANIA!")
     print("=" * 80)
     
-    # Uruchom Flask
-    app.run(host="0.0.0.0", port=PORT, debug=False)
\ No newline at end of file
+    if BOT_MODE == "polling":
+        run_polling()
+    elif BOT_MODE == "aiohttp":
+        # Webhook na pętli serwera aiohttp.web
+        web.run_app(create_web_app(), host="0.0.0.0", port=PORT)
+    else:
+        # Uruchom Flask
+        app.run(host="0.0.0.0", port=PORT, debug=False)
\ No newline at end of file
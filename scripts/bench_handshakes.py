@@ -0,0 +1,82 @@
+"""Połączenia TCP na komendę - wszystkie hosty (Telegram, DeepSeek, API danych) przekierowane do lokalnej zaślepki
+
+Użycie: python scripts/bench_handshakes.py [katalog z bot.py]
+Porównanie przed/po: uruchom raz z katalogiem starszej wersji (np. z `git worktree add`), raz z bieżącym.
+"""
+import asyncio
+import json
+import os
+import sys
+
+os.environ.update(TELEGRAM_BOT_TOKEN="x:y", DEEPSEEK_API_KEY="k", N2YO_API_KEY="k", OPENWEATHER_API_KEY="k")
+os.environ.setdefault("STATE_BACKEND", "memory")
+os.environ.setdefault("SHARED_CACHE_BACKEND", "memory")
+os.environ.setdefault("PREWARM_ENABLED", "0")
+sys.path.insert(0, sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+import yarl  # noqa: E402
+
+BODY = json.dumps({
+    "choices": [{"message": {"content": "🔴 ALERTY\n- a\n🎯 REKOMENDACJE\n- b"}}],
+    "ok": True, "result": {"message_id": 1}
+}).encode()
+
+counters = {"connections": 0, "requests": 0}
+port = None
+
+
+class StubProtocol(asyncio.Protocol):
+    """Minimalny serwer HTTP/1.1 keep-alive - liczy połączenia i zapytania"""
+    
+    def connection_made(self, transport):
+        counters["connections"] += 1
+        self.transport = transport
+        self.buffer = b""
+    
+    def data_received(self, data):
+        self.buffer += data
+        while b"\r\n\r\n" in self.buffer:
+            head, _, rest = self.buffer.partition(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            if len(rest) < length:
+                return
+            self.buffer = rest[length:]
+            counters["requests"] += 1
+            self.transport.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(BODY) + BODY
+            )
+
+
+_original_request = aiohttp.ClientSession._request
+
+
+async def _redirected_request(self, method, url, **kwargs):
+    path = yarl.URL(str(url)).path
+    return await _original_request(self, method, yarl.URL.build(scheme="http", host="127.0.0.1", port=port, path=path), **kwargs)
+
+
+async def main():
+    global port
+    server = await asyncio.get_running_loop().create_server(StubProtocol, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    aiohttp.ClientSession._request = _redirected_request
+    
+    import bot
+    
+    for command in ["start", "earthquakes", "weather"]:
+        bot.bot.data_collector.cache.clear()
+        connections, requests = counters["connections"], counters["requests"]
+        await bot.bot.handle_command(1, command, [])
+        print(f"/{command}: {counters['connections'] - connections} połączeń TCP, "
+              f"{counters['requests'] - requests} zapytań HTTP")
+    
+    await bot.bot.close()
+    server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
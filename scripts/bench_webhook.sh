@@ -0,0 +1,38 @@
+#!/usr/bin/env bash
+# Benchmark webhooka: Flask + gunicorn (sync i gthread) vs aiohttp.web na pętli bota
+# Bot API zastąpione lokalną zaślepką; każdy serwer: rozgrzewka + pomiar (3000 × /help, 50 równolegle)
+#
+# Użycie: scripts/bench_webhook.sh [N] [C]
+set -u
+cd "$(dirname "$0")/.."
+
+N=${1:-3000}
+C=${2:-50}
+STUB_PORT=${STUB_PORT:-8767}
+
+export TELEGRAM_BOT_TOKEN=T TELEGRAM_API_URL=http://127.0.0.1:$STUB_PORT TELEGRAM_GLOBAL_RATE=100000
+export PREWARM_ENABLED=0 STATE_BACKEND=memory SHARED_CACHE_BACKEND=memory DISPATCH_QUEUE_SIZE=100000
+export PYTHONPATH=$PWD
+
+python scripts/telegram_stub.py "$STUB_PORT" & STUB=$!
+trap 'kill $STUB 2>/dev/null' EXIT
+sleep 1
+
+bench() {
+    local port=$1
+    sleep 3
+    python scripts/webhook_load.py "http://127.0.0.1:$port/webhook" "$N" "$C" "http://127.0.0.1:$STUB_PORT" >/dev/null
+    python scripts/webhook_load.py "http://127.0.0.1:$port/webhook" "$N" "$C" "http://127.0.0.1:$STUB_PORT"
+}
+
+echo "flask + gunicorn sync (1 worker)"
+gunicorn -w 1 -b 127.0.0.1:9001 --log-level error bot:app >/dev/null 2>&1 & SERVER=$!
+bench 9001; kill $SERVER; wait $SERVER 2>/dev/null
+
+echo "flask + gunicorn gthread (1 worker, 8 wątków)"
+gunicorn -w 1 --threads 8 -b 127.0.0.1:9002 --log-level error bot:app >/dev/null 2>&1 & SERVER=$!
+bench 9002; kill $SERVER; wait $SERVER 2>/dev/null
+
+echo "aiohttp.web"
+BOT_MODE=aiohttp python -m aiohttp.web -H 127.0.0.1 -P 9003 bot:create_web_app >/dev/null 2>&1 & SERVER=$!
+bench 9003; kill $SERVER; wait $SERVER 2>/dev/null
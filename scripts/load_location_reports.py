@@ -0,0 +1,73 @@
+"""Obciążenie /start: liczba wywołań LLM ma rosnąć z liczbą lokalizacji, nie użytkowników
+
+Każdy użytkownik wysyła /start z jedną z predefiniowanych lokalizacji. Bot API, zbieranie
+danych i analiza LLM są zastąpione lokalnie (LLM: 200 ms na wywołanie), reszta ścieżki
+(_get_location_report, wskaźniki czatów, formatowanie) działa bez zmian.
+
+Użycie: python scripts/load_location_reports.py [liczby użytkowników, domyślnie 100 1000 5000]
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "x:y")
+os.environ.setdefault("STATE_BACKEND", "memory")
+os.environ.setdefault("SHARED_CACHE_BACKEND", "memory")
+os.environ.setdefault("PREWARM_ENABLED", "0")
+os.environ.setdefault("METRICS_TRACE_LOG", "0")
+os.environ.setdefault("DEEPSEEK_STREAMING", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+USER_COUNTS = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000]
+
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    telegram_bot = bot.bot
+    orchestrator = telegram_bot.ai_orchestrator
+    llm_calls = {"n": 0}
+    
+    async def fake_telegram_call(method, payload, timeout=10):
+        await asyncio.sleep(0)
+        return {"message_id": 1}
+    
+    async def fake_collect(location, sources=None):
+        return {"location": location["name"], "weather": {"clouds": 20, "temp": 12.5},
+                "timestamp": time.time()}
+    
+    async def fake_analysis(all_data, user_context="", on_progress=None):
+        llm_calls["n"] += 1
+        await asyncio.sleep(0.2)
+        return orchestrator._generate_mock_analysis(all_data)
+    
+    telegram_bot._telegram_call = fake_telegram_call
+    telegram_bot.data_collector.collect_all_data = fake_collect
+    orchestrator.analyze_all_data = fake_analysis
+    
+    names = list(telegram_bot.locations)
+    random.seed(1)
+    
+    for users in USER_COUNTS:
+        telegram_bot.location_reports.clear()
+        llm_calls["n"] = 0
+        chosen = [random.choice(names) for _ in range(users)]
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            telegram_bot.handle_command(100_000 + chat, "start", [name]) for chat, name in enumerate(chosen)
+        ))
+        elapsed = time.perf_counter() - started
+        
+        print(f"{users:>5} użytkowników, {len(set(chosen))} lokalizacji -> {llm_calls['n']} wywołań LLM "
+              f"({elapsed:.2f}s)")
+    
+    print("raporty:", telegram_bot.report_stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""Soak cache kolektora i raportów lokalizacji: N czatów, każdy z inną losową lokalizacją
+
+Pobieranie danych i LLM zastąpione lokalnie (bez sieci); mierzona jest pamięć (tracemalloc)
+zajęta przez cache - przy limitach BoundedCache ma przestać rosnąć po zapełnieniu.
+
+Użycie: python scripts/soak_caches.py [liczba czatów, domyślnie 100000]
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("STATE_BACKEND", "memory")
+os.environ.setdefault("SHARED_CACHE_BACKEND", "memory")
+os.environ.setdefault("PREWARM_ENABLED", "0")
+os.environ.setdefault("METRICS_TRACE_LOG", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+CHATS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+REPORT_EVERY = max(1, CHATS // 5)
+
+
+async def fake_weather(location):
+    return {"weather": {
+        "temperature": round(random.uniform(-10, 30), 1),
+        "description": "zachmurzenie umiarkowane " * 4,
+        "hourly": [{"hour": h, "clouds": random.randint(0, 100), "temp": random.random()} for h in range(24)],
+        "location": location
+    }}
+
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    collector = bot.bot.data_collector
+    orchestrator = bot.bot.ai_orchestrator
+    collector._fetch_weather = fake_weather
+    
+    async def fake_analysis(all_data, user_context="", on_progress=None):
+        return orchestrator._generate_mock_analysis(all_data)
+    
+    orchestrator.analyze_all_data = fake_analysis
+    
+    random.seed(1)
+    tracemalloc.start()
+    started = time.perf_counter()
+    
+    for chat in range(1, CHATS + 1):
+        location = {"name": f"chat-{chat}", "lat": random.uniform(-90, 90), "lon": random.uniform(-180, 180)}
+        all_data = await collector.get_weather_data(location)
+        await bot.bot._get_location_report(location, all_data, "new_user")
+        
+        if chat % REPORT_EVERY == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            print(f"{chat:>7} czatów: pamięć {current / 2**20:6.1f} MB | "
+                  f"kolektor {len(collector.cache._data)} wpisów, {collector.cache.total_bytes / 2**20:.1f} MB | "
+                  f"raporty {len(bot.bot.location_reports._data)} wpisów, "
+                  f"{bot.bot.location_reports.total_bytes / 2**20:.1f} MB")
+    
+    print(f"czas: {time.perf_counter() - started:.1f}s")
+    print("kolektor:", collector.cache.get_stats())
+    print("raporty:", bot.bot.location_reports.get_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
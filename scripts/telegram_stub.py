@@ -0,0 +1,31 @@
+"""Zaślepka Bot API dla benchmarku webhooka - liczy wywołania metod (GET /count, GET /reset)
+
+Użycie: python scripts/telegram_stub.py [port, domyślnie 8767]
+"""
+import sys
+
+from aiohttp import web
+
+counter = {"n": 0}
+
+
+async def handle(request: web.Request) -> web.Response:
+    name = request.match_info["name"]
+    if name == "count":
+        return web.json_response(counter)
+    if name == "reset":
+        counter["n"] = 0
+        return web.json_response(counter)
+    
+    await request.read()
+    counter["n"] += 1
+    return web.json_response({"ok": True, "result": {"message_id": 1}})
+
+
+app = web.Application()
+app.router.add_route("*", "/bot{token}/{name}", handle)
+app.router.add_route("*", "/{name}", handle)
+
+if __name__ == "__main__":
+    web.run_app(app, host="127.0.0.1", port=int(sys.argv[1]) if len(sys.argv) > 1 else 8767,
+                access_log=None, print=None)
@@ -0,0 +1,69 @@
+"""Generator obciążenia webhooka: N aktualizacji /help przy C równoległych połączeniach
+
+Mierzy potwierdzenia webhooka/s, odpowiedzi dostarczone do zaślepki Bot API/s
+(end-to-end) oraz p50/p99 czasu odpowiedzi HTTP webhooka.
+
+Użycie: python scripts/webhook_load.py URL_WEBHOOKA [N] [C] [URL_ZAŚLEPKI]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import aiohttp
+
+URL = sys.argv[1]
+TOTAL = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+STUB_URL = sys.argv[4] if len(sys.argv) > 4 else "http://127.0.0.1:8767"
+
+
+async def main():
+    latencies = []
+    statuses = {}
+    sent = 0
+    
+    # Unikalne update_id w każdym uruchomieniu - inaczej deduplikacja aktualizacji odrzuci powtórki
+    first_update = int(time.time() * 1000) % 10**12
+    
+    async with aiohttp.ClientSession() as session:
+        await session.get(f"{STUB_URL}/reset")
+        
+        async def worker():
+            nonlocal sent
+            while sent < TOTAL:
+                sent += 1
+                update_id = first_update + sent
+                body = {"update_id": update_id, "message": {
+                    "message_id": sent, "chat": {"id": 100_000 + sent}, "text": "/help"
+                }}
+                started = time.perf_counter()
+                async with session.post(URL, json=body) as response:
+                    await response.read()
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                latencies.append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        acked = time.perf_counter() - started
+        
+        # Czekaj, aż wszystkie przyjęte aktualizacje dostaną odpowiedź w zaślepce Bot API
+        while True:
+            delivered = (await (await session.get(f"{STUB_URL}/count")).json())["n"]
+            if delivered >= statuses.get(200, 0) or time.perf_counter() - started > 120:
+                break
+            await asyncio.sleep(0.02)
+        end_to_end = time.perf_counter() - started
+    
+    latencies.sort()
+    print(json.dumps({
+        "acked_per_s": round(TOTAL / acked),
+        "e2e_per_s": round(delivered / end_to_end),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1),
+        "statuses": statuses
+    }))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
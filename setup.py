@@ -12,6 +12,8 @@ setup(
     extras_require={
         "quantum": ["qiskit>=1.0.0", "qiskit-ibm-runtime>=0.21.0", "qiskit-aer>=0.12.0"],
         "ai": ["numpy>=1.24.0"],
+        "satellites": ["skyfield>=1.46", "numpy>=1.24.0"],
+        "redis": ["redis>=4.2.0"],
         "scheduler": ["APScheduler>=3.10.4"],
     },
     python_requires=">=3.8",
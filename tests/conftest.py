@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Bot importowany bez trwałego stanu, cache L2 i harmonogramu prewarm
+os.environ.setdefault("STATE_BACKEND", "memory")
+os.environ.setdefault("SHARED_CACHE_BACKEND", "memory")
+os.environ.setdefault("PREWARM_ENABLED", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import bot
+
+
+def run_briefings(monkeypatch, stale: bool):
+    deadlines = []
+    collector = bot.bot.data_collector
+    orchestrator = bot.bot.ai_orchestrator
+    
+    async def fake_collect(location, sources=None, deadline=bot.COLLECT_DEADLINE):
+        deadlines.append(deadline)
+        data = {"timestamp": "t", "user_location": location, "weather": {}, "earthquakes": [],
+                "asteroids": [], "satellite_passes": [], "visibility_zones": [], "space_weather": None}
+        if stale:
+            data["stale_data"] = {"weather": {"stored_at": None, "reason": "przekroczony budżet czasu"}}
+        return data
+    
+    async def fake_analysis(all_data, user_context="", on_progress=None):
+        return orchestrator._generate_mock_analysis(all_data)
+    
+    monkeypatch.setattr(collector, "collect_all_data", fake_collect)
+    monkeypatch.setattr(orchestrator, "analyze_all_data", fake_analysis)
+    monkeypatch.setattr(bot.bot, "active_locations", lambda: [bot.bot.locations["warszawa"]])
+    bot.bot.briefings.clear()
+    
+    async def scenario():
+        scheduler = bot.bot.prewarm
+        scheduler._semaphore = asyncio.Semaphore(1)
+        await scheduler.prewarm_briefings()
+        await bot.bot.get_briefing(bot.bot.locations["krakow"])
+    
+    asyncio.run(scenario())
+    return deadlines
+
+
+def briefing_age(location_name: str) -> float:
+    key = f"{location_name}|{time.strftime('%Y-%m-%d')}"
+    _, stored_at = bot.bot.briefings.get_entry(key)
+    return time.time() - stored_at
+
+
+def test_prewarm_collects_without_deadline(monkeypatch):
+    deadlines = run_briefings(monkeypatch, stale=False)
+    assert deadlines == [0, bot.COLLECT_DEADLINE]
+    assert briefing_age("Warszawa") < 60
+
+
+def test_stale_briefing_cached_briefly(monkeypatch):
+    run_briefings(monkeypatch, stale=True)
+    assert briefing_age("Warszawa") > bot.BRIEFING_CACHE_TTL - bot.BRIEFING_STALE_TTL - 60
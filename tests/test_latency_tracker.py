@@ -0,0 +1,50 @@
+from bot import LatencyTracker
+
+
+def call(tracker: LatencyTracker, source: str, latency: float) -> bool:
+    """Symulacja zapytania: sukces gdy odpowiedź zmieściła się w bieżącym timeoucie"""
+    timeout = tracker.timeout_for(source)
+    if latency > timeout:
+        tracker.record_timeout(source, timeout)
+        return False
+    tracker.record(source, latency)
+    return True
+
+
+def test_fixed_limit_until_enough_samples():
+    tracker = LatencyTracker({"api": 10}, factor=3, minimum=2, min_samples=20)
+    for _ in range(19):
+        tracker.record("api", 0.1)
+    assert tracker.timeout_for("api") == 10
+
+
+def test_timeout_recovers_after_latency_shifts_up():
+    tracker = LatencyTracker({"api": 10}, factor=3, minimum=2, min_samples=20)
+    for _ in range(25):
+        assert call(tracker, "api", 0.1)
+    assert tracker.timeout_for("api") == 2
+    
+    results = [call(tracker, "api", 2.5) for _ in range(12)]
+    assert results[0] is False
+    assert all(results[1:])
+    assert tracker.timeout_for("api") >= 2.5 * 3
+
+
+def test_backoff_with_full_window_of_fast_samples():
+    tracker = LatencyTracker({"api": 10}, factor=3, minimum=2, min_samples=20, window=200)
+    for _ in range(200):
+        tracker.record("api", 0.1)
+    
+    results = [call(tracker, "api", 5.0) for _ in range(5)]
+    assert results[:2] == [False, False]
+    assert all(results[2:])
+
+
+def test_backoff_capped_at_limit():
+    tracker = LatencyTracker({"api": 10}, factor=3, minimum=2, min_samples=20)
+    for _ in range(25):
+        tracker.record("api", 0.1)
+    for _ in range(8):
+        assert not call(tracker, "api", 60)
+    assert tracker.timeout_for("api") == 10
+    assert tracker.get_stats()["api"]["consecutive_timeouts"] == 8
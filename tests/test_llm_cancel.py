@@ -0,0 +1,80 @@
+import asyncio
+
+from bot import LLMResponseCache, TelegramStreamSink
+
+
+class SlowCall:
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+    
+    async def __call__(self):
+        self.started += 1
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"content": "ok", "tokens": 1, "latency": 5}
+
+
+def test_llm_call_cancelled_with_last_waiter():
+    async def scenario():
+        cache = LLMResponseCache(cache_dir="")
+        call = SlowCall()
+        first = asyncio.ensure_future(cache.get_or_call("k", call))
+        second = asyncio.ensure_future(cache.get_or_call("k", call))
+        await asyncio.sleep(0.05)
+        
+        first.cancel()
+        await asyncio.sleep(0.05)
+        assert call.cancelled == 0
+        
+        second.cancel()
+        await asyncio.sleep(0.05)
+        assert call.cancelled == 1
+        assert cache.get_stats()["inflight"] == 0
+        
+        # Nowe zapytanie po anulowaniu uruchamia świeże wywołanie zamiast dostać CancelledError
+        third = asyncio.ensure_future(cache.get_or_call("k", call))
+        await asyncio.sleep(0.05)
+        assert call.started == 2
+        third.cancel()
+        await asyncio.gather(first, second, third, return_exceptions=True)
+    
+    asyncio.run(scenario())
+
+
+def test_stream_sink_stops_editing_after_command_cancelled():
+    class FakeBot:
+        def __init__(self):
+            self.edits = []
+        
+        async def _telegram_call(self, method, payload):
+            return {"message_id": 1}
+        
+        async def edit_message(self, chat_id, message_id, text, parse_html=True):
+            self.edits.append(text)
+            return True
+    
+    async def scenario():
+        bot = FakeBot()
+        sink = TelegramStreamSink(bot, 1, interval=0, min_chars=0)
+        
+        async def command():
+            await sink.start("...")
+            await asyncio.sleep(5)
+        
+        task = asyncio.ensure_future(command())
+        await asyncio.sleep(0.01)
+        await sink.update("a")
+        await asyncio.sleep(0.01)
+        assert len(bot.edits) == 1
+        
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await sink.update("ab")
+        await asyncio.sleep(0.01)
+        assert len(bot.edits) == 1
+    
+    asyncio.run(scenario())
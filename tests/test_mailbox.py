@@ -0,0 +1,88 @@
+import asyncio
+
+from bot import ChatCommandMailbox
+
+
+class Jobs:
+    """Komendy testowe: zapisują start i czekają na zwolnienie"""
+    
+    def __init__(self):
+        self.started = []
+        self.running = 0
+        self.peak = 0
+        self.release = asyncio.Event()
+    
+    def job(self, name: str):
+        async def run():
+            self.started.append(name)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            try:
+                await self.release.wait()
+            finally:
+                self.running -= 1
+            return name
+        return run
+
+
+def test_submit_returns_before_command_runs():
+    async def scenario():
+        mailbox = ChatCommandMailbox(supersede=[], limit=4, total_limit=100, concurrency=8)
+        jobs = Jobs()
+        futures = [mailbox.submit(1, "ai", [str(i)], jobs.job(f"a{i}")) for i in range(3)]
+        assert all(not future.done() for future in futures)
+        
+        await asyncio.sleep(0.01)
+        assert jobs.started == ["a0"]
+        jobs.release.set()
+        assert await asyncio.gather(*futures) == ["a0", "a1", "a2"]
+    
+    asyncio.run(scenario())
+
+
+def test_busy_chats_do_not_block_other_chats():
+    async def scenario():
+        mailbox = ChatCommandMailbox(supersede=[], limit=4, total_limit=100, concurrency=8)
+        jobs = Jobs()
+        for chat in (1, 2):
+            for i in range(4):
+                mailbox.submit(chat, "ai", [str(i)], jobs.job(f"{chat}-{i}"))
+        mailbox.submit(3, "help", [], jobs.job("3-help"))
+        
+        await asyncio.sleep(0.01)
+        assert sorted(jobs.started) == ["1-0", "2-0", "3-help"]
+        await mailbox.close()
+    
+    asyncio.run(scenario())
+
+
+def test_total_limit_and_concurrency_across_chats():
+    async def scenario():
+        mailbox = ChatCommandMailbox(supersede=[], limit=4, total_limit=5, concurrency=2)
+        jobs = Jobs()
+        futures = [mailbox.submit(chat, "help", [], jobs.job(str(chat))) for chat in range(8)]
+        
+        assert futures[5:] == [None, None, None]
+        assert mailbox.get_stats()["rejected"] == 3
+        
+        await asyncio.sleep(0.01)
+        assert jobs.running == 2
+        jobs.release.set()
+        await asyncio.gather(*futures[:5])
+        assert jobs.peak == 2
+        assert mailbox.get_stats()["pending"] == 0
+    
+    asyncio.run(scenario())
+
+
+def test_close_resolves_waiting_futures():
+    async def scenario():
+        mailbox = ChatCommandMailbox(supersede=[], limit=4, total_limit=100, concurrency=8)
+        jobs = Jobs()
+        futures = [mailbox.submit(1, "ai", [str(i)], jobs.job(str(i))) for i in range(3)]
+        await asyncio.sleep(0.01)
+        
+        await mailbox.close()
+        assert await asyncio.wait_for(asyncio.gather(*futures), timeout=1) == [None, None, None]
+    
+    asyncio.run(scenario())
@@ -0,0 +1,30 @@
+import asyncio
+
+import bot
+
+
+def test_label_values_are_escaped():
+    registry = bot.MetricsRegistry(prefix="test")
+    histogram = registry.histogram("seconds", "Czas", ("command",))
+    histogram.observe(0.1, 'a"b\\c\nd')
+    
+    text = registry.render({"cache": {'x"y': {"hits": 1}}})
+    assert 'command="a\\"b\\\\c\\nd"' in text
+    assert 'key="x\\"y"' in text
+    assert all(line.count("\n") == 0 for line in text.splitlines())
+
+
+def test_unknown_commands_share_one_label(monkeypatch):
+    async def handle_command(chat_id, command, args):
+        pass
+    
+    monkeypatch.setattr(bot.bot, "handle_command", handle_command)
+    for command in ("weather", "pogoda", "xyz1", "xyz2"):
+        kind = bot.bot.command_kind(command)
+        asyncio.run(bot.run_command(1, kind, command, []))
+    
+    labels = {values[0] for values in bot.COMMAND_SECONDS._series}
+    assert "weather" in labels
+    assert "unknown" in labels
+    assert not labels & {"xyz1", "xyz2"}
+    assert set(bot.bot.COMMAND_ALIASES.values()) <= bot.bot.COMMAND_KINDS
@@ -0,0 +1,49 @@
+import asyncio
+import time
+from datetime import datetime
+
+import bot
+
+
+def test_n2yo_stale_markers_reach_collect_all_data(monkeypatch):
+    collector = bot.bot.data_collector
+    collector.cache.clear()
+    monkeypatch.setattr(bot, "N2YO_API_KEY", "k")
+    monkeypatch.setattr(collector.pass_predictor, "tles_ready", lambda: False)
+    
+    location = {"name": "Test", "lat": 50.0, "lon": 20.0}
+    lat, lon = round(50.0, bot.N2YO_LOCATION_PRECISION), round(20.0, bot.N2YO_LOCATION_PRECISION)
+    landsat_key = f"n2yo_39084_{lat}_{lon}"
+    
+    # Landsat 8: dane sprzed okna stale, odświeżenie kończy się błędem -> ostatnie dobre dane
+    expired = time.time() - collector.get_ttl("satellite_passes") * (1 + collector.STALE_FACTOR) - 60
+    old_pass = {"satellite": "Landsat 8", "start_utc": datetime(2030, 1, 1), "max_elevation": 40, "duration": 300}
+    collector.cache.set(landsat_key, {"passes": [old_pass]}, stored_at=expired)
+    
+    async def fake_fetch(sat, lat, lon):
+        if sat["name"] == "Landsat 8":
+            collector._fetch_errors.set(landsat_key, "HTTP 503")
+            return None
+        if sat["name"] == "Sentinel-2A":
+            await asyncio.sleep(5)
+        return {"passes": []}
+    
+    monkeypatch.setattr(collector, "_fetch_n2yo_passes", fake_fetch)
+    
+    async def scenario():
+        try:
+            return await collector.collect_all_data(location, {"satellite_passes"}, deadline=0.3)
+        finally:
+            for task in list(collector._inflight.values()):
+                task.cancel()
+    
+    all_data = asyncio.run(scenario())
+    
+    assert all_data["satellite_passes"] == [old_pass]
+    marker = all_data["stale_data"]["satellite_passes"]
+    assert marker["stored_at"] is None  # Sentinel-2A bez żadnych danych
+    assert "Landsat 8: HTTP 503" in marker["reason"]
+    assert "Sentinel-2A: przekroczony budżet czasu" in marker["reason"]
+    
+    errors = {error["satellite"]: error["error"] for error in all_data["satellite_errors"]}
+    assert errors == {"Sentinel-2A": "przekroczony budżet czasu"}
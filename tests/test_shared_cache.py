@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+
+import bot
+
+
+def test_sqlite_locks_across_instances(tmp_path):
+    path = str(tmp_path / "shared.db")
+    
+    async def scenario():
+        first, second = bot.SQLiteSharedCache(path), bot.SQLiteSharedCache(path)
+        try:
+            # Wyłączność: drugi właściciel nie dostaje zajętej blokady
+            assert await first.acquire_lock("k", "a", 30)
+            assert not await second.acquire_lock("k", "b", 30)
+            
+            # Zwolnić może tylko właściciel
+            await second.release_lock("k", "b")
+            assert not await second.acquire_lock("k", "b", 30)
+            await first.release_lock("k", "a")
+            assert await second.acquire_lock("k", "b", 30)
+            
+            # Właściciel zniknął bez zwolnienia - po TTL blokadę przejmuje inny
+            assert await first.acquire_lock("t", "a", 0.1)
+            assert not await second.acquire_lock("t", "b", 30)
+            await asyncio.sleep(0.15)
+            assert await second.acquire_lock("t", "b", 30)
+        finally:
+            await first.close()
+            await second.close()
+    
+    asyncio.run(scenario())
+
+
+def test_two_collectors_share_one_upstream_call(tmp_path, monkeypatch):
+    path = str(tmp_path / "shared.db")
+    monkeypatch.setattr(bot, "SHARED_CACHE_POLL_INTERVAL", 0.01)
+    calls = []
+    
+    async def fake_fetch():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return {"earthquakes": [{"place": "P", "magnitude": 5.1, "time": datetime(2026, 10, 17, 7),
+                                 "lat": 0, "lon": 0, "depth": 10}]}
+    
+    async def scenario():
+        collectors = [bot.UniversalDataCollector(shared_cache=bot.SQLiteSharedCache(path)) for _ in range(2)]
+        for collector in collectors:
+            collector._fetch_earthquakes = fake_fetch
+        try:
+            results = await asyncio.gather(*(
+                collector.get_earthquake_data() for collector in collectors for _ in range(5)
+            ))
+            return results, [collector.get_cache_stats() for collector in collectors]
+        finally:
+            for collector in collectors:
+                await collector.close()
+                await collector.http.close()
+    
+    results, stats = asyncio.run(scenario())
+    
+    assert len(calls) == 1
+    assert all(result["earthquakes"][0]["time"] == datetime(2026, 10, 17, 7) for result in results)
+    assert sum(s["l2_hits"] for s in stats) == 1
+    assert sum(s["lock_waits"] for s in stats) == 1
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import bot
+
+ISS_TLE = """ISS (ZARYA)
+1 25544U 98067A   24001.50000000  .00016717  00000-0  10270-3 0  9005
+2 25544  51.6416 247.4627 0006703 130.5360 325.0288 15.50377579431234
+"""
+
+pytestmark = pytest.mark.skipif(not bot.SKYFIELD_AVAILABLE, reason="wymaga skyfield")
+
+
+def test_stale_tles_served_while_refresh_runs_in_background(tmp_path):
+    tle_file = tmp_path / "tle.txt"
+    tle_file.write_text(ISS_TLE)
+    old = time.time() - 10 * 24 * 3600
+    os.utime(tle_file, (old, old))
+    
+    async def scenario():
+        predictor = bot.PassPredictor([{"norad_id": 25544, "name": "ISS"}], http=None, tle_file=str(tle_file))
+        downloads = []
+        
+        async def slow_download():
+            downloads.append(time.monotonic())
+            await asyncio.sleep(15)
+            return False
+        
+        predictor._download_tles = slow_download
+        
+        started = time.monotonic()
+        assert predictor.tles_ready()
+        assert predictor.tles_ready()
+        assert time.monotonic() - started < 1
+        assert predictor.stale
+        
+        await asyncio.sleep(0.01)
+        assert len(downloads) == 1
+        predictor._refresh_task.cancel()
+        await asyncio.gather(predictor._refresh_task, return_exceptions=True)
+    
+    asyncio.run(scenario())
+
+
+def test_fresh_tles_do_not_schedule_refresh(tmp_path):
+    tle_file = tmp_path / "tle.txt"
+    tle_file.write_text(ISS_TLE)
+    
+    async def scenario():
+        predictor = bot.PassPredictor([{"norad_id": 25544, "name": "ISS"}], http=None, tle_file=str(tle_file))
+        assert predictor.tles_ready()
+        assert predictor._refresh_task is None
+    
+    asyncio.run(scenario())
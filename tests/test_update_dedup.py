@@ -0,0 +1,63 @@
+import asyncio
+
+import bot
+
+
+def test_shared_store_runs_repeated_update_once(tmp_path):
+    path = str(tmp_path / "shared.db")
+    
+    async def scenario():
+        stores = [bot.SQLiteSharedCache(path) for _ in range(2)]
+        workers = [bot.UpdateDeduplicator(store) for store in stores]
+        try:
+            claims = await asyncio.gather(*(worker.claim(42) for worker in workers))
+            repeats = [await worker.claim(42) for worker in workers]
+            return claims, repeats, [worker.get_stats() for worker in workers]
+        finally:
+            for store in stores:
+                await store.close()
+    
+    claims, repeats, stats = asyncio.run(scenario())
+    
+    assert sorted(claims) == [False, True]
+    assert repeats == [False, False]
+    assert sum(s["shared_duplicates"] for s in stats) == 1
+
+
+def test_release_after_busy_lets_retry_through(tmp_path, monkeypatch):
+    path = str(tmp_path / "shared.db")
+    queue_full = {"value": True}
+    processed = []
+    
+    async def fake_enqueue(job):
+        if queue_full["value"]:
+            return False
+        processed.append(job)
+        return True
+    
+    monkeypatch.setattr(bot.dispatcher, "enqueue", fake_enqueue)
+    
+    async def scenario():
+        stores = [bot.SQLiteSharedCache(path) for _ in range(2)]
+        first, second = (bot.UpdateDeduplicator(store) for store in stores)
+        try:
+            # Pełna kolejka w pierwszym workerze -> 429, update_id zwolniony
+            monkeypatch.setattr(bot, "update_dedup", first)
+            busy = await bot.dispatch_update(7, 1, "/help")
+            
+            # Telegram ponawia - tym razem do drugiego workera z wolną kolejką
+            queue_full["value"] = False
+            monkeypatch.setattr(bot, "update_dedup", second)
+            retried = await bot.dispatch_update(7, 1, "/help")
+            duplicate = await bot.dispatch_update(7, 1, "/help")
+            
+            # Ponowienie do pierwszego workera też jest już duplikatem (blokada w L2)
+            monkeypatch.setattr(bot, "update_dedup", first)
+            duplicate_elsewhere = await bot.dispatch_update(7, 1, "/help")
+            return busy, retried, duplicate, duplicate_elsewhere
+        finally:
+            for store in stores:
+                await store.close()
+    
+    assert asyncio.run(scenario()) == ("busy", "queued", "duplicate", "duplicate")
+    assert len(processed) == 1